@@ -49,10 +49,20 @@
 # ******************************************************************
 
 import serial
-from time import sleep, time
-from struct import pack, unpack
+from contextlib import nullcontext
+from time import sleep, time, perf_counter, monotonic
+from struct import pack, unpack, unpack_from
 from platform import system
 import json
+import os
+import sys
+import argparse
+import shlex
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the image codec
+    np = None
 
 
 def to_hex (packet):
@@ -64,6 +74,508 @@ def to_hex (packet):
   return s.strip ()
 
 
+def _collect(stream):
+    """
+    Run a packet stream (see R503.up_image_stream) to its end.
+    returns: (tuple) confirmation code, list of the received packets as bytes
+    """
+    packets = []
+    while True:
+        try:
+            packets.append(bytes(next(stream)))
+        except StopIteration as stop:
+            return stop.value, packets
+
+
+def _fill(stream):
+    """
+    Run a packet stream that receives into a buffer to its end.
+    returns: (tuple) confirmation code, number of bytes received
+    """
+    n = 0
+    while True:
+        try:
+            n += len(next(stream))
+        except StopIteration as stop:
+            return stop.value, n
+
+
+AUTO_FINAL_STEP = {0x31: 0x06, 0x32: 0x05}  # auto_enroll, auto_identify => step reported by the final reply
+
+
+def step_reply(send_values, frame):
+    """
+    auto_enroll (ret_status=1) and auto_identify (ret_key_step=1) report each step with an acknowledge of its
+    own (confirmation code 0, step in the first parameter byte) before the final reply.
+    parameters: send_values (bytes) - the complete command packet
+                frame (bytes) - a received packet
+    returns: (bool) True if 'frame' is such a step report, i.e. more replies of the command follow
+    """
+    final = AUTO_FINAL_STEP.get(send_values[9])
+    return (final is not None and send_values[13] != 0 and len(frame) > 12 and frame[6] == 0x07
+            and frame[9] == 0 and frame[10] != final)
+
+
+_conf_code_table = None
+
+
+def conf_code_table():
+    """
+    Confirmation code => description, loaded from 'confirmation_codes.json' on first use and kept in memory.
+    The file is looked up next to this module first, then in the current working directory.
+    returns: (dict) int => str
+    """
+    global _conf_code_table
+    if _conf_code_table is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'confirmation_codes.json')
+        with open(path if os.path.exists(path) else 'confirmation_codes.json', 'r') as jf:
+            _conf_code_table = {int(k): v for k, v in json.load(jf).items()}
+    return _conf_code_table
+
+
+class R503Error(Exception):
+    """
+    Base class of all errors, 'code' is the confirmation code
+    """
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+    def __str__(self):
+        return conf_code_table().get(self.code, 'others: system reserved')
+
+
+class NoResponseError(R503Error):
+    """
+    No (complete) response received from the module within the timeout, code 99
+    """
+
+
+class ChecksumError(R503Error):
+    """
+    Response received with a wrong checksum, code 100
+    """
+
+
+class ArgumentError(R503Error):
+    """
+    Invalid argument detected on the host side, codes 101 and 102
+    """
+
+
+class ModuleError(R503Error):
+    """
+    Error reported by the module in the confirmation code of its response
+    """
+
+
+def error_for(code):
+    """
+    returns: (R503Error) the exception matching a non-zero confirmation code
+    """
+    return {99: NoResponseError, 100: ChecksumError, 101: ArgumentError, 102: ArgumentError}.get(code, ModuleError)(code)
+
+
+class Response:
+    """
+    Response packet of the module.
+    Only the confirmation code is decoded on arrival, everything else is decoded from the raw packet on access.
+    For compatibility, the fields can also be indexed like the tuple returned by R503.read_msg():
+    header, address, package id, package len, confirmation code, package, checksum
+    """
+    __slots__ = ('frame', 'conf_code')
+    _fields = ('header', 'address', 'pid', 'pkg_len', 'conf_code', 'payload', 'checksum')
+
+    def __init__(self, frame, conf_code=None):
+        self.frame = frame
+        self.conf_code = frame[9] if conf_code is None else conf_code
+
+    header = property(lambda self: unpack_from('>H', self.frame)[0] if self.frame else 0)
+    address = property(lambda self: unpack_from('>I', self.frame, 2)[0] if self.frame else 0)
+    pid = property(lambda self: self.frame[6] if self.frame else 0)
+    pkg_len = property(lambda self: unpack_from('>H', self.frame, 7)[0] if self.frame else 0)
+    checksum = property(lambda self: unpack_from('>H', self.frame, len(self.frame) - 2)[0] if self.frame else 0)
+
+    @property
+    def payload(self):
+        """
+        (bytes) package data after the confirmation code, None if there is none
+        """
+        return self.frame[10:-2] or None
+
+    def unpack(self, fmt):
+        """
+        Decode the payload in place with a struct format, without copying it
+        """
+        return unpack_from(fmt, self.frame, 10)
+
+    def check(self):
+        """
+        Raise the matching R503Error if the confirmation code is not 0
+        returns: self
+        """
+        if self.conf_code:
+            raise error_for(self.conf_code)
+        return self
+
+    def __getitem__(self, i):
+        return getattr(self, self._fields[i])
+
+    def __len__(self):
+        return 7
+
+    def __repr__(self):
+        return f'Response(conf_code={self.conf_code}, payload={self.payload!r})'
+
+
+NO_RESPONSE = Response(b'', 99)
+CHECKSUM_ERROR = Response(b'', 100)
+
+
+class IdentifyResult:
+    """
+    Result of R503.identify().
+    conf_code: confirmation code of the last stage run (0: match, 9: no match, others: failing stage)
+    stage: name of the last stage run ('capture', 'prescreen', 'img2tz', 'search' or 'auto_identify')
+    mode: 'manual' (get_image_ex, img2tz, search) or 'sensor' (auto_identify)
+    page_id, score: matching template, 0 if there is no match
+    timings: (dict) stage => seconds
+    """
+    __slots__ = ('conf_code', 'stage', 'mode', 'page_id', 'score', 'timings')
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.conf_code, self.stage, self.page_id, self.score = 99, None, 0, 0
+        self.timings = {}
+
+    @property
+    def matched(self):
+        return self.conf_code == 0
+
+    @property
+    def total(self):
+        """
+        (float) seconds spent in all stages
+        """
+        return sum(self.timings.values())
+
+    def __repr__(self):
+        return (f'IdentifyResult(conf_code={self.conf_code}, stage={self.stage!r}, mode={self.mode!r}, '
+                f'page_id={self.page_id}, score={self.score}, total={self.total:.3f})')
+
+
+def _bit_positions(bits):
+    """
+    returns: (list) positions of the set bits of an int, lowest first
+    """
+    positions = []
+    while bits:
+        low = bits & -bits
+        positions.append(low.bit_length() - 1)
+        bits ^= low
+    return positions
+
+
+def to_json(value):
+    """
+    Convert a command result into JSON serializable values: bytes become {'$bytes': '<hex>'}, tuples become lists
+    and slotted result objects (Response, IdentifyResult) become dicts
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'$bytes': bytes(value).hex()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): to_json(v) for k, v in value.items()}
+    if hasattr(value, '__slots__'):
+        return {name: to_json(getattr(value, name)) for name in value.__slots__}
+    return value
+
+
+def from_json(value):
+    """
+    Inverse of to_json() for bytes, lists stay lists
+    """
+    if isinstance(value, dict):
+        return bytes.fromhex(value['$bytes']) if '$bytes' in value else {k: from_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [from_json(v) for v in value]
+    return value
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('numpy is required for the image codec: pip install numpy')
+
+
+def unpack_image(img_data, width=192, height=192):
+    """
+    Convert an uploaded image into a pixel array.
+    The sensor sends two pixels per byte, the upper nibble first, only the upper 4 bits of each 8 bit gray
+    value are transferred.
+    parameters: img_data - bytes-like object or list of packet data as returned by up_image()
+                width, height (int) - sensor image geometry, see R503.image_size()
+    returns: (ndarray) uint8 array of shape (height, width)
+    """
+    return unpack_images([img_data], width, height)[0]
+
+
+def unpack_images(images, width=192, height=192):
+    """
+    Convert a batch of uploaded images into pixel arrays, see unpack_image().
+    parameters: images - list of images (bytes-like objects or lists of packet data),
+                         or a uint8 array with one packed image per row
+                width, height (int) - sensor image geometry
+    returns: (ndarray) uint8 array of shape (n, height, width)
+    """
+    _require_numpy()
+    if isinstance(images, np.ndarray):
+        packed = images.reshape(-1, width * height // 2)
+    else:
+        raw = b''.join(b''.join(img) if isinstance(img, list) else bytes(img) for img in images)
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(len(images), width * height // 2)
+    pixels = np.empty((packed.shape[0], width * height), dtype=np.uint8)
+    pixels[:, 0::2] = packed & 0xF0
+    pixels[:, 1::2] = packed << 4
+    return pixels.reshape(-1, height, width)
+
+
+def pack_image(pixels, pkg_len=128):
+    """
+    Convert a pixel array into data packets for down_image().
+    parameters: pixels (ndarray) - uint8 array of shape (height, width), only the upper 4 bits of each pixel are sent
+                pkg_len (int) - data packet length configured in the module (R503.recv_size)
+    returns: (list) packet data (bytes)
+    """
+    return pack_images([pixels], pkg_len)[0]
+
+
+def pack_images(pixels, pkg_len=128):
+    """
+    Convert a batch of pixel arrays into data packets, see pack_image().
+    parameters: pixels (ndarray) - uint8 array of shape (n, height, width) or a list of (height, width) arrays
+                pkg_len (int) - data packet length configured in the module
+    returns: (list) one list of packet data per image
+    """
+    _require_numpy()
+    flat = np.asarray(pixels, dtype=np.uint8).reshape(len(pixels), -1)
+    packed = (flat[:, 0::2] & 0xF0) | (flat[:, 1::2] >> 4)
+    batch = []
+    for img in packed:
+        raw = img.tobytes()
+        batch.append([raw[i:i + pkg_len] for i in range(0, len(raw), pkg_len)])
+    return batch
+
+
+def image_quality(pixels, block=16, fg_std=12.0):
+    """
+    Quality metrics of fingerprint images (requires numpy), computed for a whole batch at once.
+    The image is divided into block x block tiles, tiles with a gray value standard deviation above fg_std
+    count as finger area (foreground).
+    parameters: pixels (ndarray) - uint8 array of shape (height, width) or (n, height, width), see up_image_array()
+    returns: (dict) arrays (floats for a single image) of
+             'coverage': fraction of foreground tiles,
+             'contrast': mean gray value standard deviation of the foreground tiles,
+             'ridge_energy': fraction of the spectral energy at ridge periods of 4 to 16 pixels,
+             'sharpness': Laplacian energy relative to the gray value variance of the foreground (low when blurred)
+    """
+    _require_numpy()
+    img = np.asarray(pixels, dtype=np.float32)
+    hb, wb = img.shape[-2] // block, img.shape[-1] // block
+    img = img[..., :hb * block, :wb * block]
+    std = img.reshape(img.shape[:-2] + (hb, block, wb, block)).std(axis=(-3, -1))
+    fg = std > fg_std
+    n_fg = fg.sum(axis=(-2, -1))
+    mask = np.repeat(np.repeat(fg, block, axis=-2), block, axis=-1)
+    n_px = np.maximum(mask.sum(axis=(-2, -1), keepdims=True), 1)
+    centered = (img - (img * mask).sum(axis=(-2, -1), keepdims=True) / n_px) * mask
+    power = np.abs(np.fft.rfft2(centered)) ** 2
+    freq = np.hypot(np.fft.fftfreq(img.shape[-2])[:, None], np.fft.rfftfreq(img.shape[-1])[None, :])
+    band = (freq >= 1 / 16) & (freq <= 1 / 4)
+    laplace = (4 * img[..., 1:-1, 1:-1] - img[..., :-2, 1:-1] - img[..., 2:, 1:-1]
+               - img[..., 1:-1, :-2] - img[..., 1:-1, 2:]) * mask[..., 1:-1, 1:-1]
+    variance = (centered ** 2).sum(axis=(-2, -1)) / n_px[..., 0, 0]
+    return {
+        'coverage': n_fg / (hb * wb),
+        'contrast': (std * fg).sum(axis=(-2, -1)) / np.maximum(n_fg, 1),
+        'ridge_energy': (power * band).sum(axis=(-2, -1)) / np.maximum(power.sum(axis=(-2, -1)), 1e-9),
+        'sharpness': (laplace ** 2).sum(axis=(-2, -1)) / n_px[..., 0, 0] / np.maximum(variance, 1e-9),
+    }
+
+
+class Prescreen:
+    """
+    Host-side quality check of an uploaded image, to reject unusable captures before img2tz.
+    The thresholds are minimum values of the metrics of image_quality(), tune them for the sensor and the site.
+    """
+
+    def __init__(self, min_coverage=.4, min_contrast=25.0, min_ridge_energy=.4, min_sharpness=.15):
+        self.thresholds = {'coverage': min_coverage, 'contrast': min_contrast, 'ridge_energy': min_ridge_energy,
+                           'sharpness': min_sharpness}
+
+    def __call__(self, pixels):
+        """
+        returns: (tuple) accepted (bool), name of the first failing metric or None, (dict) metrics
+        """
+        metrics = {k: float(v) for k, v in image_quality(pixels).items()}
+        for name, minimum in self.thresholds.items():
+            if metrics[name] < minimum:
+                return False, name, metrics
+        return True, None, metrics
+
+
+class Metrics:
+    """
+    Command metrics collected through the R503 hooks: latency histogram, bytes written and read,
+    timeouts, checksum failures and confirmation codes, all per instruction code.
+    Register with R503.enable_metrics() or fp.hooks.append(metrics).
+    """
+    buckets = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.commands = {}  # instruction code (None for data packets) => counters
+
+    def __call__(self, instr_code, seconds, bytes_out, bytes_in, conf_code):
+        c = self.commands.get(instr_code)
+        if c is None:
+            c = self.commands[instr_code] = {'count': 0, 'seconds': 0.0, 'buckets': [0] * (len(self.buckets) + 1),
+                                             'bytes_out': 0, 'bytes_in': 0, 'timeouts': 0, 'checksum_errors': 0,
+                                             'conf_codes': {}}
+        c['count'] += 1
+        c['seconds'] += seconds
+        c['buckets'][next((i for i, b in enumerate(self.buckets) if seconds <= b), len(self.buckets))] += 1
+        c['bytes_out'] += bytes_out
+        c['bytes_in'] += bytes_in
+        if conf_code is not None:
+            c['timeouts'] += conf_code == 99
+            c['checksum_errors'] += conf_code == 100
+            c['conf_codes'][conf_code] = c['conf_codes'].get(conf_code, 0) + 1
+
+    @staticmethod
+    def _label(instr_code):
+        return 'data' if instr_code is None else f'0x{instr_code:02x}'
+
+    def snapshot(self):
+        """
+        returns: (dict) JSON serializable copy of all counters, keyed by instruction code ('0x04', ..., 'data')
+        """
+        return {self._label(k): dict(v, buckets=dict(zip([str(b) for b in self.buckets] + ['+Inf'], v['buckets'])),
+                                     conf_codes={str(cc): n for cc, n in v['conf_codes'].items()})
+                for k, v in self.commands.items()}
+
+    def to_prometheus(self, prefix='r503'):
+        """
+        returns: (str) all counters in the Prometheus text exposition format
+        """
+        lines = [f'# TYPE {prefix}_command_seconds histogram']
+        for k, v in self.commands.items():
+            label = f'instr="{self._label(k)}"'
+            total = 0
+            for b, n in zip([str(b) for b in self.buckets] + ['+Inf'], v['buckets']):
+                total += n
+                lines.append(f'{prefix}_command_seconds_bucket{{{label},le="{b}"}} {total}')
+            lines.append(f'{prefix}_command_seconds_sum{{{label}}} {v["seconds"]}')
+            lines.append(f'{prefix}_command_seconds_count{{{label}}} {v["count"]}')
+        for name in ('bytes_out', 'bytes_in', 'timeouts', 'checksum_errors'):
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            lines.extend(f'{prefix}_{name}_total{{instr="{self._label(k)}"}} {v[name]}' for k, v in self.commands.items())
+        lines.append(f'# TYPE {prefix}_conf_codes_total counter')
+        for k, v in self.commands.items():
+            lines.extend(f'{prefix}_conf_codes_total{{instr="{self._label(k)}",code="{cc}"}} {n}'
+                         for cc, n in v['conf_codes'].items())
+        return '\n'.join(lines) + '\n'
+
+
+class SerialWrapper:
+    """
+    Base of wrappers around a serial object (r503_record.RecordingSerial, r503_bench.TimedSerial).
+    Other attributes are passed through; setting 'timeout' or 'baudrate' sets it on the wrapped object and calls
+    _changed().
+    """
+
+    def __init__(self, ser):
+        self.ser = ser
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def __setattr__(self, name, value):
+        if name in ('timeout', 'baudrate') and 'ser' in self.__dict__:
+            setattr(self.ser, name, value)
+            self._changed(name, value)
+        else:
+            super().__setattr__(name, value)
+
+    def _changed(self, name, value):
+        pass
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class ScheduledSerial:
+    """
+    Base of serial stand-ins that receive bytes at scheduled times (r503_sim.SimSerial, r503_record.ReplaySerial).
+    Subclasses implement _fetch(now): append the bytes due by 'now' (time.monotonic) to self.rx and return the
+    time the next bytes are due, None if nothing is scheduled.
+    """
+
+    def __init__(self, timeout=1):
+        self.timeout = timeout
+        self.rx = bytearray()
+        self.is_open = True
+
+    def _fetch(self, now):
+        raise NotImplementedError
+
+    def _timeout_wait(self, timeout):
+        """
+        returns: (float) seconds a read that runs into its timeout waits, like a real port
+        """
+        return timeout
+
+    def read(self, size=1):
+        start = monotonic()
+        deadline = None if self.timeout is None else start + self.timeout
+        while True:
+            next_due = self._fetch(monotonic())
+            if len(self.rx) >= size:
+                break
+            now = monotonic()
+            if next_due is None or (deadline is not None and next_due > deadline):
+                if deadline is not None:
+                    sleep(max(0.0, start + self._timeout_wait(self.timeout) - now))
+                    self._fetch(monotonic())
+                break
+            sleep(max(0.0, next_due - now))
+        data = bytes(self.rx[:size])
+        del self.rx[:size]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        self._fetch(monotonic())
+        return len(self.rx)
+
+    def reset_input_buffer(self):
+        self._fetch(monotonic())
+        self.rx.clear()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
 class R503:
     """
     R503 class for interacting with R503 fingerprint sensor module.
@@ -71,42 +583,79 @@ class R503:
     header = pack('>H', 0xEF01)
     pid_cmd = 0x01  # pid_command packet
 
-    def __init__(self, port, baud=57600, pw=0, addr=0xFFFFFFFF, timeout=1, recv_size=128):
+    def __init__(self, port, baud=57600, pw=0, addr=0xFFFFFFFF, timeout=1, recv_size=128, link_file=None):
         """
         Initialize the R503 class instance.
         Parameters:
-          port (int or str): The COM port number (Windows) or device file name (Linux)
+          port (int, str or serial object): The COM port number (Windows) or device file name (Linux),
+            or an object with the interface of serial.Serial
           baud (int): The baud rate, default 57600
           pw (int): The password, default 0
           addr (int): The module address, default 0xFFFFFFFF
           timeout (int): The serial timeout in seconds, default 1
-          recv_size (int): The receive buffer size, default 128
+          recv_size (int): The data packet length configured in the module, default 128
+          link_file (str): JSON file written by tune_link(), if it has an entry for the port,
+            its baud rate and packet length are used instead of 'baud' and 'recv_size'
         This initializes the R503 instance attributes like pw, addr etc.
         It opens the serial port with the given parameters.
         """
+        link = self.load_link(link_file, self.port_name(port) if isinstance(port, (int, str)) else
+                              getattr(port, 'port', None))
+        if link:
+            baud, recv_size = link['baud'], link['pkg_len']
         self.pw = pack('>I', pw)
         self.addr = pack('>I', addr)
         self.recv_size = recv_size
-        if isinstance (port, int):
-          port_name = f'COM{port}' if system() == 'Windows' else f'/dev/ttyUSB{port}'
+        self.img_size = None  # (width, height), read from the module on first use
+        self.occupancy_bits = None  # cached library bitmap (int, bit n = page n), see occupancy()
+        self.library_capacity = None
+        self.identify_latency = {}  # identify() mode => mean seconds of a complete identification
+        self.step_time = None  # perf_counter() at the last step report of an auto command, see step_reply()
+        self.hooks = []  # called as hook(instr_code, seconds, bytes_out, bytes_in, conf_code) after each command
+        if hasattr(port, 'read') and hasattr(port, 'write'):
+          self.ser = port  # an already opened serial object, e.g. r503_sim.SimSerial
+          self.ser.timeout = timeout
+          if link:
+            self.ser.baudrate = baud
         else:
-          port_name = port
-        self.ser = serial.Serial (port_name, baudrate=baud, timeout=timeout)
+          self.ser = serial.Serial (self.port_name(port), baudrate=baud, timeout=timeout)
+
+    @staticmethod
+    def port_name(port):
+        """
+        Map a port number to the device name: 'COM{port}' on Windows, '/dev/ttyUSB{port}' otherwise.
+        Device names passed as strings are returned unchanged.
+        """
+        if isinstance (port, int):
+          return f'COM{port}' if system() == 'Windows' else f'/dev/ttyUSB{port}'
+        return port
 
     @staticmethod
     def conf_codes():
         """
         Read confirmation codes from the json file.
-        This function opens the 'confirmation_codes.json' file,
-        loads the JSON data from it, and returns the loaded JSON object.
-        Parameters:
-            self: The R503 class instance.
+        The file is only read once, see conf_code_table().
         Returns:
-            jsob: The loaded JSON object containing the confirmation codes.
+            jsob: dict of the confirmation codes as in 'confirmation_codes.json'
+        """
+        return {str(k): v for k, v in conf_code_table().items()}
+
+    def enable_metrics(self, metrics=None):
         """
-        with open('confirmation_codes.json', 'r') as jf:
-            jsob = json.load(jf)
-        return jsob
+        Collect command metrics, see Metrics
+        returns: (Metrics) the registered metrics object
+        """
+        metrics = metrics or Metrics()
+        self.hooks.append(metrics)
+        return metrics
+
+    def _emit(self, instr_code, t0, bytes_out, bytes_in, conf_code):
+        """
+        Pass the figures of one command to all hooks, only called if there are hooks
+        """
+        seconds = perf_counter() - t0
+        for hook in self.hooks:
+            hook(instr_code, seconds, bytes_out, bytes_in, conf_code)
 
     def ser_close(self):
         """
@@ -122,7 +671,7 @@ class R503:
         """
         self.pw = pack('>I', new_pw)
         recv_data = self.ser_send(pid=0x01, pkg_len=0x07, instr_code=0x12, pkg=self.pw)
-        return recv_data[4]
+        return recv_data.conf_code
 
     def set_address(self, new_addr):
         """
@@ -133,7 +682,7 @@ class R503:
         """
         self.addr = pack('>I', new_addr)
         recv_data = self.ser_send(pid=0x01, pkg_len=0x07, instr_code=0x15, pkg=self.addr)
-        return recv_data[4]
+        return recv_data.conf_code
 
     def read_msg(self, data_stream):
         """
@@ -151,7 +700,7 @@ class R503:
         returns: (int) confirmation code
         """
         recv_data = self.ser_send(pid=0x01, pkg_len=3, instr_code=0x30)
-        return recv_data[4]
+        return recv_data.conf_code
 
     def led_control(self, ctrl=0x03, speed=0, color=0x01, cycles=0):
         """
@@ -163,7 +712,7 @@ class R503:
         returns: confirmation code
         """
         cmd = pack('>BBBB', ctrl, speed, color, cycles)
-        return self.ser_send(pkg_len=0x07, instr_code=0x35, pkg=cmd)[4]
+        return self.ser_send(pkg_len=0x07, instr_code=0x35, pkg=cmd).conf_code
 
     def set_baud(self, baud=57600):
         """
@@ -187,7 +736,7 @@ class R503:
         baud0 = int(baud / 9600)
         if baud0 not in [1, 2, 4, 6, 12]:
             return 102
-        conf_code = self.ser_send(pid=0x01, pkg_len=0x05, instr_code=0x0E, pkg=pack('>BB', 4, baud0))[4]
+        conf_code = self.ser_send(pid=0x01, pkg_len=0x05, instr_code=0x0E, pkg=pack('>BB', 4, baud0)).conf_code
         if conf_code:
             return conf_code
         self.ser.baudrate = baud
@@ -217,7 +766,7 @@ class R503:
         """
         if lvl not in [1, 2, 3, 4, 5]:
             return 102
-        return self.ser_send(pid=0x01, pkg_len=0x05, instr_code=0x0E, pkg=pack('>BB', 5, lvl))[4]
+        return self.ser_send(pid=0x01, pkg_len=0x05, instr_code=0x0E, pkg=pack('>BB', 5, lvl)).conf_code
 
     def set_pkg_length(self, pkg_len=128):
         """
@@ -241,19 +790,142 @@ class R503:
         pkg_len0 = {32: 0, 64: 1, 128: 2, 256: 3}.get(pkg_len)
         if pkg_len0 not in [0, 1, 2, 3]:
             return 102
-        conf_code = self.ser_send(pid=0x01, pkg_len=0x05, instr_code=0x0E, pkg=pack('>BB', 6, pkg_len0))[4]
+        conf_code = self.ser_send(pid=0x01, pkg_len=0x05, instr_code=0x0E, pkg=pack('>BB', 6, pkg_len0)).conf_code
         if conf_code: # if not successful
             return conf_code
         self.recv_size = pkg_len
         return conf_code
 
+    @staticmethod
+    def load_link(link_file, port_name):
+        """
+        Read the link settings stored for a port by tune_link()
+        returns: (dict) 'baud', 'pkg_len', or None if there is no entry
+        """
+        if not link_file or not os.path.exists(link_file):
+            return None
+        with open(link_file, 'r') as jf:
+            return json.load(jf).get(str(port_name))
+
+    def save_link(self, link_file):
+        """
+        Store the current baud rate and packet length for the port in a JSON file, see load_link()
+        """
+        links = {}
+        if os.path.exists(link_file):
+            with open(link_file, 'r') as jf:
+                links = json.load(jf)
+        links[str(getattr(self.ser, 'port', None))] = {'baud': self.ser.baudrate, 'pkg_len': self.recv_size}
+        with open(link_file, 'w') as jf:
+            json.dump(links, jf, indent=2)
+
+    def verify_link(self):
+        """
+        Check that the module answers with the current host settings and uses the packet length
+        the host assumes (recv_size)
+        returns: (bool) True if the link is in sync
+        """
+        if self.handshake():
+            return False
+        para = self.read_sys_para()
+        return isinstance(para, tuple) and {0: 32, 1: 64, 2: 128, 3: 256}.get(para[5]) == self.recv_size
+
+    def resync_link(self, bauds=(57600, 115200, 9600, 19200, 38400)):
+        """
+        Find the baud rate the module actually uses and adopt its packet length,
+        e.g. after a set_baud() whose reply was lost
+        returns: (bool) True if the module was found
+        """
+        for baud in (self.ser.baudrate,) + tuple(b for b in bauds if b != self.ser.baudrate):
+            self.ser.baudrate = baud
+            if not self.handshake():
+                para = self.read_sys_para()
+                if isinstance(para, tuple) and para[5] in (0, 1, 2, 3):
+                    self.recv_size = {0: 32, 1: 64, 2: 128, 3: 256}[para[5]]
+                    return True
+        return False
+
+    def _set_link(self, baud, pkg_len):
+        """
+        Switch module and host to a baud rate and packet length and verify the result
+        returns: (bool) True if the link works with the new settings
+        """
+        if self.ser.baudrate != baud:
+            conf_code = self.set_baud(baud)
+            if conf_code in (99, 100):
+                self.resync_link()  # the module may have switched without the reply getting through
+            sleep(.05)
+        if self.ser.baudrate != baud:
+            return False
+        if self.recv_size != pkg_len and self.set_pkg_length(pkg_len):
+            return False
+        return self.verify_link()
+
+    def _link_throughput(self, rounds):
+        """
+        Download a test image and upload it again 'rounds' times
+        returns: (float) upload throughput in bytes/s, None on any transfer error or data mismatch
+        """
+        width, height = self.image_size()
+        pattern = bytes((i * 7 + (i >> 8)) & 0xFF for i in range(width * height // 2))
+        if self.down_image(pattern):
+            return None
+        buffer = bytearray(len(pattern))
+        t0 = perf_counter()
+        for _ in range(rounds):
+            conf_code, n = self.up_image_into(buffer, timeout=1)
+            if conf_code or buffer != pattern:
+                return None
+        return rounds * len(pattern) / (perf_counter() - t0)
+
+    def tune_link(self, bauds=(9600, 19200, 38400, 57600, 115200), pkg_lens=(32, 64, 128, 256), rounds=2,
+                  link_file=None):
+        """
+        Find the fastest error-free baud rate / packet length combination.
+        Every combination is set and verified with handshake() and read_sys_para(), then a test image is
+        downloaded and uploaded 'rounds' times to measure the real throughput. The module is left at the
+        fastest combination without errors; if that cannot be set, or the tuning is aborted by an exception,
+        the initial settings are restored.
+        Note: the test image overwrites the image buffer of the module.
+        parameters: bauds, pkg_lens - candidates
+                    rounds (int) - number of image uploads per combination
+                    link_file (str) - store the result with save_link(), for R503(..., link_file=...)
+        returns: (dict) 'baud', 'pkg_len', 'throughput' of the chosen setting and 'results': list of
+                 (baud, pkg_len, throughput or None), or 99 if the module cannot be reached
+        """
+        if not self.verify_link() and not self.resync_link():
+            return 99
+        initial = (self.ser.baudrate, self.recv_size)
+        results = []
+        best = None
+        try:
+            for baud in bauds:
+                for pkg_len in pkg_lens:
+                    ok = self._set_link(baud, pkg_len)
+                    results.append((baud, pkg_len, self._link_throughput(rounds) if ok else None))
+                    if not ok and not self.verify_link() and not self.resync_link():
+                        return 99
+            measured = [r for r in results if r[2]]
+            if measured:
+                best = max(measured, key=lambda r: r[2])
+                if not self._set_link(best[0], best[1]):
+                    best = None
+        finally:
+            if best is None and not self._set_link(*initial):  # failed, aborted or nothing measured
+                self.resync_link()
+        best = best or (initial[0], initial[1], None)
+        if link_file:
+            self.save_link(link_file)
+        return {'baud': self.ser.baudrate, 'pkg_len': self.recv_size, 'throughput': best[2], 'results': results}
+
     def read_sys_para(self):
         """
         Status register and other basic configuration parameters
         returns: (list) status_reg, sys_id_code, finger_lib_size, security_lvl, device_addr, data_packet_size, baud_rate
+                 or the confirmation code (int) on any error
         """
         read_pkg = self.ser_send(pkg_len=0x03, instr_code=0x0F)
-        return 99 if read_pkg[4] == 99 else unpack('>HHHHIHH', read_pkg[5])
+        return read_pkg.conf_code or read_pkg.unpack('>HHHHIHH')
 
     def read_sys_para_decode(self):
         """
@@ -276,11 +948,16 @@ class R503:
             self: The R503 instance.
 
         Returns:
-            dict: Decoded system parameters if successful, else 99.
+            dict: Decoded system parameters if successful, else the confirmation code.
         """
         rsp = self.read_sys_para()
-        if rsp == 99:
-            return 99
+        return rsp if isinstance(rsp, int) else self.decode_sys_para(rsp)
+
+    @staticmethod
+    def decode_sys_para(rsp):
+        """
+        Decode the tuple returned by read_sys_para(), see read_sys_para_decode()
+        """
         return {
             'system_busy': bool(rsp[0] & 1),
             'matching_finger_found': bool(rsp[0] & 2),
@@ -300,7 +977,7 @@ class R503:
         returns: (int) confirmation code
         """
         recv_data = self.ser_send(pkg_len=0x07, instr_code=0x13, pkg=pack('>I', pw))
-        return recv_data[4]
+        return recv_data.conf_code
 
     def handshake(self):
         """
@@ -308,7 +985,7 @@ class R503:
         returns: (int) confirmation code
         """
         recv_data = self.ser_send(pkg_len=0x03, instr_code=0x40)
-        return recv_data[4]
+        return recv_data.conf_code
 
     def check_sensor(self):
         """
@@ -316,7 +993,7 @@ class R503:
         returns: (int) confirmation code
         """
         recv_data = self.ser_send(pkg_len=0x03, instr_code=0x36)
-        return recv_data[4]
+        return recv_data.conf_code
 
     def confirmation_decode(self, c_code):
         """
@@ -324,9 +1001,7 @@ class R503:
         parameter: (int) c_code - confirmation code
         returns: (str) decoded confirmation code
         """
-        cc = self.conf_codes()
-        c_code = str(c_code)
-        return cc[c_code] if c_code in cc else 'others: system reserved'
+        return conf_code_table().get(int(c_code), 'others: system reserved')
 
     def load_char(self, page_id, buffer_id=1):
         """
@@ -336,30 +1011,76 @@ class R503:
         """
         pkg = pack('>BH', buffer_id, page_id)
         recv_data = self.ser_send(pid=0x01, pkg_len=0x06, instr_code=0x07, pkg=pkg)
-        return recv_data[4]
+        return recv_data.conf_code
 
     def up_image(self, timeout=5, raw=False):
         """
         Upload the image in Img_Buffer to upper computer
         every image contains the data around 20kilo bytes
-        parameter: (int) timeout: timeout could vary if you change the baud rate, for 57600baud 5seconds is sufficient
-        If you use a lower baud rate timeout may have to be increased.
+        parameter: (int) timeout: maximum time to wait for the next packet, the upload itself ends as soon as
+        the end packet has been received
         returns: (bytesarray) if raw == True
                  else (list of lists)
         In raw mode returns the data with all headers (address byte, status bytes etc.)
         raw == False mode only returns the image data [all other header bytes are filtered out]
         """
-        send_values = pack('>BHB', 0x01, 0x03, 0x0A)
-        check_sum = sum(send_values)
-        send_values = self.header + self.addr + send_values + pack('>H', check_sum)
-        self.ser.write(send_values)
-        self.ser.timeout = timeout
-        read_val = self.ser.read(22000)
-        if read_val == b'':
-            return -1
-        if read_val[9]:
-            return read_val[9]
-        return read_val if raw else [img_data[3:-2] for img_data in read_val.split(sep=self.header + self.addr)][2:]
+        if raw:
+            return self._up_raw(pack('>BHB', 0x01, 0x03, 0x0A), timeout)
+        conf_code, img_data = _collect(self.up_image_stream(timeout=timeout))
+        return -1 if conf_code == 99 else conf_code or img_data
+
+    def up_image_stream(self, buffer=None, timeout=5):
+        """
+        Upload the image in Img_Buffer packet by packet (generator).
+        parameters: buffer (bytearray or memoryview) - optional preallocated buffer, the image data is received
+                    directly into it (width * height / 2 bytes, 18432 for the 192x192 R503 sensor)
+                    timeout (int) - maximum time in seconds to wait for the next packet
+        yields: (memoryview or bytes) data of each packet as it arrives, a view into 'buffer' if given
+        returns: (int) confirmation code as the generator return value, 0 after the end packet was received
+        """
+        return self._up_stream(pack('>BHB', 0x01, 0x03, 0x0A), buffer, timeout)
+
+    def up_image_into(self, buffer, timeout=5):
+        """
+        Upload the image in Img_Buffer directly into a preallocated buffer.
+        parameters: buffer (bytearray or memoryview) - the receive buffer, see up_image_stream()
+                    timeout (int) - maximum time in seconds to wait for the next packet
+        returns: (tuple) confirmation code, number of bytes received
+        """
+        return _fill(self.up_image_stream(buffer, timeout))
+
+    def image_size(self):
+        """
+        Sensor image geometry, read from the product information once and cached afterwards
+        returns: (tuple) width, height
+        """
+        if self.img_size is None:
+            info = self.read_prod_info_decode()
+            if isinstance(info, int):
+                return 192, 192
+            self.img_size = info['image width'], info['image height']
+        return self.img_size
+
+    def up_image_array(self, timeout=5):
+        """
+        Upload the image in Img_Buffer as a pixel array (requires numpy).
+        parameter: (int) timeout: maximum time in seconds to wait for the next packet
+        returns: (ndarray) uint8 array of shape (height, width) if successful, else the confirmation code
+        """
+        width, height = self.image_size()
+        buffer = bytearray(width * height // 2)
+        conf_code, n = self.up_image_into(buffer, timeout)
+        if conf_code or n != len(buffer):
+            return conf_code or 15
+        return unpack_image(buffer, width, height)
+
+    def down_image_array(self, pixels):
+        """
+        Download a pixel array to the image buffer (requires numpy).
+        parameter: (ndarray) pixels: uint8 array of shape (height, width)
+        returns: confirmation code
+        """
+        return self.down_image(pack_image(pixels, self.recv_size))
 
     def down_image(self, img_data):
         """
@@ -367,12 +1088,12 @@ class R503:
         parameters: img_data (list of lists) image data as a list of lists
         returns: confirmation code
         """
-        recv_data0 = self.ser_send(pid=0x01, pkg_len=0x03, instr_code=0x0B)
-        if recv_data0[4]:
-            return recv_data0[4]
-        for img_pkt in img_data[:-1]:
-            self.down_packet(img_pkt)
-        self.down_packet(img_data[-1], end=True)
+        with self._transaction():
+            recv_data0 = self.ser_send(pid=0x01, pkg_len=0x03, instr_code=0x0B)
+            if recv_data0.conf_code:
+                return recv_data0.conf_code
+            self._write_data(self.data_frames(img_data))
+        return 0
 
     def down_packet(self, img_pkt, end=False):
         """
@@ -386,33 +1107,163 @@ class R503:
         Returns:
            None
         """
-        pkt_len = len(img_pkt)
-        content = pack(f'>BH{pkt_len}s', 0x08 if end else 0x02, pkt_len+2, img_pkt)
-        checksum = sum(content)
-        send_values = self.header + self.addr + content + pack('>H', checksum)
-        self.ser.write(send_values)
+        self._write_data(self.make_packet(0x08 if end else 0x02, img_pkt))
 
-    def up_char(self, timeout=5, raw=False):
+    def _write_data(self, frames):
+        """
+        Write data packets, reported to the hooks with instruction code None
+        """
+        t0 = perf_counter() if self.hooks else 0
+        self.ser.write(frames)
+        if self.hooks:
+            self._emit(None, t0, len(frames), 0, None)
+
+    def _transaction(self):
+        """
+        Context around a command whose acknowledge is followed by data packets from the host (or by a second
+        command that depends on it). No other command may go to the module in between; R503Session makes this
+        exclusive between threads, on its own an instance is not shared and nothing needs to be done.
+        """
+        return nullcontext()
+
+    def make_packet(self, pid, content):
+        """
+        Build a complete packet (header, address, package id, length, content, checksum)
+        parameters: pid (int) - package id, content (bytes) - instruction code and parameters or data
+        returns: (bytes) the packet
+        """
+        content = pack('>BH', pid, len(content) + 2) + bytes(content)
+        return self.header + self.addr + content + pack('>H', sum(content) & 0xFFFF)
+
+    def data_frames(self, data):
+        """
+        Build all data packets of an image or template download in one go.
+        parameter: data - list of packet data, or one bytes-like object which is split into packets of recv_size
+        returns: (bytes) the data packets, the last one marked as end packet
+        """
+        if not isinstance(data, list):
+            data = [data[i:i + self.recv_size] for i in range(0, len(data), self.recv_size)]
+        return b''.join([self.make_packet(0x02, pkt) for pkt in data[:-1]] + [self.make_packet(0x08, data[-1])])
+
+    def up_char(self, timeout=5, raw=False, buffer_id=1):
         """
         Upload the data in template buffer to the upper computer
-        parameter: (int) timeout: timeout could vary if you change the baud rate, for 57600baud 5seconds is sufficient
-        If you use a lower baud rate timeout may have to be increased.
+        parameter: (int) timeout: maximum time to wait for the next packet, the upload itself ends as soon as
+        the end packet has been received
+                   (int) buffer_id: character buffer id, default 1
         returns: (bytearray) if raw == True
                  else (list of lists)
         In raw mode returns the data with all headers (address byte, status bytes etc.)
         raw == False mode only returns the image data [all other header bytes are filtered out]
         """
-        send_values = pack('>BHBB', 0x01, 0x04, 0x08, 0x01)
-        check_sum = sum(send_values)
-        send_values = self.header + self.addr + send_values + pack('>H', check_sum)
-        self.ser.write(send_values)
+        if raw:
+            return self._up_raw(pack('>BHBB', 0x01, 0x04, 0x08, buffer_id), timeout)
+        conf_code, char_data = _collect(self.up_char_stream(buffer_id=buffer_id, timeout=timeout))
+        return -1 if conf_code == 99 else conf_code or char_data
+
+    def up_char_stream(self, buffer=None, buffer_id=1, timeout=5):
+        """
+        Upload the data in template buffer packet by packet (generator).
+        parameters: buffer (bytearray or memoryview) - optional preallocated buffer, the template is received
+                    directly into it
+                    buffer_id (int) - character buffer id, default 1
+                    timeout (int) - maximum time in seconds to wait for the next packet
+        yields: (memoryview or bytes) data of each packet as it arrives, a view into 'buffer' if given
+        returns: (int) confirmation code as the generator return value, 0 after the end packet was received
+        """
+        return self._up_stream(pack('>BHBB', 0x01, 0x04, 0x08, buffer_id), buffer, timeout)
+
+    def up_char_into(self, buffer, buffer_id=1, timeout=5):
+        """
+        Upload the data in template buffer directly into a preallocated buffer.
+        parameters: buffer (bytearray or memoryview) - the receive buffer
+                    buffer_id (int) - character buffer id, default 1
+                    timeout (int) - maximum time in seconds to wait for the next packet
+        returns: (tuple) confirmation code, number of bytes received
+        """
+        return _fill(self.up_char_stream(buffer, buffer_id, timeout))
+
+    def _up_raw(self, send_values, timeout):
+        """
+        Send an upload command and return the acknowledge and all data packets as one byte string.
+        returns: (bytes) all packets received, -1 if nothing received, or the confirmation code of the acknowledge
+        """
+        t0 = perf_counter() if self.hooks else 0
+        send_values = self.header + self.addr + send_values + pack('>H', sum(send_values))
         self.ser.timeout = timeout
-        read_val = self.ser.read(22000)
-        if read_val == b'':
+        self.ser.reset_input_buffer()
+        self.ser.write(send_values)
+        packets = [self.read_packet()]
+        if packets[0] and not packets[0][9]:
+            while packets[-1] and packets[-1][6] != 0x08:
+                packets.append(self.read_packet())
+        data = b''.join(p for p in packets if p)
+        if self.hooks:
+            conf_code = packets[0][9] if packets[0] else 100 if packets[0] is None else 99
+            self._emit(send_values[9], t0, len(send_values), len(data), conf_code or (0 if packets[-1] else 99))
+        if not packets[0]:
             return -1
-        if read_val[9]:
-            return read_val[9]
-        return read_val if raw else [img_data[3:-2] for img_data in read_val.split(sep=self.header + self.addr)][2:]
+        return packets[0][9] or data
+
+    def _up_stream(self, send_values, buffer, timeout):
+        """
+        Send an upload command and receive the data packets until the end packet (pid 0x08) arrives.
+        See up_image_stream() for parameters, yields and return value.
+        """
+        if not self.hooks:
+            return (yield from self._receive_stream(send_values, buffer, timeout))
+        t0 = perf_counter()
+        received = [0]
+        conf_code = yield from self._receive_stream(send_values, buffer, timeout, received)
+        self._emit(send_values[3], t0, len(send_values) + 8, received[0], conf_code)
+        return conf_code
+
+    def _receive_stream(self, send_values, buffer, timeout, received=None):
+        """
+        Implementation of _up_stream(). Each packet is read by its length field, the payload goes either into
+        'buffer' (via readinto) or into a fresh bytes object. If 'received' is a list, its first element
+        counts the bytes received.
+        """
+        send_values = self.header + self.addr + send_values + pack('>H', sum(send_values))
+        self.ser.timeout = timeout
+        self.ser.reset_input_buffer()
+        self.ser.write(send_values)
+        ack = self.read_packet()
+        if not ack:
+            return 99 if ack == b'' else 100
+        if received is not None:
+            received[0] += len(ack)
+        if ack[9]:
+            return ack[9]
+        view = None if buffer is None else memoryview(buffer).cast('B')
+        pos = 0
+        pid = 0x02
+        while pid != 0x08:
+            head = self.ser.read(9)
+            if len(head) < 9:
+                return 99
+            if not head.startswith(self.header):
+                return 100
+            pid = head[6]
+            data_len = unpack('>H', head[7:9])[0] - 2
+            if view is None:
+                data = self.ser.read(data_len)
+            elif pos + data_len > len(view):
+                return 102
+            else:
+                data = view[pos:pos + data_len]
+                if self.ser.readinto(data) < data_len:
+                    return 99
+            chksum = self.ser.read(2)
+            if len(data) < data_len or len(chksum) < 2:
+                return 99
+            if (sum(head[6:]) + sum(data)) & 0xFFFF != unpack('>H', chksum)[0]:
+                return 100
+            pos += data_len
+            if received is not None:
+                received[0] += data_len + 11
+            yield data
+        return 0
 
     def down_char(self, img_data, buffer_id=1):
         """
@@ -428,23 +1279,83 @@ class R503:
         This function downloads a full fingerprint template in packets
         to the specified buffer on the sensor module.
         """
-        recv_data0 = self.ser_send(pid=0x01, pkg_len=0x04, instr_code=0x09, pkg=pack('>B', buffer_id))
-        if recv_data0[4]:
-            return recv_data0[4]
-        for img_pkt in img_data[:-1]:
-            self.down_packet(img_pkt)
-        self.down_packet(img_data[-1], end=True)
+        with self._transaction():
+            recv_data0 = self.ser_send(pid=0x01, pkg_len=0x04, instr_code=0x09, pkg=pack('>B', buffer_id))
+            if recv_data0.conf_code:
+                return recv_data0.conf_code
+            self._write_data(self.data_frames(img_data))
+        return 0
+
+    def restore_library(self, templates, buffer_id=1, retries=1, timeout=2):
+        """
+        Download and store many templates back to back.
+        All data packets are built up front. For each template the download command is sent, and as soon as
+        it is acknowledged, the data packets and the store command follow in a single write, so there is only
+        one wait per acknowledge and no idle time in between.
+        parameters: templates (dict) - page id => template (bytes or list of packet data),
+                                       e.g. LibraryMirror.templates() or the result of clone_to()
+                    buffer_id (int) - character buffer used for the transfer
+                    retries (int) - number of additional attempts for a failing page
+                    timeout (int) - timeout of each store in seconds
+        returns: (dict) page id => confirmation code, 0 for stored pages;
+                 pass the failed pages again to resume after a partial failure
+        """
+        down_cmd = self.make_packet(0x01, pack('>BB', 0x09, buffer_id))
+        frames = {page_id: self.data_frames(data) for page_id, data in templates.items()}
+        results = {}
+        for page_id, frame in frames.items():
+            store_cmd = self.make_packet(0x01, pack('>BBH', 0x06, buffer_id, page_id))
+            for _ in range(retries + 1):
+                results[page_id] = self._restore_one(down_cmd, frame + store_cmd, timeout)
+                if not results[page_id]:
+                    break
+        return results
+
+    def _restore_one(self, down_cmd, data_and_store, timeout):
+        """
+        Transfer one template: download command, then data packets and store command in one write
+        returns: (int) confirmation code of the failing step, or of the store command
+        """
+        with self._transaction():
+            conf_code = self._exchange(down_cmd, 0x09, 1).conf_code
+            conf_code = conf_code or self._exchange(data_and_store, 0x06, timeout).conf_code
+        self._track(conf_code, unpack_from('>H', data_and_store, len(data_and_store) - 4)[0], 1, True)
+        return conf_code
+
+    def clone_to(self, other, page_ids=None, buffer_id=1):
+        """
+        Copy templates from this module to another module.
+        parameters: other (R503) - the target module
+                    page_ids (iterable) - pages to copy, default all occupied pages of all index table pages
+                    buffer_id (int) - character buffer used for the transfer on both modules
+        returns: (dict) page id => confirmation code (upload errors are reported for the failing pages),
+                 or the confirmation code (int) of the index table page that could not be read
+        """
+        if page_ids is None:
+            page_ids = []
+            for index_page in range(4):
+                table = self.read_index_table(index_page)
+                if not isinstance(table, list):
+                    return table
+                page_ids.extend(256 * index_page + pos for pos in table)
+        templates, results = {}, {}
+        for page_id in page_ids:
+            conf_code = self.load_char(page_id, buffer_id)
+            char_data = conf_code or self.up_char(buffer_id=buffer_id)
+            if isinstance(char_data, int):
+                results[page_id] = char_data
+            else:
+                templates[page_id] = char_data
+        results.update(other.restore_library(templates, buffer_id))
+        return results
 
     def read_info_page(self):
         """
         Read the information page
         returns: (int) confirmation code or (bytearray) info page contents
         """
-        send_values = pack('>BHB', 0x01, 0x03, 0x16)
-        send_values = self.header + self.addr + send_values + pack('>H', sum(send_values))
-        self.ser.write(send_values)
-        read_val = self.ser.read(580)
-        return 99 if read_val == b'' else read_val[9] or read_val[21:-2]
+        conf_code, data = _collect(self._up_stream(pack('>BHB', 0x01, 0x03, 0x16), None, 1))
+        return conf_code or b''.join(data)
 
     def get_img(self):
         """
@@ -452,7 +1363,7 @@ class R503:
         returns: (int) confirmation code
         """
         read_conf_code = self.ser_send(pkg_len=0x03, instr_code=0x01)
-        return read_conf_code[4]
+        return read_conf_code.conf_code
 
     def get_image_ex(self):
         """
@@ -460,7 +1371,7 @@ class R503:
         returns: (int) confirmation code
         """
         read_conf_code = self.ser_send(pkg_len=0x03, instr_code=0x28)
-        return read_conf_code[4]
+        return read_conf_code.conf_code
 
     def img2tz(self, buffer_id):
         """
@@ -469,7 +1380,7 @@ class R503:
         returns: (int) confirmation code
         """
         read_conf_code = self.ser_send(pkg_len=0x04, instr_code=0x02, pkg=pack('>B', buffer_id))
-        return read_conf_code[4]
+        return read_conf_code.conf_code
 
     def reg_model(self):
         """
@@ -479,7 +1390,7 @@ class R503:
         returns: (int) confirmation code
         """
         read_conf_code = self.ser_send(pkg_len=0x03, instr_code=0x05)
-        return read_conf_code[4]
+        return read_conf_code.conf_code
 
     def store(self, buffer_id, page_id, timeout=2):
         """
@@ -502,9 +1413,10 @@ class R503:
         """
         package = pack('>BH', buffer_id, page_id)
         read_conf_code = self.ser_send(pkg_len=0x06, instr_code=0x06, pkg=package, timeout=timeout)
-        return read_conf_code[4]
+        self._track(read_conf_code.conf_code, page_id, 1, True)
+        return read_conf_code.conf_code
 
-    def manual_enroll(self, location, buffer_id=1, timeout=10, num_of_fps=4, loop_delay=.3):
+    def manual_enroll(self, location, buffer_id=1, timeout=10, num_of_fps=4, loop_delay=.3, prescreen=None):
         """
         Manually enroll a new fingerprint.
 
@@ -514,6 +1426,7 @@ class R503:
             timeout: The timeout in seconds. Default 10.
             num_of_fps: The number of fingerprints to capture. Default 4.
             loop_delay: The delay between capture attempts in seconds. Default 0.3.
+            prescreen: Optional Prescreen, checks the quality of each capture before img2tz (requires numpy).
 
         This function will:
             - Prompt the user to place their finger on the sensor and capture fingerprints.
@@ -521,38 +1434,25 @@ class R503:
             - Register a fingerprint model once num_of_fps prints are captured.
             - Store the fingerprint model in the specified memory location.
             - Timeout after timeout seconds if fingerprints are not captured.
-        """
-        inc = 1
-        printed = False
-        t1 = time()
-        finger_prints = 0
-        while True:
-            if not printed:
-                print(f'Place your finger on the sensor: {inc}')
-                printed = True
-            if not self.get_image_ex():
-                print('Reading the finger print')
-                if not self.img2tz(buffer_id=inc):
-                    print('Character file generation successful.')
-                    finger_prints += 1
-                else:
-                    print('Character file generation failed !')
-                    inc -= 1
-                if finger_prints >= num_of_fps:
-                    print('registering the finger print')
-                    if not self.reg_model():
-                        if not self.store(buffer_id=buffer_id, page_id=location):
-                            print('finger print registered successfully.')
-                        else:
-                            print('finger print register failed !')
-                        break
-                inc += 1
-                t1 = time()
-                printed = False
-            sleep(loop_delay)
-            if time() - t1 > timeout:
-                print('Timeout')
-                break
+
+        The work is done by an Enrollment state machine, use that class directly to enroll without
+        blocking or on several sensors at once.
+        Returns: (int) confirmation code, 0 if the fingerprint was stored, 38 (26h) on timeout
+        """
+        messages = {
+            'wait': lambda e, n: print(f'Place your finger on the sensor: {n}'),
+            'capture': lambda e, n: print('Reading the finger print'),
+            'img2tz': lambda e, n: print('Character file generation successful.'),
+            'img2tz_failed': lambda e, n: print('Character file generation failed !'),
+            'prescreen_failed': lambda e, n: print(f'Poor image quality ({e.quality[1]}), place the finger again'),
+            'reg_model': lambda e, n: print('registering the finger print'),
+            'done': lambda e, n: print('finger print registered successfully.'),
+            'failed': lambda e, n: print('Timeout' if e.reason == 'timeout' else 'finger print register failed !'),
+        }
+        enrollment = Enrollment(self, location, buffer_id, timeout, num_of_fps, poll_max=loop_delay,
+                                prescreen=prescreen,
+                                on_event=lambda e, event: messages.get(event, lambda *a: None)(e, e.captures + 1))
+        return enrollment.run()
 
     def delete_char(self, page_num, num_of_temps_to_del=1):
         """
@@ -572,7 +1472,8 @@ class R503:
         """
         package = pack('>HH', page_num, num_of_temps_to_del)
         recv_code = self.ser_send(pid=0x01, pkg_len=0x07, instr_code=0x0C, pkg=package)
-        return recv_code[4]
+        self._track(recv_code.conf_code, page_num, num_of_temps_to_del, False)
+        return recv_code.conf_code
 
     def match(self):
         """
@@ -580,22 +1481,55 @@ class R503:
         returns: (tuple) status: [0: matching, 1: error, 8: not matching], match score
         """
         rec_data = self.ser_send(pid=0x01, pkg_len=0x03, instr_code=0x03)
-        return rec_data[4], rec_data[5]
+        return rec_data.conf_code, rec_data.payload
+
+    def match_stream(self, candidates, timeout=1):
+        """
+        Match the character file in CharBuffer 1 against a stream of host-side templates.
+        Each template is downloaded into CharBuffer 2 and compared with match(). The data packets and the match
+        command follow the acknowledge of the download command in a single write, so each candidate costs two
+        round trips and no idle time.
+        parameters: candidates (iterable) - (key, frames) pairs, frames are the prebuilt data packets of
+                                            the template (see data_frames())
+                    timeout (float) - timeout of each match command in seconds
+        yields: (tuple) key, confirmation code [0: match, 8: no match, others: error], match score
+        """
+        down_cmd = self.make_packet(0x01, pack('>BB', 0x09, 2))
+        match_cmd = self.make_packet(0x01, b'\x03')
+        for key, frames in candidates:
+            with self._transaction():
+                response = self._exchange(down_cmd, 0x09, 1)
+                if response.conf_code == 0:
+                    response = self._exchange(frames + match_cmd, 0x03, timeout)
+            yield key, response.conf_code, response.unpack('>H')[0] if response.payload else 0
 
     def search(self, buff_num=1, start_id=0, para=200):
         """
         Search the whole finger library for the template that matches the one in CharBuffer 1 or 2
         parameters: buff_num = character buffer id, start_id = starting from, para = end position
+        returns: (tuple) status [success:0, error:1, no match:9], template number, match score
+                 the search is skipped if capturing or generating the character file fails,
+                 status is then the confirmation code of that step
+        """
+        conf_code = self.get_image_ex() or self.img2tz(buff_num)
+        if conf_code:
+            return 99 if conf_code == 99 else (conf_code, 0, 0)
+        return self.search_char(buff_num, start_id, para)
+
+    def search_char(self, buff_num=1, start_id=0, para=200):
+        """
+        Search the finger library for the character file already present in CharBuffer 1 or 2 (no capture)
+        parameters: buff_num = character buffer id, start_id = starting from, para = number of pages to search
         returns: (tuple) status [success:0, error:1, no match:9], template number, match score
         """
-        self.get_image_ex()
-        self.img2tz(1)  # Character file need to be stored in the given charBuffer
         package = pack('>BHH', buff_num, start_id, para)
         recv_data = self.ser_send(pid=0x01, pkg_len=0x08, instr_code=0x04, pkg=package)
-        if recv_data[4] == 99:
+        if recv_data.conf_code == 99:
             return 99
-        temp_num, match_score = unpack('>HH', recv_data[5])
-        return recv_data[4], temp_num, match_score
+        if recv_data.payload is None:
+            return recv_data.conf_code, 0, 0
+        temp_num, match_score = recv_data.unpack('>HH')
+        return recv_data.conf_code, temp_num, match_score
 
     def empty_finger_lib(self):
         """
@@ -609,32 +1543,106 @@ class R503:
             Confirmation code integer.
         """
         read_conf_code = self.ser_send(pkg_len=0x03, instr_code=0x0d)
-        return read_conf_code[4]
+        self.occupancy_bits = 0 if read_conf_code.conf_code == 0 else None
+        return read_conf_code.conf_code
 
     def read_valid_template_num(self):
         """
         Read number of valid templates stored in module.
         Returns:
             num_templates (int): Number of valid templates stored.
+        Raises:
+            R503Error: NoResponseError, ChecksumError or ModuleError if the module does not report the number
         """
-        read_pkg = self.ser_send(pkg_len=0x03, instr_code=0x1d)
-        return unpack('>H', read_pkg[5])[0]
+        return self.ser_send(pkg_len=0x03, instr_code=0x1d).check().unpack('>H')[0]
 
     def read_index_table(self, index_page=0):
         """
         Read the fingerprint template index table
         parameters: (int) index_page = 0/1/2/3
-        returns: (list) index which fingerprints saved already
+        returns: (list) index which fingerprints saved already, or the confirmation code (int) on any error
         """
         index_page = pack('>B', index_page)
         temp = self.ser_send(pkg_len=0x04, instr_code=0x1f, pkg=index_page)
-        if temp[4] == 99:
+        if temp.conf_code:
+            return temp.conf_code
+        if self.occupancy_bits is not None:
+            shift = 256 * index_page[0]
+            self.occupancy_bits = (self.occupancy_bits & ~(((1 << 256) - 1) << shift)
+                                   | int.from_bytes(temp.payload, 'little') << shift)
+        return self.decode_index_table(temp.payload)
+
+    @staticmethod
+    def decode_index_table(table):
+        """
+        Convert the bitmap of an index table page into the list of occupied positions
+        """
+        return _bit_positions(int.from_bytes(table or b'', 'little'))
+
+    def occupancy(self, refresh=False):
+        """
+        Bitmap of the occupied library pages, read from all 4 index table pages on first use and then kept up to
+        date by store, delete_char, empty_finger_lib, auto_enroll and restore_library.
+        A failing command invalidates it, call with refresh=True after the library was changed by other means.
+        returns: (int) bitmap, bit n set if page n is occupied; 99 if an index table page could not be read
+        """
+        if self.occupancy_bits is None or refresh:
+            bits = 0
+            for index_page in range(4):
+                temp = self.ser_send(pkg_len=0x04, instr_code=0x1f, pkg=pack('>B', index_page))
+                if temp.conf_code:
+                    self.occupancy_bits = None
+                    return 99
+                bits |= int.from_bytes(temp.payload, 'little') << (256 * index_page)
+            self.occupancy_bits = bits
+        return self.occupancy_bits
+
+    def _track(self, conf_code, page_id, count, occupied):
+        """
+        Update the cached occupancy bitmap after a command changing the library
+        """
+        if self.occupancy_bits is None:
+            return
+        if conf_code:
+            self.occupancy_bits = None
+            return
+        mask = ((1 << count) - 1) << page_id
+        self.occupancy_bits = self.occupancy_bits | mask if occupied else self.occupancy_bits & ~mask
+
+    def capacity(self):
+        """
+        returns: (int) library size of the module ('fp database size' of the product info, 200 if unknown)
+        """
+        if self.library_capacity is None:
+            info = self.read_prod_info_decode()
+            self.library_capacity = 200 if isinstance(info, int) else info['fp database size']
+        return self.library_capacity
+
+    def used_count(self):
+        """
+        returns: (int) number of occupied library pages from the occupancy bitmap, 99 on error
+        """
+        bits = self.occupancy()
+        return 99 if bits == 99 else bin(bits).count('1')
+
+    def free_ranges(self, min_len=1):
+        """
+        returns: (list) (first page, length) of every run of free pages within the library capacity,
+                 shorter runs than min_len are left out; 99 on error
+        """
+        bits = self.occupancy()
+        if bits == 99:
             return 99
-        temp0 = temp[5]
-        temp_indx = []
-        for n, lv in enumerate(temp0):
-            temp_indx.extend(8 * n + i for i in range(8) if (lv >> i) & 1)
-        return temp_indx
+        free = ~bits & ((1 << self.capacity()) - 1)
+        ranges = []
+        while free:
+            start = (free & -free).bit_length() - 1
+            run = free >> start
+            length = (~run & (run + 1)).bit_length() - 1
+            if length >= min_len:
+                ranges.append((start, length))
+            free &= ~(((1 << length) - 1) << start)
+        return ranges
 
     def auto_enroll(self, location_id, duplicate_id=1, duplicate_fp=1, ret_status=1, finger_leave=1):
         """
@@ -643,27 +1651,102 @@ class R503:
           location_id (int): The location ID to store the template.
           duplicate_id (int): The duplicate check method.
           duplicate_fp (int): Whether to return duplicate finger status.
-          ret_status (int): Return registration status.
+          ret_status (int): Return registration status (the module reports every step, the final reply counts).
           finger_leave (int): Whether finger leaves sensor during registration.
         Returns:
             The confirmation code 0 if success
         """
         package = pack('>BBBBB', location_id, duplicate_id, duplicate_fp, ret_status, finger_leave)
         read_pkg = self.ser_send(pkg_len=0x08, instr_code=0x31, pkg=package)
-        return read_pkg[4]
+        self._track(read_pkg.conf_code, location_id, 1, True)
+        return read_pkg.conf_code
 
     def auto_identify(self, security_lvl=3, start_pos=0, end_pos=199, ret_key_step=0, num_of_fp_errors=1):
         """
         Search and verify a fingerprint
-        return: (tuple) fp store location, match score
+        return: (tuple) fp store location, match score, or the confirmation code (int) on any error
         """
-        package = pack('>BBBBB', security_lvl, start_pos, end_pos, ret_key_step, num_of_fp_errors)
-        read_pkg = self.ser_send(pkg_len=0x08, instr_code=0x32, pkg=package, timeout=10)
-        if read_pkg[4] == 99:
-            return 99
-        _, position, match_score = unpack('>BHH', read_pkg[5])
+        read_pkg = self._auto_identify(security_lvl, start_pos, end_pos, ret_key_step, num_of_fp_errors)
+        if read_pkg.conf_code:
+            return read_pkg.conf_code
+        _, position, match_score = read_pkg.unpack('>BHH')
         return position, match_score
 
+    def _prescreen(self, prescreen):
+        """
+        Upload the image and check it with a Prescreen
+        returns: (Response) confirmation code only: 0 if accepted, 7 if rejected, or the upload error
+        """
+        pixels = self.up_image_array()
+        if isinstance(pixels, int):
+            return Response(b'', pixels)
+        return Response(b'', 0 if prescreen(pixels)[0] else 0x07)
+
+    def _auto_identify(self, security_lvl, start_pos, end_pos, ret_key_step, num_of_fp_errors, timeout=10):
+        package = pack('>BBBBB', security_lvl, start_pos, end_pos, ret_key_step, num_of_fp_errors)
+        return self.ser_send(pkg_len=0x08, instr_code=0x32, pkg=package, timeout=timeout)
+
+    def identify(self, mode='auto', start_id=0, para=200, buffer_id=1, security_lvl=3, timeout=10, prescreen=None):
+        """
+        Capture a finger and search it in the library, stopping at the first stage that fails.
+        parameters: mode (str) - 'manual': get_image_ex, img2tz and search as separate commands (no waiting for
+                                 a finger, returns 2 right away if none is present)
+                                 'sensor': a single auto_identify (0x32), the module waits for the finger;
+                                 its latency is measured from the capture, not including the wait
+                                 'auto': the mode with the lower measured latency, each mode is tried once first
+                                 'sensor' and 'auto' use the manual sequence if the range ends above page 255
+                                 (auto_identify takes single byte page numbers)
+                    start_id, para (int) - first page and number of pages to search
+                    buffer_id (int) - character buffer used by the manual sequence
+                    security_lvl (int) - security level of auto_identify
+                    timeout (float) - response timeout of auto_identify
+                    prescreen (Prescreen) - manual sequence only: upload the capture and check its quality before
+                                            img2tz, a rejected image ends with 7 (07h) in stage 'prescreen';
+                                            'auto' then always uses the manual sequence
+        returns: (IdentifyResult) confirmation code, failing stage, match and per-stage timings
+        raises: ValueError for mode 'sensor' with a prescreen (the module does not hand out the image)
+        """
+        if prescreen is not None and mode == 'sensor':
+            raise ValueError('a prescreen needs the manual sequence, auto_identify keeps the image on the module')
+        if mode != 'manual' and start_id + para > 256:  # auto_identify takes single byte page numbers
+            mode = 'manual'
+        if mode == 'auto':
+            if prescreen is not None:
+                mode = 'manual'
+            else:
+                untried = [m for m in ('manual', 'sensor') if m not in self.identify_latency]
+                mode = untried[0] if untried else min(self.identify_latency, key=self.identify_latency.get)
+        result = IdentifyResult(mode)
+        if mode == 'sensor':
+            stages = (('auto_identify', lambda: self._auto_identify(security_lvl, start_id, start_id + para - 1, 1, 1,
+                                                                    timeout)),)
+        else:
+            stages = (('capture', lambda: self.ser_send(pkg_len=0x03, instr_code=0x28)),
+                      ('prescreen', lambda: self._prescreen(prescreen)),
+                      ('img2tz', lambda: self.ser_send(pkg_len=0x04, instr_code=0x02, pkg=pack('>B', buffer_id))),
+                      ('search', lambda: self.ser_send(pkg_len=0x08, instr_code=0x04,
+                                                       pkg=pack('>BHH', buffer_id, start_id, para))))
+        self.step_time = None
+        for stage, command in stages:
+            if stage == 'prescreen' and prescreen is None:
+                continue
+            t = perf_counter()
+            response = command()
+            result.timings[stage] = perf_counter() - t
+            result.stage, result.conf_code = stage, response.conf_code
+            if response.conf_code:
+                break
+        latency = result.total
+        if mode == 'sensor' and self.step_time is not None:  # from the capture step on, without the finger wait
+            latency = t + result.timings[stage] - self.step_time
+        if result.conf_code == 0:
+            fmt = '>BHH' if mode == 'sensor' else '>HH'
+            result.page_id, result.score = response.unpack(fmt)[-2:]
+        if result.conf_code in (0, 9):  # a complete identification: update the latency estimate
+            last = self.identify_latency.get(mode)
+            self.identify_latency[mode] = latency if last is None else .8 * last + .2 * latency
+        return result
+
     def read_prod_info(self):
         """
         Read product information from the fingerprint sensor.
@@ -685,12 +1768,12 @@ class R503:
             self: The R503 instance
 
         Returns:
-            Tuple of 9 info strings if successful, else 99
+            Tuple of 9 info strings if successful, else the confirmation code
         """
         info = self.ser_send(pkg_len=0x03, instr_code=0x3c)
-        if info[4] == 99:
-            return 99
-        inf = info[5]
+        if info.conf_code:
+            return info.conf_code
+        inf = info.payload
         return inf[:16], inf[16:20], inf[20:28], inf[28:30], inf[30:38], inf[38:40], inf[40:42], inf[42:44], inf[44:46]
 
     def read_prod_info_decode(self):
@@ -698,7 +1781,7 @@ class R503:
         Decode raw product info into a human-readable dictionary.
 
         This calls read_prod_info() to get the raw info bytes.
-        If it returns 99 (error), this returns 99.
+        If it returns a confirmation code (error), this returns the code.
 
         Otherwise, it decodes the raw bytes into a dictionary:
 
@@ -717,11 +1800,16 @@ class R503:
            self: The R503 instance
 
         Returns:
-           dict: Decoded product info if successful, else 99
+           dict: Decoded product info if successful, else the confirmation code
         """
         inf = self.read_prod_info()
-        if inf == 99:
-            return 99
+        return inf if isinstance(inf, int) else self.decode_prod_info(inf)
+
+    @staticmethod
+    def decode_prod_info(inf):
+        """
+        Decode the tuple returned by read_prod_info(), see read_prod_info_decode()
+        """
         return {
             'module type': inf[0].decode('ascii').replace('\x00', ''),
             'batch number': inf[1].decode('ascii'),
@@ -747,7 +1835,7 @@ class R503:
             The firmware version is returned in recv_data[5].
         """
         recv_data = self.ser_send(pid=0x01, pkg_len=3, instr_code=0x3A)
-        return recv_data[4], recv_data[5]
+        return recv_data.conf_code, recv_data.payload
 
     def get_alg_ver(self):
         """
@@ -760,7 +1848,7 @@ class R503:
             The algorithm version is returned as the second tuple value.
         """
         recv_data = self.ser_send(pid=0x01, pkg_len=3, instr_code=0x39)
-        return recv_data[4], recv_data[5]
+        return recv_data.conf_code, recv_data.payload
 
     def soft_reset(self):
         """
@@ -771,24 +1859,99 @@ class R503:
             conf_code (int): The confirmation code received after
                 resetting the module. 0 means success.
         """
-        return self.ser_send(pid=0x01, pkg_len=3, instr_code=0x3D)[4]
+        return self.ser_send(pid=0x01, pkg_len=3, instr_code=0x3D).conf_code
 
     def get_random_code(self):
         """
         Generate a random 32-bit integer from the sensor module.
         Returns:
-            random_num (int): The 32-bit random integer value if success else 99
+            random_num (int): The 32-bit random integer value
+        Raises:
+            R503Error: NoResponseError, ChecksumError or ModuleError if the module does not send one
         """
-        read_pkg = self.ser_send(pkg_len=0x03, pid=0x01, instr_code=0x14)
-        return 99 if read_pkg[4] == 99 else unpack('>I', read_pkg[5])[0]
+        return self.ser_send(pkg_len=0x03, pid=0x01, instr_code=0x14).check().unpack('>I')[0]
 
-    def get_available_location(self, index_page=0):
+    def get_available_location(self, index_page=None, start=0):
         """
-        Provides next available location in fingerprint library
-        parameters: (int) index_page
-        Returns: (int) next available location
+        Provides next available location in fingerprint library, from the cached occupancy bitmap
+        parameters: (int) index_page - only search this index table page (position within the page is returned),
+                                       default the whole library
+                    (int) start - first page to consider
+        Returns: (int) next available location, None if there is none or the index table could not be read
         """
-        return min(set(range(200)).difference(self.read_index_table(index_page)), default=None)
+        bits = self.occupancy()
+        return None if bits == 99 else self.first_free(bits, self.capacity(), index_page, start)
+
+    @staticmethod
+    def first_free(bits, capacity, index_page=None, start=0):
+        """
+        Lowest free page of an occupancy bitmap, see get_available_location()
+        returns: (int) the page, None if there is none
+        """
+        end = capacity
+        offset = 0
+        if index_page is not None:
+            offset = 256 * index_page
+            end = min(end, offset + 256)
+        bits |= (1 << (offset + start)) - 1
+        location = (~bits & (bits + 1)).bit_length() - 1
+        return location - offset if location < end else None
+
+    def delete_many(self, ids):
+        """
+        Delete a list of templates with as few delete_char commands as possible.
+        Pages are grouped into contiguous ranges; pages between two requested ones that are free are included in
+        the range, so a gap of empty pages does not split it. The occupancy bitmap is read again from the module
+        first: a cached one may miss templates stored through another handle, which would then be deleted.
+        parameters: (iterable) ids - page ids to delete
+        returns: (dict) page id => confirmation code of the delete_char command covering it
+        """
+        ids = sorted(set(ids))
+        bits = self.occupancy(refresh=True)
+        bits = 0 if bits == 99 else bits  # unknown occupancy: only merge adjacent pages
+        ranges = []
+        for page_id in ids:
+            if ranges:
+                first, last = ranges[-1]
+                gap = page_id - last - 1
+                if gap == 0 or (bits != 0 and (bits >> (last + 1)) & ((1 << gap) - 1) == 0):
+                    ranges[-1] = first, page_id
+                    continue
+            ranges.append((page_id, page_id))
+        results = {}
+        for first, last in ranges:
+            conf_code = self.delete_char(first, last - first + 1)
+            results.update((page_id, conf_code) for page_id in ids if first <= page_id <= last)
+        return results
+
+    def compact(self, buffer_id=1):
+        """
+        Move templates into a dense prefix of the library, so search() only needs to cover 0 .. used_count() - 1.
+        The index table is read again first, so templates stored through other handles are not overwritten.
+        The highest occupied page is copied into the lowest free page (load_char, store) until no free page is
+        left below an occupied one, the old pages are deleted afterwards with delete_many(). If a copy fails,
+        compaction stops there and the pages copied so far are still deleted, so no template is left twice.
+        returns: (tuple) confirmation code (0 if success, 99 if the index table could not be read, else the code of
+                 the first failed step), (dict) old page id => new page id of the completed moves
+        """
+        bits = self.occupancy(refresh=True)
+        if bits == 99:
+            return 99, {}
+        moves = {}
+        conf_code = 0
+        while True:
+            free = (~bits & (bits + 1)).bit_length() - 1
+            high = bits.bit_length() - 1
+            if high < free:
+                break
+            conf_code = self.load_char(high, buffer_id) or self.store(buffer_id, free)
+            if conf_code:
+                break
+            moves[high] = free
+            bits = bits & ~(1 << high) | (1 << free)
+        deleted = self.delete_many(moves) if moves else {}
+        failed = [code for code in deleted.values() if code]
+        return conf_code or (failed[0] if failed else 0), {old: new for old, new in moves.items() if not deleted[old]}
 
     def write_notepad(self, page_no, content):
         """
@@ -796,16 +1959,16 @@ class R503:
         the content will be converted to the string data type before writing to the notepad.
         parameters:
             page_no: (int) 1 - 15, page number
-            content: (any) data to write to the flash
+            content: (any) data to write to the flash, bytes-like objects are written as they are
         returns: (int) status code => 0 - success, 1 - error when receiving pkg, 18 - error when write flash,
         """
-        content = str(content)
+        content = bytes(content) if isinstance(content, (bytes, bytearray, memoryview)) else str(content).encode()
         len_content = len(content)
         if len_content > 32 or page_no > 0x0F or page_no < 0:
             return 101
-        pkg = pack('>B32s', page_no, content.encode())
+        pkg = pack('>B32s', page_no, content)
         recv_data = self.ser_send(pid=0x01, pkg_len=0x24, instr_code=0x18, pkg=pkg)
-        return recv_data[4]
+        return recv_data.conf_code
 
     def read_notepad(self, page_no):
         """
@@ -819,7 +1982,7 @@ class R503:
         if page_no > 0x0F or page_no < 0:
             return -1
         recv_data = self.ser_send(pid=0x01, pkg_len=0x04, instr_code=0x19, pkg=pack('>B', page_no))
-        return recv_data[4], recv_data[5]
+        return recv_data.conf_code, recv_data.payload
 
     def ser_send(self, pkg_len, instr_code, pid=pid_cmd, pkg=None, timeout=1):
         """
@@ -831,27 +1994,341 @@ class R503:
           pkg (bytes): Payload data
           timeout (int): Serial timeout in seconds
         Returns:
-          result (list): Parsed response packet:
+          result (Response): Parsed response packet, indexable like
             [header, address, pid, pkg_len, conf_code, payload, checksum]
-            If no response, an error list is returned.
+            If no response, NO_RESPONSE (confirmation code 99) is returned,
+            if the response checksum is wrong, CHECKSUM_ERROR (confirmation code 100) is returned.
         """
         send_values = pack('>BHB', pid, pkg_len, instr_code)
         if pkg is not None:
             send_values += pkg
         check_sum = sum(send_values)
         send_values = self.header + self.addr + send_values + pack('>H', check_sum)
+        return self._exchange(send_values, instr_code, timeout)
+
+    def _exchange(self, send_values, instr_code, timeout):
+        """
+        Write complete packets and receive one response packet, see ser_send()
+        returns: (Response) the response, the final one if the module reports steps first (see step_reply())
+        """
+        t0 = perf_counter() if self.hooks else 0
         self.ser.timeout = timeout
+        self.ser.reset_input_buffer()  # drop late replies of earlier, timed out commands
         self.ser.write(send_values)
-        read_val = self.ser.read(self.recv_size)
-        return [0, 0, 0, 0, 99, None, 0] if read_val == b'' else self.read_msg(read_val)
+        read_val = self.read_packet()
+        while read_val and step_reply(send_values, read_val):
+            self.step_time = perf_counter()
+            read_val = self.read_packet()  # auto_enroll / auto_identify: wait for the final reply
+        response = CHECKSUM_ERROR if read_val is None else NO_RESPONSE if read_val == b'' else Response(read_val)
+        if self.hooks:
+            self._emit(instr_code, t0, len(send_values), len(read_val or b''), response.conf_code)
+        return response
+
+    def read_packet(self):
+        """
+        Receive exactly one packet from the module.
+        The 9 bytes header (start code, address, package id, package length) is read first, then exactly
+        'package length' more bytes are read, so that the call returns as soon as the packet is complete
+        instead of waiting for the serial timeout. Leading garbage in front of the start code is skipped.
+        returns: (bytes) complete packet including header and checksum,
+                 b'' if the packet was not received completely within the serial timeout,
+                 None if the checksum does not match
+        """
+        head = self.ser.read(9)
+        while len(head) == 9 and not head.startswith(self.header):
+            pos = head.find(self.header, 1)
+            if pos < 0:
+                pos = 8 if head.endswith(self.header[:1]) else 9
+            more = self.ser.read(pos)
+            if len(more) < pos:
+                return b''
+            head = head[pos:] + more
+        if len(head) < 9:
+            return b''
+        pkg_len = unpack('>H', head[7:9])[0]
+        body = self.ser.read(pkg_len)
+        if pkg_len < 2 or len(body) < pkg_len:
+            return b''
+        if (sum(head[6:]) + sum(body[:-2])) & 0xFFFF != unpack('>H', body[-2:])[0]:
+            return None
+        return head + body
+
+
+class Enrollment:
+    """
+    Resumable enrollment state machine: capture num_of_fps images, generate a character file from each,
+    combine them with reg_model and store the template.
+    Each call of step() sends at most one command and returns the time in seconds until the next step
+    is useful: short while a finger is on the sensor, growing up to poll_max while it is idle.
+    States: 'wait' (for a finger), 'img2tz', 'reg_model', 'store', 'done', 'failed' (see 'reason').
+    on_event(enrollment, event) is called with the events 'wait', 'capture', 'img2tz', 'img2tz_failed',
+    'reg_model', 'store', 'done' and 'failed', with a prescreen also 'prescreen_failed'.
+    """
 
+    def __init__(self, fp, location, buffer_id=1, timeout=10, num_of_fps=4, poll_min=.02, poll_max=.3,
+                 backoff=1.5, on_event=None, prescreen=None):
+        """
+        Parameters:
+          fp (R503): The sensor
+          location (int): Library page to store the template
+          buffer_id (int): Character buffer the template is stored from
+          timeout (float): Give up if no capture succeeds for this many seconds
+          num_of_fps (int): Number of images to capture
+          poll_min, poll_max (float): Shortest and longest polling interval in seconds
+          backoff (float): Growth factor of the polling interval while no finger is present
+          on_event (callable): Event callback, see class description
+          prescreen (Prescreen): Upload each capture and check its quality before img2tz (requires numpy),
+            a rejected capture ('prescreen_failed' event, see 'quality') is repeated right away
+        """
+        self.fp = fp
+        self.location = location
+        self.buffer_id = buffer_id
+        self.timeout = timeout
+        self.num_of_fps = num_of_fps
+        self.poll_min, self.poll_max, self.backoff = poll_min, poll_max, backoff
+        self.on_event = on_event
+        self.prescreen = prescreen
+        self.quality = None  # (accepted, failing metric, metrics) of the last prescreened capture
+        self.state = 'wait'
+        self.reason = None
+        self.conf_code = None
+        self.captures = 0
+        self.interval = poll_min
+        self.t_progress = time()
+        self.timings = {}  # stage => seconds spent in its commands
+        self.next_step = 0.0
+        self._event('wait')
+
+    @property
+    def finished(self):
+        return self.state in ('done', 'failed')
+
+    def _event(self, event):
+        if self.on_event is not None:
+            self.on_event(self, event)
+
+    def _fail(self, reason, conf_code):
+        self.state, self.reason, self.conf_code = 'failed', reason, conf_code
+        self._event('failed')
+
+    def _timed(self, stage, func, *args, **kwargs):
+        t = time()
+        conf_code = func(*args, **kwargs)
+        self.timings[stage] = self.timings.get(stage, 0.0) + time() - t
+        return conf_code
 
-if __name__ == '__main__':
-    fp = R503(port=0)
+    def _check_quality(self):
+        pixels = self.fp.up_image_array()
+        self.quality = (False, 'upload', {}) if isinstance(pixels, int) else self.prescreen(pixels)
+        return self.quality[0]
+
+    def step(self):
+        """
+        Advance the state machine by at most one command (with a prescreen: also the image upload).
+        returns: (float) seconds until the next step should be made, None when finished
+        """
+        if self.finished:
+            return None
+        fp = self.fp
+        if self.state == 'wait':
+            conf_code = self._timed('capture', fp.get_image_ex)
+            if conf_code == 0 and self.prescreen is not None and not self._timed('prescreen', self._check_quality):
+                conf_code = None
+            if conf_code == 0:
+                self.state = 'img2tz'
+                self.interval = self.poll_min
+                self._event('capture')
+                return 0.0
+            if conf_code == 2:  # no finger: back off
+                self.interval = min(self.interval * self.backoff, self.poll_max)
+            else:  # finger present, but the image was not usable or rejected by the prescreen: try again soon
+                self.interval = self.poll_min
+                if conf_code is None:
+                    self._event('prescreen_failed')
+            if time() - self.t_progress > self.timeout:
+                self._fail('timeout', 0x26)
+                return None
+            return self.interval
+        if self.state == 'img2tz':
+            if self._timed('img2tz', fp.img2tz, buffer_id=self.captures + 1):
+                self._event('img2tz_failed')
+            else:
+                self.captures += 1
+                self.t_progress = time()
+                self._event('img2tz')
+            if self.captures >= self.num_of_fps:
+                self.state = 'reg_model'
+                self._event('reg_model')
+                return 0.0
+            self.state = 'wait'
+            self._event('wait')
+            return self.interval
+        if self.state == 'reg_model':
+            conf_code = self._timed('reg_model', fp.reg_model)
+            if conf_code:
+                self._fail('reg_model', conf_code)
+                return None
+            self.state = 'store'
+            self._event('store')
+            return 0.0
+        conf_code = self._timed('store', fp.store, buffer_id=self.buffer_id, page_id=self.location)
+        if conf_code:
+            self._fail('store', conf_code)
+            return None
+        self.state, self.conf_code = 'done', 0
+        self._event('done')
+        return None
+
+    def run(self):
+        """
+        Run the state machine to the end in the calling thread
+        returns: (int) confirmation code, 0 on success
+        """
+        while True:
+            delay = self.step()
+            if delay is None:
+                return self.conf_code
+            sleep(delay)
 
-    sys_para = fp.read_sys_para_decode()
-    for k, v in sys_para.items():
-        print(k, ':', v)
 
+def run_enrollments(enrollments):
+    """
+    Drive several Enrollment state machines (on different sensors) from one thread,
+    always stepping the one that is due next.
+    returns: (list) confirmation codes in the order of 'enrollments'
+    """
+    pending = list(enrollments)
+    while pending:
+        e = min(pending, key=lambda x: x.next_step)
+        wait = e.next_step - time()
+        if wait > 0:
+            sleep(wait)
+        delay = e.step()
+        if delay is None:
+            pending.remove(e)
+        else:
+            e.next_step = time() + delay
+    return [e.conf_code for e in enrollments]
 
-    fp.ser_close()
+
+def parse_command(line):
+    """
+    Parse one line of a command script, either
+      name arg1 arg2 key=value ...   (values are read as JSON if possible, e.g. 1, 0x10, [1, 2], else as text;
+                                     a word is a keyword argument only if the part before '=' is an identifier)
+    or a JSON object {"cmd": name, "args": [...], "kwargs": {...}}
+    returns: (tuple) name, args, kwargs; None for an empty line or a comment (#)
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        cmd = json.loads(line)
+        return cmd['cmd'], from_json(cmd.get('args', [])), from_json(cmd.get('kwargs', {}))
+
+    def value(text):
+        if text.lower().startswith('0x'):
+            return int(text, 16)
+        try:
+            return from_json(json.loads(text))
+        except ValueError:
+            return text
+
+    def keyword(word):
+        return word.partition('=')[0].isidentifier() and '=' in word
+
+    name, *words = shlex.split(line)
+    args = [value(w) for w in words if not keyword(w)]
+    kwargs = {k: value(v) for k, v in (w.split('=', 1) for w in words if keyword(w))}
+    return name, args, kwargs
+
+
+def run_script(fp, lines, out=None, stop_on_error=False):
+    """
+    Run commands (see parse_command) one after the other over one open connection and write one JSON line
+    per command: {"line", "cmd", "result" or "error", "seconds"}
+    Results without a JSON form (e.g. generators, Metrics) are written as their repr().
+    parameters: out (file) - where to write the JSON lines, sys.stdout at call time if not given
+    returns: (int) number of commands that failed (unknown command, bad arguments, exception)
+    """
+    out = sys.stdout if out is None else out
+    errors = 0
+    for n, line in enumerate(lines, 1):
+        record = {'line': n}
+        t = perf_counter()
+        try:
+            command = parse_command(line)
+            if command is None:
+                continue
+            name, args, kwargs = command
+            record['cmd'] = name
+            method = None if name.startswith('_') else getattr(fp, name, None)
+            if not callable(method):
+                raise AttributeError(f'unknown command {name!r}')
+            record['result'] = to_json(method(*args, **kwargs))
+            record['seconds'] = round(perf_counter() - t, 6)
+            text = json.dumps(record, default=repr)
+        except Exception as e:  # reported in the output, the script goes on
+            record.pop('result', None)
+            record['error'] = f'{type(e).__name__}: {e}'
+            record['seconds'] = round(perf_counter() - t, 6)
+            text = json.dumps(record)
+            errors += 1
+        out.write(text + '\n')
+        out.flush()
+        if errors and stop_on_error:
+            break
+    return errors
+
+
+def main(argv=None):
+    """
+    Command line interface: python -m r503 [--port PORT] [script ...]
+    Runs the commands of the scripts (or of stdin) over one connection, see run_script().
+    Without a script and with stdin connected to a terminal, the system parameters are printed.
+    """
+    parser = argparse.ArgumentParser(prog='python -m r503', description='Run R503 commands from a script or stdin '
+                                     'and write JSON lines with the results and timings')
+    parser.add_argument('scripts', nargs='*', help='command files, "-" for stdin (default)')
+    parser.add_argument('--port', default='0', help='port number or device name (default 0)')
+    parser.add_argument('--baud', type=int, default=57600)
+    parser.add_argument('--pw', type=lambda x: int(x, 0), default=0)
+    parser.add_argument('--addr', type=lambda x: int(x, 0), default=0xFFFFFFFF)
+    parser.add_argument('--pkg-len', type=int, default=128)
+    parser.add_argument('--link-file', help='link settings written by tune_link()')
+    parser.add_argument('--sim', action='store_true', help='use the virtual module of r503_sim')
+    parser.add_argument('--stop-on-error', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.sim:
+        from r503_sim import VirtualR503, SimSerial
+        port = SimSerial(VirtualR503(time_scale=0))
+    else:
+        port = int(args.port) if args.port.isdigit() else args.port
+    fp = R503(port=port, baud=args.baud, pw=args.pw, addr=args.addr, recv_size=args.pkg_len,
+              link_file=args.link_file)
+    try:
+        if not args.scripts and sys.stdin.isatty():
+            sys_para = fp.read_sys_para_decode()
+            if isinstance(sys_para, int):
+                print(fp.confirmation_decode(sys_para), file=sys.stderr)
+                return 1
+            for k, v in sys_para.items():
+                print(k, ':', v)
+            return 0
+        errors = 0
+        for script in args.scripts or ['-']:
+            if script == '-':
+                errors += run_script(fp, sys.stdin, stop_on_error=args.stop_on_error)
+            else:
+                with open(script) as f:
+                    errors += run_script(fp, f, stop_on_error=args.stop_on_error)
+            if errors and args.stop_on_error:
+                break
+        return 1 if errors else 0
+    finally:
+        fp.ser_close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
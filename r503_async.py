@@ -0,0 +1,640 @@
+# Asyncio driver for the GROW R503 fingerprint module.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# AsyncR503 offers the command set of R503 as coroutines. Responses are read by their packet length,
+# every command has its own deadline and a cancelled auto_enroll/auto_identify is aborted on the module
+# with the cancel instruction (0x30), so one event loop can drive many sensors.
+#
+# The serial transport is provided by pyserial-asyncio (pip install pyserial-asyncio), any other pair of
+# asyncio StreamReader/StreamWriter can be passed to the constructor as well.
+
+import asyncio
+from struct import pack, unpack
+
+from r503 import R503, Response, NO_RESPONSE, CHECKSUM_ERROR, step_reply, unpack_image
+
+
+class AsyncR503:
+    """
+    Asyncio version of the R503 class.
+    Use 'await AsyncR503.open(port)' to connect through pyserial-asyncio.
+    """
+    header = R503.header
+    pid_cmd = R503.pid_cmd
+    cancellable = (0x31, 0x32)  # auto_enroll, auto_identify can be aborted with the cancel instruction
+
+    read_msg = R503.read_msg
+    conf_codes = staticmethod(R503.conf_codes)
+    confirmation_decode = R503.confirmation_decode
+    _track = R503._track
+
+    def __init__(self, reader, writer, pw=0, addr=0xFFFFFFFF, recv_size=128):
+        """
+        Initialize the AsyncR503 instance on an open stream pair.
+        Parameters:
+          reader (asyncio.StreamReader): Receiving side of the serial connection
+          writer (asyncio.StreamWriter): Sending side of the serial connection
+          pw (int): The password, default 0
+          addr (int): The module address, default 0xFFFFFFFF
+          recv_size (int): The data packet length configured in the module, default 128
+        """
+        self.reader = reader
+        self.writer = writer
+        self.pw = pack('>I', pw)
+        self.addr = pack('>I', addr)
+        self.recv_size = recv_size
+        self.img_size = None
+        self.occupancy_bits = None  # cached library bitmap, see occupancy()
+        self.library_capacity = None
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, port, baud=57600, pw=0, addr=0xFFFFFFFF, recv_size=128):
+        """
+        Open the serial port with pyserial-asyncio and return a connected AsyncR503 instance.
+        Parameters: see R503.__init__()
+        """
+        import serial_asyncio
+        reader, writer = await serial_asyncio.open_serial_connection(url=R503.port_name(port), baudrate=baud)
+        return cls(reader, writer, pw, addr, recv_size)
+
+    async def ser_close(self):
+        """
+        Closes the serial port
+        """
+        self.writer.close()
+        await self.writer.wait_closed()
+
+    async def read_packet(self):
+        """
+        Receive exactly one packet from the module, see R503.read_packet()
+        returns: (bytes) complete packet, b'' at the end of the stream, None if the checksum does not match
+        """
+        try:
+            head = await self.reader.readexactly(9)
+            while not head.startswith(self.header):
+                pos = head.find(self.header, 1)
+                if pos < 0:
+                    pos = 8 if head.endswith(self.header[:1]) else 9
+                head = head[pos:] + await self.reader.readexactly(pos)
+            pkg_len = unpack('>H', head[7:9])[0]
+            body = await self.reader.readexactly(pkg_len)
+        except asyncio.IncompleteReadError:
+            return b''
+        if pkg_len < 2 or (sum(head[6:]) + sum(body[:-2])) & 0xFFFF != unpack('>H', body[-2:])[0]:
+            return None
+        return head + body
+
+    async def _abort(self, instr_code, drain_time=.2):
+        """
+        Bring the module back to idle after a command was cancelled or ran into its deadline:
+        send the cancel instruction for cancellable commands, then discard everything that arrives
+        until the line stays quiet for 'drain_time' seconds.
+        """
+        if instr_code in self.cancellable:
+            send_values = pack('>BHB', self.pid_cmd, 0x03, 0x30)
+            self.writer.write(self.header + self.addr + send_values + pack('>H', sum(send_values)))
+        while True:
+            try:
+                if not await asyncio.wait_for(self.reader.read(4096), drain_time):
+                    return
+            except asyncio.TimeoutError:
+                return
+
+    async def ser_send(self, pkg_len, instr_code, pid=pid_cmd, pkg=None, timeout=1):
+        """
+        Send a command packet to the R503 module and receive response.
+        Parameters: see R503.ser_send(), 'timeout' is the deadline for the complete response
+        Returns:
+          result (Response): Parsed response packet, see R503.ser_send()
+        If the calling task is cancelled while waiting, the command is aborted on the module
+        before the cancellation is propagated.
+        """
+        send_values = pack('>BHB', pid, pkg_len, instr_code)
+        if pkg is not None:
+            send_values += pkg
+        async with self.lock:
+            return await self._transact(self.header + self.addr + send_values + pack('>H', sum(send_values)), timeout)
+
+    async def _transact(self, send_values, timeout):
+        """
+        Write a complete command packet and receive the response, the caller holds self.lock.
+        returns: (Response) parsed response packet, see ser_send()
+        """
+        self.writer.write(send_values)
+        try:
+            read_val = await asyncio.wait_for(self.read_packet(), timeout)
+            while read_val and step_reply(send_values, read_val):  # auto command: wait for the final reply
+                read_val = await asyncio.wait_for(self.read_packet(), timeout)
+        except asyncio.TimeoutError:
+            await self._abort(send_values[9])
+            return NO_RESPONSE
+        except asyncio.CancelledError:
+            await asyncio.shield(self._abort(send_values[9]))
+            raise
+        if read_val is None:
+            return CHECKSUM_ERROR
+        return NO_RESPONSE if read_val == b'' else Response(read_val)
+
+    async def set_pw(self, new_pw):
+        """
+        Set modules handshaking password
+        parameters: (int) new_pw - New password
+        returns: (int) confirmation code
+        """
+        self.pw = pack('>I', new_pw)
+        return (await self.ser_send(pkg_len=0x07, instr_code=0x12, pkg=self.pw)).conf_code
+
+    async def set_address(self, new_addr):
+        """
+        Set module address
+        parameter: (int) new_addr
+        returns: (int) confirmation code
+        """
+        self.addr = pack('>I', new_addr)
+        return (await self.ser_send(pkg_len=0x07, instr_code=0x15, pkg=self.addr)).conf_code
+
+    async def cancel(self):
+        """
+        Cancel instruction
+        returns: (int) confirmation code
+        """
+        return (await self.ser_send(pkg_len=3, instr_code=0x30)).conf_code
+
+    async def led_control(self, ctrl=0x03, speed=0, color=0x01, cycles=0):
+        """
+        Aura LED control, see R503.led_control()
+        returns: confirmation code
+        """
+        cmd = pack('>BBBB', ctrl, speed, color, cycles)
+        return (await self.ser_send(pkg_len=0x07, instr_code=0x35, pkg=cmd)).conf_code
+
+    async def set_baud(self, baud=57600):
+        """
+        Set the baud rate for serial communication: 9600, 19200, 38400, 57600 (default), 115200.
+        returns: (int) confirmation code, 0 means success
+        """
+        baud0 = int(baud / 9600)
+        if baud0 not in [1, 2, 4, 6, 12]:
+            return 102
+        conf_code = (await self.ser_send(pkg_len=0x05, instr_code=0x0E, pkg=pack('>BB', 4, baud0))).conf_code
+        if not conf_code:
+            self.writer.transport.serial.baudrate = baud
+        return conf_code
+
+    async def set_security(self, lvl=3):
+        """
+        Set the security level of the fingerprint sensor, 1 (low) to 5 (highest).
+        returns: (int) confirmation code, 0 means success
+        """
+        if lvl not in [1, 2, 3, 4, 5]:
+            return 102
+        return (await self.ser_send(pkg_len=0x05, instr_code=0x0E, pkg=pack('>BB', 5, lvl))).conf_code
+
+    async def set_pkg_length(self, pkg_len=128):
+        """
+        Set the package length for serial communication: 32, 64, 128 (default), 256 bytes.
+        returns: (int) confirmation code, 0 means success
+        """
+        pkg_len0 = {32: 0, 64: 1, 128: 2, 256: 3}.get(pkg_len)
+        if pkg_len0 is None:
+            return 102
+        conf_code = (await self.ser_send(pkg_len=0x05, instr_code=0x0E, pkg=pack('>BB', 6, pkg_len0))).conf_code
+        if not conf_code:
+            self.recv_size = pkg_len
+        return conf_code
+
+    async def read_sys_para(self):
+        """
+        Status register and other basic configuration parameters
+        returns: (list) status_reg, sys_id_code, finger_lib_size, security_lvl, device_addr, data_packet_size, baud_rate
+        """
+        read_pkg = await self.ser_send(pkg_len=0x03, instr_code=0x0F)
+        return read_pkg.conf_code or read_pkg.unpack('>HHHHIHH')
+
+    async def read_sys_para_decode(self):
+        """
+        Get system parameters in a decoded, human-readable format, see R503.read_sys_para_decode()
+        """
+        rsp = await self.read_sys_para()
+        return rsp if isinstance(rsp, int) else R503.decode_sys_para(rsp)
+
+    async def verify_pw(self, pw=0x00):
+        """
+        Verify modules handshaking password
+        returns: (int) confirmation code
+        """
+        return (await self.ser_send(pkg_len=0x07, instr_code=0x13, pkg=pack('>I', pw))).conf_code
+
+    async def handshake(self):
+        """
+        Send handshake instructions to the module, Confirmation code 0 receives if the sensor is normal
+        returns: (int) confirmation code
+        """
+        return (await self.ser_send(pkg_len=0x03, instr_code=0x40)).conf_code
+
+    async def check_sensor(self):
+        """
+        Check whether the sensor is normal
+        returns: (int) confirmation code
+        """
+        return (await self.ser_send(pkg_len=0x03, instr_code=0x36)).conf_code
+
+    async def load_char(self, page_id, buffer_id=1):
+        """
+        Load template at the specified location of flash library to template buffer
+        returns: (int) confirmation code
+        """
+        return (await self.ser_send(pkg_len=0x06, instr_code=0x07, pkg=pack('>BH', buffer_id, page_id))).conf_code
+
+    async def _up_data(self, send_values, buffer, timeout):
+        """
+        Send an upload command and receive the data packets until the end packet (pid 0x08) arrives.
+        parameters: send_values (bytes) - command content, buffer - preallocated receive buffer or None,
+                    timeout - deadline in seconds for the complete upload
+        returns: (tuple) confirmation code, list of packet data (buffer is None) or number of bytes received
+        """
+        packets = []
+        pos = 0
+
+        async def receive():
+            nonlocal pos
+            ack = await self.read_packet()
+            if not ack:
+                return 99 if ack == b'' else 100
+            if ack[9]:
+                return ack[9]
+            view = None if buffer is None else memoryview(buffer).cast('B')
+            while True:
+                packet = await self.read_packet()
+                if not packet:
+                    return 99 if packet == b'' else 100
+                data = packet[9:-2]
+                if view is None:
+                    packets.append(data)
+                elif pos + len(data) > len(view):
+                    return 102
+                else:
+                    view[pos:pos + len(data)] = data
+                pos += len(data)
+                if packet[6] == 0x08:
+                    return 0
+
+        send_values = self.header + self.addr + send_values + pack('>H', sum(send_values))
+        async with self.lock:
+            self.writer.write(send_values)
+            try:
+                conf_code = await asyncio.wait_for(receive(), timeout)
+            except asyncio.TimeoutError:
+                await self._abort(send_values[9])
+                conf_code = 99
+            except asyncio.CancelledError:
+                await asyncio.shield(self._abort(send_values[9]))
+                raise
+        return conf_code, (packets if buffer is None else pos)
+
+    async def up_image(self, timeout=5):
+        """
+        Upload the image in Img_Buffer to upper computer
+        returns: (list) image data of each packet, or the confirmation code (-1 if nothing was received)
+        """
+        conf_code, img_data = await self._up_data(pack('>BHB', 0x01, 0x03, 0x0A), None, timeout)
+        return -1 if conf_code == 99 else conf_code or img_data
+
+    async def up_image_into(self, buffer, timeout=5):
+        """
+        Upload the image in Img_Buffer directly into a preallocated buffer.
+        returns: (tuple) confirmation code, number of bytes received
+        """
+        return await self._up_data(pack('>BHB', 0x01, 0x03, 0x0A), buffer, timeout)
+
+    async def image_size(self):
+        """
+        Sensor image geometry, read from the product information once and cached afterwards
+        returns: (tuple) width, height
+        """
+        if self.img_size is None:
+            info = await self.read_prod_info_decode()
+            if isinstance(info, int):
+                return 192, 192
+            self.img_size = info['image width'], info['image height']
+        return self.img_size
+
+    async def up_image_array(self, timeout=5):
+        """
+        Upload the image in Img_Buffer as a pixel array (requires numpy).
+        returns: (ndarray) uint8 array of shape (height, width) if successful, else the confirmation code
+        """
+        width, height = await self.image_size()
+        buffer = bytearray(width * height // 2)
+        conf_code, n = await self.up_image_into(buffer, timeout)
+        if conf_code or n != len(buffer):
+            return conf_code or 15
+        return unpack_image(buffer, width, height)
+
+    async def up_char(self, timeout=5, buffer_id=1):
+        """
+        Upload the data in template buffer to the upper computer
+        returns: (list) template data of each packet, or the confirmation code (-1 if nothing was received)
+        """
+        conf_code, char_data = await self._up_data(pack('>BHBB', 0x01, 0x04, 0x08, buffer_id), None, timeout)
+        return -1 if conf_code == 99 else conf_code or char_data
+
+    async def up_char_into(self, buffer, buffer_id=1, timeout=5):
+        """
+        Upload the data in template buffer directly into a preallocated buffer.
+        returns: (tuple) confirmation code, number of bytes received
+        """
+        return await self._up_data(pack('>BHBB', 0x01, 0x04, 0x08, buffer_id), buffer, timeout)
+
+    def down_packet(self, img_pkt, end=False):
+        """
+        Queue a downlink data packet for the sensor module, see R503.down_packet()
+        """
+        content = pack('>BH', 0x08 if end else 0x02, len(img_pkt) + 2) + bytes(img_pkt)
+        self.writer.write(self.header + self.addr + content + pack('>H', sum(content) & 0xFFFF))
+
+    async def _down_data(self, pkg_len, instr_code, pkg, data):
+        """
+        Send a download command and, if the module accepts it, all data packets.
+        returns: (int) confirmation code of the download command
+        """
+        send_values = pack('>BHB', self.pid_cmd, pkg_len, instr_code) + (pkg or b'')
+        async with self.lock:
+            recv_data0 = await self._transact(self.header + self.addr + send_values + pack('>H', sum(send_values)), 1)
+            if recv_data0.conf_code:
+                return recv_data0.conf_code
+            for pkt in data[:-1]:
+                self.down_packet(pkt)
+            self.down_packet(data[-1], end=True)
+            await self.writer.drain()
+        return 0
+
+    async def down_image(self, img_data):
+        """
+        Download image from the upper computer to the image buffer
+        parameters: img_data (list) image data split into packets
+        returns: confirmation code
+        """
+        return await self._down_data(0x03, 0x0B, None, img_data)
+
+    async def down_char(self, img_data, buffer_id=1):
+        """
+        Download a fingerprint template to the sensor module buffer.
+        parameters: img_data (list) template data split into packets, buffer_id (int) default 1
+        returns: confirmation code
+        """
+        return await self._down_data(0x04, 0x09, pack('>B', buffer_id), img_data)
+
+    async def read_info_page(self, timeout=1):
+        """
+        Read the information page
+        returns: (int) confirmation code or (bytes) info page contents
+        """
+        conf_code, data = await self._up_data(pack('>BHB', 0x01, 0x03, 0x16), None, timeout)
+        return conf_code or b''.join(data)
+
+    async def get_img(self):
+        """
+        Detect a finger and store it in image_buffer
+        returns: (int) confirmation code
+        """
+        return (await self.ser_send(pkg_len=0x03, instr_code=0x01)).conf_code
+
+    async def get_image_ex(self):
+        """
+        Detect a finger and store it in image_buffer return 0x07 if image poor quality
+        returns: (int) confirmation code
+        """
+        return (await self.ser_send(pkg_len=0x03, instr_code=0x28)).conf_code
+
+    async def img2tz(self, buffer_id):
+        """
+        Generate character file from the original image in Image Buffer and store the file in CharBuffer 1 or 2
+        returns: (int) confirmation code
+        """
+        return (await self.ser_send(pkg_len=0x04, instr_code=0x02, pkg=pack('>B', buffer_id))).conf_code
+
+    async def reg_model(self):
+        """
+        Combine the character files in CharBuffer 1 and 2 into a template
+        returns: (int) confirmation code
+        """
+        return (await self.ser_send(pkg_len=0x03, instr_code=0x05)).conf_code
+
+    async def store(self, buffer_id, page_id, timeout=2):
+        """
+        Store a fingerprint template to the module's flash library.
+        returns: (int) confirmation code, 0 means success
+        """
+        package = pack('>BH', buffer_id, page_id)
+        conf_code = (await self.ser_send(pkg_len=0x06, instr_code=0x06, pkg=package, timeout=timeout)).conf_code
+        self._track(conf_code, page_id, 1, True)
+        return conf_code
+
+    async def delete_char(self, page_num, num_of_temps_to_del=1):
+        """
+        Delete stored fingerprint templates.
+        returns: (int) confirmation code
+        """
+        package = pack('>HH', page_num, num_of_temps_to_del)
+        conf_code = (await self.ser_send(pkg_len=0x07, instr_code=0x0C, pkg=package)).conf_code
+        self._track(conf_code, page_num, num_of_temps_to_del, False)
+        return conf_code
+
+    async def match(self):
+        """
+        Compare the character files in CharBuffer 1 and 2
+        returns: (tuple) status [0: matching, 1: error, 8: not matching], match score
+        """
+        rec_data = await self.ser_send(pkg_len=0x03, instr_code=0x03)
+        return rec_data.conf_code, rec_data.payload
+
+    async def search(self, buff_num=1, start_id=0, para=200):
+        """
+        Capture a finger and search the finger library for it, see R503.search()
+        returns: (tuple) status [success:0, error:1, no match:9], template number, match score
+                 the search is skipped if capturing or generating the character file fails,
+                 status is then the confirmation code of that step
+        """
+        conf_code = await self.get_image_ex() or await self.img2tz(buff_num)
+        if conf_code:
+            return 99 if conf_code == 99 else (conf_code, 0, 0)
+        return await self.search_char(buff_num, start_id, para)
+
+    async def search_char(self, buff_num=1, start_id=0, para=200):
+        """
+        Search the finger library for the character file already present in CharBuffer 1 or 2 (no capture)
+        returns: (tuple) status [success:0, error:1, no match:9], template number, match score
+        """
+        package = pack('>BHH', buff_num, start_id, para)
+        recv_data = await self.ser_send(pkg_len=0x08, instr_code=0x04, pkg=package)
+        if recv_data.conf_code == 99:
+            return 99
+        if recv_data.payload is None:
+            return recv_data.conf_code, 0, 0
+        temp_num, match_score = recv_data.unpack('>HH')
+        return recv_data.conf_code, temp_num, match_score
+
+    async def empty_finger_lib(self):
+        """
+        Empty all stored fingerprints.
+        returns: (int) confirmation code
+        """
+        conf_code = (await self.ser_send(pkg_len=0x03, instr_code=0x0d)).conf_code
+        self.occupancy_bits = 0 if conf_code == 0 else None
+        return conf_code
+
+    async def read_valid_template_num(self):
+        """
+        Read number of valid templates stored in module.
+        returns: (int) number of valid templates stored
+        raises: R503Error if the module does not report the number, see R503.read_valid_template_num()
+        """
+        return (await self.ser_send(pkg_len=0x03, instr_code=0x1d)).check().unpack('>H')[0]
+
+    async def read_index_table(self, index_page=0):
+        """
+        Read the fingerprint template index table
+        parameters: (int) index_page = 0/1/2/3
+        returns: (list) index which fingerprints saved already, or the confirmation code (int) on any error
+        """
+        temp = await self.ser_send(pkg_len=0x04, instr_code=0x1f, pkg=pack('>B', index_page))
+        if temp.conf_code:
+            return temp.conf_code
+        if self.occupancy_bits is not None:
+            shift = 256 * index_page
+            self.occupancy_bits = (self.occupancy_bits & ~(((1 << 256) - 1) << shift)
+                                   | int.from_bytes(temp.payload, 'little') << shift)
+        return R503.decode_index_table(temp.payload)
+
+    async def auto_enroll(self, location_id, duplicate_id=1, duplicate_fp=1, ret_status=1, finger_leave=1,
+                          timeout=10):
+        """
+        Automatically register a fingerprint template, see R503.auto_enroll()
+        With ret_status=1 the step reports of the module are skipped, 'timeout' applies to each reply.
+        Cancelling the awaiting task aborts the enrollment on the module.
+        returns: confirmation code of the final reply, 0 if success
+        """
+        package = pack('>BBBBB', location_id, duplicate_id, duplicate_fp, ret_status, finger_leave)
+        conf_code = (await self.ser_send(pkg_len=0x08, instr_code=0x31, pkg=package, timeout=timeout)).conf_code
+        self._track(conf_code, location_id, 1, True)
+        return conf_code
+
+    async def auto_identify(self, security_lvl=3, start_pos=0, end_pos=199, ret_key_step=0, num_of_fp_errors=1,
+                            timeout=10):
+        """
+        Search and verify a fingerprint
+        Cancelling the awaiting task aborts the identification on the module.
+        return: (tuple) fp store location, match score, or the confirmation code (int) on any error
+        """
+        package = pack('>BBBBB', security_lvl, start_pos, end_pos, ret_key_step, num_of_fp_errors)
+        read_pkg = await self.ser_send(pkg_len=0x08, instr_code=0x32, pkg=package, timeout=timeout)
+        if read_pkg.conf_code:
+            return read_pkg.conf_code
+        _, position, match_score = read_pkg.unpack('>BHH')
+        return position, match_score
+
+    async def read_prod_info(self):
+        """
+        Read product information from the fingerprint sensor, see R503.read_prod_info()
+        returns: tuple of 9 info strings if successful, else the confirmation code
+        """
+        info = await self.ser_send(pkg_len=0x03, instr_code=0x3c)
+        if info.conf_code:
+            return info.conf_code
+        inf = info.payload
+        return inf[:16], inf[16:20], inf[20:28], inf[28:30], inf[30:38], inf[38:40], inf[40:42], inf[42:44], inf[44:46]
+
+    async def read_prod_info_decode(self):
+        """
+        Decode raw product info into a human-readable dictionary, see R503.read_prod_info_decode()
+        """
+        inf = await self.read_prod_info()
+        return inf if isinstance(inf, int) else R503.decode_prod_info(inf)
+
+    async def get_fw_ver(self):
+        """
+        Get firmware version.
+        returns: (tuple) confirmation code, firmware version
+        """
+        recv_data = await self.ser_send(pkg_len=3, instr_code=0x3A)
+        return recv_data.conf_code, recv_data.payload
+
+    async def get_alg_ver(self):
+        """
+        Get the algorithm version.
+        returns: (tuple) confirmation code, algorithm version
+        """
+        recv_data = await self.ser_send(pkg_len=3, instr_code=0x39)
+        return recv_data.conf_code, recv_data.payload
+
+    async def soft_reset(self):
+        """
+        Perform a soft reset of the R503 module.
+        returns: (int) confirmation code
+        """
+        return (await self.ser_send(pkg_len=3, instr_code=0x3D)).conf_code
+
+    async def get_random_code(self):
+        """
+        Generate a random 32-bit integer from the sensor module.
+        returns: (int) random number
+        raises: R503Error if the module does not send one, see R503.get_random_code()
+        """
+        return (await self.ser_send(pkg_len=0x03, instr_code=0x14)).check().unpack('>I')[0]
+
+    async def occupancy(self, refresh=False):
+        """
+        Bitmap of the occupied library pages, see R503.occupancy()
+        returns: (int) bitmap, bit n set if page n is occupied; 99 if an index table page could not be read
+        """
+        if self.occupancy_bits is None or refresh:
+            bits = 0
+            for index_page in range(4):
+                temp = await self.ser_send(pkg_len=0x04, instr_code=0x1f, pkg=pack('>B', index_page))
+                if temp.conf_code:
+                    self.occupancy_bits = None
+                    return 99
+                bits |= int.from_bytes(temp.payload, 'little') << (256 * index_page)
+            self.occupancy_bits = bits
+        return self.occupancy_bits
+
+    async def capacity(self):
+        """
+        returns: (int) library size of the module ('fp database size' of the product info, 200 if unknown)
+        """
+        if self.library_capacity is None:
+            info = await self.read_prod_info_decode()
+            self.library_capacity = 200 if isinstance(info, int) else info['fp database size']
+        return self.library_capacity
+
+    async def get_available_location(self, index_page=None, start=0):
+        """
+        Provides next available location in fingerprint library, see R503.get_available_location()
+        returns: (int) next available location, None if there is none or the index table could not be read
+        """
+        bits = await self.occupancy()
+        return None if bits == 99 else R503.first_free(bits, await self.capacity(), index_page, start)
+
+    async def write_notepad(self, page_no, content):
+        """
+        Write data to a notepad page (0 to 15, 32 bytes each), see R503.write_notepad()
+        returns: (int) status code
+        """
+        content = bytes(content) if isinstance(content, (bytes, bytearray, memoryview)) else str(content).encode()
+        if len(content) > 32 or page_no > 0x0F or page_no < 0:
+            return 101
+        pkg = pack('>B32s', page_no, content)
+        return (await self.ser_send(pkg_len=0x24, instr_code=0x18, pkg=pkg)).conf_code
+
+    async def read_notepad(self, page_no):
+        """
+        Read data from a specific notepad page in module memory.
+        returns: (tuple) status code, data; -1 if invalid page
+        """
+        if page_no > 0x0F or page_no < 0:
+            return -1
+        recv_data = await self.ser_send(pkg_len=0x04, instr_code=0x19, pkg=pack('>B', page_no))
+        return recv_data.conf_code, recv_data.payload
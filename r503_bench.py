@@ -0,0 +1,266 @@
+# Benchmark of the R503 driver: command latency and bulk transfer throughput.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# Runs a set of operations for every combination of baud rate and packet length, against a real module or
+# the virtual module of r503_sim, and reports p50/p95/p99 latency per operation and per instruction code,
+# bytes/s of image and template uploads, and how the time splits into wire time and waiting for timeouts.
+#
+#   python r503_bench.py --sim -n 20 -o bench.json
+#   python r503_bench.py --port /dev/ttyUSB0 --bauds 57600,115200 --pkg-lens 128,256 -o bench.json
+#   python r503_bench.py --sim --compare bench_old.json
+#
+# With a real module, keep a finger on the sensor for the capture based operations.
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import sys
+from time import perf_counter, strftime
+
+from r503 import R503, SerialWrapper
+
+OPERATIONS = ('handshake', 'check_sensor', 'led_control', 'read_sys_para', 'read_index_table',
+              'search', 'auto_identify', 'up_image', 'up_char', 'manual_enroll')
+
+
+def percentile(values, p):
+    """
+    returns: (float) p-th percentile of the values (nearest rank), None for an empty list
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(p * len(values) / 100) - 1))]
+
+
+def summary(values):
+    """
+    returns: (dict) count, mean, p50, p95, p99 and max of a list of durations in seconds
+    """
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values) if values else None,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': max(values, default=None),
+    }
+
+
+class TimedSerial(SerialWrapper):
+    """
+    Wrapper of a serial object that attributes time and bytes to the instruction code of the last command.
+    Time spent in reads that returned fewer bytes than requested is counted as timeout wait.
+    """
+
+    def __init__(self, ser):
+        super().__init__(ser)
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all counters
+        """
+        self.current = None
+        self.t_cmd = None
+        self.latency = {}     # instruction code => [seconds]
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.read_time = 0.0
+        self.timeout_wait = 0.0
+
+    def close_command(self):
+        if self.current is not None:
+            self.latency.setdefault(self.current, []).append(perf_counter() - self.t_cmd)
+            self.current = None
+
+    def write(self, data):
+        if len(data) > 9 and data[6] == 0x01:
+            self.close_command()
+            self.current, self.t_cmd = data[9], perf_counter()
+        self.bytes_out += len(data)
+        return self.ser.write(data)
+
+    def read(self, size=1):
+        t = perf_counter()
+        data = self.ser.read(size)
+        dt = perf_counter() - t
+        self.read_time += dt
+        if len(data) < size:
+            self.timeout_wait += dt
+        self.bytes_in += len(data)
+        return data
+
+
+class Bench:
+    """
+    Benchmark runner for one R503 instance.
+    """
+
+    def __init__(self, fp, sim=None, location=0):
+        """
+        Parameters:
+          fp (R503): The driver instance, its serial object is wrapped by TimedSerial
+          sim (VirtualR503): The simulated module behind fp, if any; a finger is placed automatically
+          location (int): Library page used by manual_enroll (it is deleted again afterwards)
+        """
+        self.fp = fp
+        self.sim = sim
+        self.location = location
+        if not isinstance(fp.ser, TimedSerial):
+            fp.ser = TimedSerial(fp.ser)
+        self.ops = {
+            'handshake': fp.handshake,
+            'check_sensor': fp.check_sensor,
+            'led_control': lambda: fp.led_control(ctrl=3, color=1),
+            'read_sys_para': fp.read_sys_para,
+            'read_index_table': fp.read_index_table,
+            'search': fp.search,
+            'auto_identify': fp.auto_identify,
+            'up_image': self._up_image,
+            'up_char': self._up_char,
+            'manual_enroll': self._manual_enroll,
+        }
+
+    def _up_image(self):
+        self.fp.get_img()
+        return self.fp.up_image()
+
+    def _up_char(self):
+        self.fp.get_img()
+        self.fp.img2tz(1)
+        return self.fp.up_char()
+
+    def _manual_enroll(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.fp.manual_enroll(self.location, loop_delay=0)
+        self.fp.delete_char(self.location)
+
+    def run_config(self, operations, n):
+        """
+        Run every operation n times with the current link settings.
+        returns: (dict) results of this configuration
+        """
+        ser = self.fp.ser
+        if self.sim is not None:
+            self.sim.place_finger('bench')
+        ser.reset()
+        ops, throughput = {}, {}
+        for name in operations:
+            times, sizes = [], []
+            timeout_before = ser.timeout_wait
+            for _ in range(n):
+                t = perf_counter()
+                result = self.ops[name]()
+                times.append(perf_counter() - t)
+                if name in ('up_image', 'up_char') and isinstance(result, list):
+                    sizes.append(sum(len(p) for p in result))
+            ser.close_command()
+            ops[name] = summary(times)
+            ops[name]['timeout_wait'] = ser.timeout_wait - timeout_before
+            if sizes:
+                throughput[name] = sum(sizes) / sum(times)
+        baud = getattr(ser.ser, 'baudrate', None)
+        return {
+            'operations': ops,
+            'instructions': {f'0x{code:02x}': summary(v) for code, v in sorted(ser.latency.items())},
+            'throughput_bytes_per_s': throughput,
+            'bytes_out': ser.bytes_out,
+            'bytes_in': ser.bytes_in,
+            'read_time': ser.read_time,
+            'timeout_wait': ser.timeout_wait,
+            'wire_time': (ser.bytes_out + ser.bytes_in) * 10 / baud if baud else None,
+        }
+
+    def run(self, bauds=(57600,), pkg_lens=(128,), operations=OPERATIONS, n=10):
+        """
+        Run the benchmark for all combinations of baud rate and packet length, the link settings are
+        restored afterwards.
+        returns: (dict) JSON serializable results
+        """
+        fp = self.fp
+        initial_baud, initial_pkg_len = fp.ser.baudrate, fp.recv_size
+        configs = []
+        for baud in bauds:
+            for pkg_len in pkg_lens:
+                if fp.ser.baudrate != baud and fp.set_baud(baud):
+                    configs.append({'baud': baud, 'pkg_len': pkg_len, 'error': 'set_baud failed'})
+                    continue
+                if fp.recv_size != pkg_len and fp.set_pkg_length(pkg_len):
+                    configs.append({'baud': baud, 'pkg_len': pkg_len, 'error': 'set_pkg_length failed'})
+                    continue
+                configs.append(dict(baud=baud, pkg_len=pkg_len, **self.run_config(operations, n)))
+        fp.set_pkg_length(initial_pkg_len)
+        fp.set_baud(initial_baud)
+        return {'date': strftime('%Y-%m-%dT%H:%M:%S'), 'n': n, 'simulated': self.sim is not None,
+                'configs': configs}
+
+
+def compare(new, old, threshold=.1):
+    """
+    Compare two benchmark results (same configurations) by the p95 latency of each operation.
+    returns: (list) regressions as (baud, pkg_len, operation, old p95, new p95)
+    """
+    old_configs = {(c['baud'], c['pkg_len']): c for c in old['configs'] if 'operations' in c}
+    regressions = []
+    for c in new['configs']:
+        o = old_configs.get((c['baud'], c['pkg_len']))
+        if o is None or 'operations' not in c:
+            continue
+        for name, s in c['operations'].items():
+            p_old, p_new = o['operations'].get(name, {}).get('p95'), s['p95']
+            if p_old and p_new and p_new > p_old * (1 + threshold):
+                regressions.append((c['baud'], c['pkg_len'], name, p_old, p_new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='R503 driver benchmark')
+    parser.add_argument('--port', help='serial port of a real module')
+    parser.add_argument('--sim', action='store_true', help='run against the virtual module')
+    parser.add_argument('--time-scale', type=float, default=1.0, help='timing factor of the virtual module')
+    parser.add_argument('--bauds', default='57600', help='comma separated baud rates')
+    parser.add_argument('--pkg-lens', default='128', help='comma separated packet lengths')
+    parser.add_argument('--ops', default=','.join(OPERATIONS), help='comma separated operations')
+    parser.add_argument('-n', type=int, default=10, help='repetitions per operation')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    sim = None
+    if args.sim:
+        from r503_sim import VirtualR503, SimSerial
+        sim = VirtualR503(time_scale=args.time_scale)
+        fp = R503(port=SimSerial(sim))
+    elif args.port:
+        fp = R503(port=int(args.port) if args.port.isdigit() else args.port)
+    else:
+        parser.error('either --port or --sim is required')
+
+    results = Bench(fp, sim).run([int(b) for b in args.bauds.split(',')], [int(p) for p in args.pkg_lens.split(',')],
+                                 args.ops.split(','), args.n)
+    for c in results['configs']:
+        print(f"baud {c['baud']}, packet length {c['pkg_len']}: {c.get('error', '')}")
+        for name, s in c.get('operations', {}).items():
+            print(f"  {name:18s} p50 {s['p50'] * 1000:8.1f} ms  p95 {s['p95'] * 1000:8.1f} ms  "
+                  f"p99 {s['p99'] * 1000:8.1f} ms  timeout wait {s['timeout_wait']:.2f} s")
+        for name, bps in c.get('throughput_bytes_per_s', {}).items():
+            print(f'  {name:18s} {bps:10.0f} bytes/s')
+    fp.ser_close()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        for baud, pkg_len, name, p_old, p_new in regressions:
+            print(f'REGRESSION baud {baud} packet length {pkg_len} {name}: p95 {p_old * 1000:.1f} -> {p_new * 1000:.1f} ms')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
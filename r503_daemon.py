@@ -0,0 +1,343 @@
+# Daemon sharing one GROW R503 fingerprint module between processes over a Unix-domain socket.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# Only one process can hold the serial port. R503Daemon keeps it open and runs the commands of any number of
+# clients one after the other, highest priority first. A request whose deadline passed while it was queued is
+# answered with an error instead of being run. Identical read-only queries (read_sys_para,
+# read_valid_template_num, ...) that are queued at the same time are run once and the result is sent to every
+# client that asked. Uploaded images are received into one buffer and sent from it to the caller and to all
+# image subscribers.
+#
+#   python r503_daemon.py /dev/ttyUSB0 /tmp/r503.sock
+#
+#   from r503_daemon import R503Client
+#   fp = R503Client('/tmp/r503.sock', deadline=2)
+#   fp.led_control(ctrl=1, color=2)
+#   fp.call('auto_identify', priority=5, deadline=15)
+#
+# Every message is a 4 byte big-endian length and a JSON object, optionally followed by 'size' bytes of binary
+# data (images). Requests: {"id", "method", "args", "kwargs", "priority", "deadline"}, responses: {"id",
+# "result"} or {"id", "error"}. Bytes in arguments and results are sent as {"$bytes": "<hex>"}.
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import socket
+import sys
+from struct import pack, unpack
+from threading import Condition, Lock, Thread
+from time import monotonic
+
+from r503 import R503, to_json, from_json
+
+COMMANDS = {
+    'cancel', 'led_control', 'set_security', 'read_sys_para', 'read_sys_para_decode', 'verify_pw', 'handshake',
+    'check_sensor', 'load_char', 'get_img', 'get_image_ex', 'img2tz', 'reg_model', 'store', 'delete_char',
+    'delete_many', 'compact', 'match', 'search', 'search_char', 'identify', 'empty_finger_lib',
+    'read_valid_template_num', 'read_index_table', 'used_count', 'free_ranges', 'get_available_location',
+    'auto_enroll', 'auto_identify', 'read_prod_info_decode', 'get_fw_ver', 'get_alg_ver', 'get_random_code',
+    'write_notepad', 'read_notepad', 'read_info_page', 'up_char', 'down_char', 'image_size',
+}
+READ_ONLY = {
+    'read_sys_para', 'read_sys_para_decode', 'read_valid_template_num', 'read_index_table', 'used_count',
+    'free_ranges', 'get_available_location', 'read_prod_info_decode', 'get_fw_ver', 'get_alg_ver', 'read_notepad',
+    'read_info_page', 'image_size', 'handshake', 'check_sensor',
+}
+
+
+def send_msg(sock, msg, data=None):
+    """
+    Send one message, 'data' (bytes-like) is sent as is after the JSON part
+    """
+    if data is not None:
+        msg['size'] = len(data)
+    body = json.dumps(msg).encode()
+    sock.sendall(pack('>I', len(body)) + body)
+    if data is not None:
+        sock.sendall(data)
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    pos = 0
+    while pos < size:
+        n = sock.recv_into(view[pos:])
+        if not n:
+            raise ConnectionError('connection closed')
+        pos += n
+    return buffer
+
+
+def recv_msg(sock):
+    """
+    returns: (dict) the next message, the binary data (if any) is in msg['data']
+    """
+    msg = json.loads(bytes(_recv_exact(sock, unpack('>I', _recv_exact(sock, 4))[0])))
+    if 'size' in msg:
+        msg['data'] = _recv_exact(sock, msg['size'])
+    return msg
+
+
+class _Client:
+    """
+    Connection of one client on the daemon side
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = Lock()
+        self.open = True
+
+    def send(self, msg, data=None):
+        if not self.open:
+            return
+        try:
+            with self.lock:
+                send_msg(self.sock, msg, data)
+        except OSError:
+            self.open = False
+
+
+class _Job:
+    __slots__ = ('priority', 'method', 'args', 'kwargs', 'waiters', 'key')
+
+    def __init__(self, priority, method, args, kwargs, waiters, key):
+        self.priority, self.method = priority, method
+        self.args, self.kwargs, self.waiters, self.key = args, kwargs, waiters, key
+
+
+class R503Daemon:
+    """
+    Serves one R503 instance on a Unix-domain socket, all commands run in a single device thread.
+    """
+
+    def __init__(self, fp, path):
+        """
+        Parameters:
+          fp (R503): The module, owned by the daemon from now on
+          path (str): File name of the socket
+        """
+        self.fp = fp
+        self.path = path
+        self.queue = []          # heap of (-priority, sequence number, job)
+        self.merge = {}          # (method, arguments) => queued read-only job
+        self.cond = Condition()
+        self.counter = itertools.count()
+        self.subscribers = []    # clients receiving every uploaded image
+        self.image = None        # receive buffer of up_image, allocated once
+        self.running = True
+        if os.path.exists(path):
+            os.remove(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+
+    def serve_forever(self):
+        """
+        Accept clients until shutdown(), the device thread runs next to it
+        """
+        device = Thread(target=self._device_loop, name='r503-device', daemon=True)
+        device.start()
+        try:
+            while self.running:
+                try:
+                    sock, _ = self.server.accept()
+                except OSError:
+                    break
+                Thread(target=self._client_loop, args=(_Client(sock),), daemon=True).start()
+        finally:
+            self.shutdown()
+            device.join()
+
+    def shutdown(self):
+        """
+        Stop accepting clients and stop the device thread after the running command
+        """
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)  # wakes up a blocked accept()
+        except OSError:
+            pass
+        self.server.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _client_loop(self, client):
+        try:
+            while True:
+                msg = recv_msg(client.sock)
+                method = msg.get('method')
+                if method == 'subscribe_images':
+                    self.subscribers.append(client)
+                    client.send({'id': msg.get('id'), 'result': 0})
+                elif method != 'up_image' and method not in COMMANDS:
+                    client.send({'id': msg.get('id'), 'error': f'unknown command {method!r}'})
+                else:
+                    self.submit(client, msg)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            client.open = False
+            if client in self.subscribers:
+                self.subscribers.remove(client)
+            client.sock.close()
+
+    def submit(self, client, msg):
+        """
+        Queue a request, merging it into an identical queued read-only request
+        """
+        method, args, kwargs = msg['method'], from_json(msg.get('args', [])), from_json(msg.get('kwargs', {}))
+        priority = msg.get('priority', 0)
+        deadline = None if msg.get('deadline') is None else monotonic() + msg['deadline']
+        waiter = (client, msg.get('id'), deadline)
+        with self.cond:
+            key = (method, json.dumps(msg.get('args', [])), json.dumps(msg.get('kwargs', {}), sort_keys=True))
+            job = self.merge.get(key) if method in READ_ONLY else None
+            if job is not None:
+                job.waiters.append(waiter)
+                if priority > job.priority:  # requeue with the higher priority, the old entry is skipped
+                    job.priority = priority
+                    heapq.heappush(self.queue, (-priority, next(self.counter), job))
+            else:
+                job = _Job(priority, method, args, kwargs, [waiter], key if method in READ_ONLY else None)
+                if job.key is not None:
+                    self.merge[key] = job
+                heapq.heappush(self.queue, (-priority, next(self.counter), job))
+            self.cond.notify()
+
+    def _next_job(self):
+        with self.cond:
+            while self.running:
+                while self.queue:
+                    priority, _, job = heapq.heappop(self.queue)
+                    if -priority != job.priority or not job.waiters:
+                        continue  # superseded by a requeue with a higher priority
+                    if job.key is not None:
+                        del self.merge[job.key]
+                    waiters = job.waiters
+                    job.waiters = []  # later identical requests start a new job
+                    return job, waiters
+                self.cond.wait()
+            return None, []
+
+    def _device_loop(self):
+        while True:
+            job, waiters = self._next_job()
+            if job is None:
+                return
+            now = monotonic()
+            expired = [w for w in waiters if w[2] is not None and w[2] < now]
+            for client, msg_id, _ in expired:
+                client.send({'id': msg_id, 'error': 'deadline expired'})
+            waiters = [w for w in waiters if w not in expired]
+            if waiters:
+                self._run(job, waiters)
+
+    def _run(self, job, waiters):
+        try:
+            if job.method == 'up_image':
+                self._up_image(job, waiters)
+                return
+            result, error = to_json(getattr(self.fp, job.method)(*job.args, **job.kwargs)), None
+        except Exception as e:  # a bad argument must not stop the daemon
+            result, error = None, f'{type(e).__name__}: {e}'
+        for client, msg_id, _ in waiters:
+            client.send({'id': msg_id, 'error': error} if error else {'id': msg_id, 'result': result})
+
+    def _up_image(self, job, waiters):
+        if self.image is None:
+            width, height = self.fp.image_size()
+            self.image = bytearray(width * height // 2)
+        conf_code, n = self.fp.up_image_into(self.image, *job.args, **job.kwargs)
+        data = memoryview(self.image)[:n] if not conf_code else None
+        for client, msg_id, _ in waiters:
+            client.send({'id': msg_id, 'result': conf_code}, data)
+        if data is not None:
+            for client in list(self.subscribers):
+                client.send({'id': None, 'event': 'image'}, data)
+
+
+class R503Client:
+    """
+    Client of R503Daemon. Commands can be called like methods of R503, results come back as JSON values
+    (tuples become lists).
+    """
+
+    def __init__(self, path, priority=0, deadline=None):
+        """
+        Parameters:
+          path (str): File name of the daemon socket
+          priority (int): Default priority of the requests, higher runs first
+          deadline (float): Default number of seconds a request may wait in the queue, None for no limit
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.priority = priority
+        self.deadline = deadline
+        self.ids = itertools.count(1)
+
+    def close(self):
+        self.sock.close()
+
+    def call(self, method, *args, priority=None, deadline=None, **kwargs):
+        """
+        Run a command on the daemon's module.
+        returns: the result of the command; up_image returns the confirmation code and the image data (bytes)
+        raises: RuntimeError if the daemon reports an error (unknown command, deadline expired, exception)
+        """
+        msg_id = next(self.ids)
+        send_msg(self.sock, {'id': msg_id, 'method': method, 'args': to_json(list(args)), 'kwargs': to_json(kwargs),
+                             'priority': self.priority if priority is None else priority,
+                             'deadline': self.deadline if deadline is None else deadline})
+        while True:
+            msg = recv_msg(self.sock)
+            if msg.get('id') == msg_id:
+                break
+        if 'error' in msg:
+            raise RuntimeError(msg['error'])
+        if 'data' in msg or method == 'up_image':
+            return msg['result'], msg.get('data')
+        return from_json(msg['result'])
+
+    def __getattr__(self, name):
+        if name not in COMMANDS and name != 'up_image':
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    def images(self):
+        """
+        Subscribe to the images uploaded by any client, use a separate client for this.
+        yields: (bytearray) packed image data, see r503.unpack_image()
+        """
+        self.call('subscribe_images')
+        while True:
+            msg = recv_msg(self.sock)
+            if msg.get('event') == 'image':
+                yield msg['data']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Share an R503 module over a Unix-domain socket')
+    parser.add_argument('port', help='serial port of the module')
+    parser.add_argument('socket', help='file name of the socket')
+    parser.add_argument('--baud', type=int, default=57600)
+    parser.add_argument('--link-file', help='link settings written by R503.tune_link()')
+    args = parser.parse_args(argv)
+    fp = R503(int(args.port) if args.port.isdigit() else args.port, baud=args.baud, link_file=args.link_file)
+    daemon = R503Daemon(fp, args.socket)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        daemon.shutdown()
+    fp.ser_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+# Memory-mapped image dataset for GROW R503 fingerprint modules.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# ImageDataset stores captured images in one pre-sized file, nibble-packed as the sensor sends them
+# (width * height / 2 bytes per image). The file is a 64 byte header followed by fixed size slots, each one a
+# 24 byte index record (capture time, sensor serial number, confirmation code) and the image data:
+#
+#   header: magic 'R503IMG1', width, height, capacity, count
+#   slot:   '<d8sB7x' time (float, seconds since the epoch), serial (8 bytes), conf_code, image data
+#
+# Images are uploaded directly into their slot of the memory map and read back as memoryviews of the map,
+# so neither capturing nor reading copies image data and RAM use does not grow with the dataset.
+#
+#   ds = ImageDataset('captures.r503img', capacity=100000)
+#   ds.capture(fp)
+#   pixels = unpack_image(ds.image(0))
+
+import mmap
+import os
+from struct import calcsize, pack, pack_into, unpack_from
+from time import time
+
+from r503 import np, _require_numpy
+
+MAGIC = b'R503IMG1'
+HEADER = '<8sHHII'       # magic, width, height, capacity, count
+HEADER_SIZE = 64
+RECORD = '<d8sB7x'       # time, serial number, confirmation code
+RECORD_SIZE = calcsize(RECORD)
+
+
+class ImageDataset:
+    """
+    Append-only, memory-mapped file of packed sensor images with an index record per image.
+    """
+
+    def __init__(self, path, capacity=1000, width=192, height=192):
+        """
+        Open a dataset file, or create it with room for 'capacity' images.
+        Parameters:
+          path (str): File name
+          capacity (int): Number of image slots of a new file, the file grows by doubling when full
+          width, height (int): Image geometry of a new file (see R503.image_size()), ignored for existing files
+        """
+        self.path = path
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(pack(HEADER, MAGIC, width, height, capacity, 0).ljust(HEADER_SIZE, b'\x00'))
+                f.truncate(HEADER_SIZE + capacity * (RECORD_SIZE + width * height // 2))
+        self.file = open(path, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        magic, self.width, self.height, self.capacity, self.count = unpack_from(HEADER, self.mm)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not an R503 image dataset')
+        self.img_size = self.width * self.height // 2
+        self.slot_size = RECORD_SIZE + self.img_size
+        self.serials = {}  # id(R503) => serial number, read once per module
+        self.spare = None  # receive buffer of capture() while the file is full
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Write the map back and close the file, views returned by image() must be released before
+        """
+        if self.mm is not None:
+            self.mm.flush()
+            self.mm.close()
+            self.mm = None
+        self.file.close()
+
+    def flush(self):
+        self.mm.flush()
+
+    def _offset(self, i):
+        return HEADER_SIZE + i * self.slot_size
+
+    def grow(self, capacity):
+        """
+        Enlarge the file to 'capacity' slots and map it again.
+        Views returned by image() keep the old map alive, BufferError is raised if any still exists.
+        """
+        if capacity <= self.capacity:
+            return
+        self.mm.close()
+        self.file.truncate(HEADER_SIZE + capacity * self.slot_size)
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.capacity = capacity
+        pack_into('<I', self.mm, 12, capacity)
+
+    def _reserve(self):
+        if self.count == self.capacity:
+            self.grow(2 * self.capacity)
+        return self.count
+
+    def _commit(self, i, serial, conf_code, timestamp):
+        pack_into(RECORD, self.mm, self._offset(i), time() if timestamp is None else timestamp,
+                  serial.encode()[:8] if isinstance(serial, str) else bytes(serial)[:8], conf_code)
+        self.count = i + 1
+        pack_into('<I', self.mm, 16, self.count)  # the image is complete before it is counted
+
+    def append(self, data, serial='', conf_code=0, timestamp=None):
+        """
+        Add an image.
+        parameters: data - packed image (bytes-like object or list of packet data as returned by up_image())
+                    serial (str) - serial number of the sensor
+                    conf_code (int) - confirmation code of the capture
+                    timestamp (float) - capture time, default now
+        returns: (int) index of the image
+        """
+        if isinstance(data, list):
+            data = b''.join(data)
+        if len(data) != self.img_size:
+            raise ValueError(f'image has {len(data)} bytes, expected {self.img_size}')
+        i = self._reserve()
+        start = self._offset(i) + RECORD_SIZE
+        self.mm[start:start + self.img_size] = data
+        self._commit(i, serial, conf_code, timestamp)
+        return i
+
+    def capture(self, fp, keep_failed=False, timeout=5):
+        """
+        Capture an image with get_img() and upload it straight into the next slot of the file.
+        A slot is only used, and the file only grown, for a complete image (or a failure kept with keep_failed).
+        If the file is full, the image is received into a spare buffer first and copied after growing the file.
+        parameters: fp (R503) - the module, its serial number is read once
+                    keep_failed (bool) - also add an (empty) entry for failed captures, to keep failure statistics
+        returns: (tuple) confirmation code (of get_img, or of the upload), index of the image or None
+        """
+        serial = self.serials.get(id(fp))
+        if serial is None:
+            info = fp.read_prod_info_decode()
+            serial = self.serials[id(fp)] = '' if isinstance(info, int) else info['serial number'].strip('\x00 ')
+        timestamp = time()
+        conf_code = fp.get_img()
+        spare = None
+        if not conf_code:
+            if self.count < self.capacity:  # the next slot exists: receive into it, it is counted on success only
+                start = self._offset(self.count) + RECORD_SIZE
+                with memoryview(self.mm) as view:
+                    conf_code, n = fp.up_image_into(view[start:start + self.img_size], timeout)
+            else:
+                spare = self.spare = self.spare or bytearray(self.img_size)
+                conf_code, n = fp.up_image_into(spare, timeout)
+            if not conf_code and n != self.img_size:
+                conf_code = 15  # 0Fh: image upload failed
+        if conf_code and not keep_failed:
+            return conf_code, None
+        i = self._reserve()
+        start = self._offset(i) + RECORD_SIZE
+        if conf_code:
+            self.mm[start:start + self.img_size] = bytes(self.img_size)
+        elif spare is not None:
+            self.mm[start:start + self.img_size] = spare
+        self._commit(i, serial, conf_code, timestamp)
+        return conf_code, i
+
+    def record(self, i):
+        """
+        returns: (tuple) time, serial number (str), confirmation code of image i
+        """
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        timestamp, serial, conf_code = unpack_from(RECORD, self.mm, self._offset(i))
+        return timestamp, serial.rstrip(b'\x00').decode(errors='replace'), conf_code
+
+    def image(self, i):
+        """
+        returns: (memoryview) packed data of image i, a view of the file (no copy), see r503.unpack_image()
+        """
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        start = self._offset(i) + RECORD_SIZE
+        return memoryview(self.mm)[start:start + self.img_size]
+
+    def index(self):
+        """
+        Index records of all images as a numpy structured array, a view of the file (requires numpy)
+        returns: (ndarray) fields 'time', 'serial', 'conf_code'
+        """
+        _require_numpy()
+        dtype = np.dtype({'names': ['time', 'serial', 'conf_code'], 'formats': ['<f8', 'S8', 'u1'],
+                          'offsets': [0, 8, 16], 'itemsize': self.slot_size})
+        return np.ndarray((self.count,), dtype, buffer=self.mm, offset=HEADER_SIZE)
+
+    def images(self):
+        """
+        All packed images as a numpy array of shape (count, width * height / 2), a view of the file
+        (requires numpy); unpack a batch with r503.unpack_images()
+        """
+        _require_numpy()
+        return np.ndarray((self.count, self.img_size), np.uint8, buffer=self.mm, offset=HEADER_SIZE + RECORD_SIZE,
+                          strides=(self.slot_size, 1))
@@ -0,0 +1,245 @@
+# Discovery of GROW R503 fingerprint modules and a cache of their connection settings.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# discover() probes all candidate serial ports in parallel, one thread per port, trying each baud rate with a
+# handshake and verify_pw. The address the module answers with, its packet length and its serial number are
+# read from the replies. The results are cached in a JSON file keyed by the serial number of the module:
+#
+#   {"R503A123": {"port": "/dev/ttyUSB0", "baud": 115200, "addr": 4294967295, "pkg_len": 256}}
+#
+# connect() reconnects from the cache with a single read_prod_info round trip (which also proves that the
+# port still belongs to the same module) and only falls back to a full discovery if that fails.
+# keep_connected() makes an R503 instance reconnect on its own when the USB adapter re-enumerates, e.g. as
+# /dev/ttyUSB1 instead of /dev/ttyUSB0 after being unplugged. Commands and uploads are retried once on the new
+# connection; a download (down_char, down_image) that loses the port fails and is not repeated. Packets that were
+# built for the old connection (e.g. the data packets of restore_library) are rebuilt with the new address.
+#
+#   fp = connect('R503A123', cache_file='r503_ports.json')
+#   keep_connected(fp, 'R503A123', cache_file='r503_ports.json')
+
+import glob
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from platform import system
+from struct import unpack_from
+
+import serial
+
+from r503 import R503
+
+BAUDS = (57600, 115200, 9600, 19200, 38400)
+PKG_LENS = {0: 32, 1: 64, 2: 128, 3: 256}
+
+
+def candidate_ports():
+    """
+    returns: (list) device names of the serial ports present on this computer
+    """
+    try:
+        from serial.tools.list_ports import comports
+        return [p.device for p in comports()]
+    except ImportError:
+        if system() == 'Windows':
+            return [f'COM{n}' for n in range(1, 21)]
+        return sorted(glob.glob('/dev/ttyUSB*') + glob.glob('/dev/ttyACM*'))
+
+
+def load_cache(cache_file):
+    """
+    returns: (dict) serial number => connection settings, empty if the file does not exist
+    """
+    if not cache_file or not os.path.exists(cache_file):
+        return {}
+    with open(cache_file, 'r') as jf:
+        return json.load(jf)
+
+
+def save_cache(cache_file, found):
+    """
+    Add or update the settings of discovered modules in the cache file.
+    parameter: found (dict) - serial number => settings, as returned by discover()
+    """
+    cache = load_cache(cache_file)
+    cache.update(found)
+    with open(cache_file + '.tmp', 'w') as jf:
+        json.dump(cache, jf, indent=2)
+    os.replace(cache_file + '.tmp', cache_file)
+
+
+def probe(port, bauds=BAUDS, pw=0, addr=0xFFFFFFFF, timeout=.3):
+    """
+    Look for a module on one port, trying the baud rates in order.
+    returns: (dict) 'port', 'baud', 'addr', 'pkg_len' and 'serial' of the module, None if none answers
+    """
+    try:
+        fp = R503(port, baud=bauds[0], pw=pw, addr=addr, timeout=timeout)
+    except (serial.SerialException, OSError):
+        return None
+    try:
+        for baud in bauds:
+            fp.ser.baudrate = baud
+            response = fp.ser_send(pkg_len=0x03, instr_code=0x40)  # handshake
+            if response.conf_code == 99 or response.conf_code == 100:
+                continue
+            fp.addr = response.frame[2:6]  # the address the module answers with
+            if fp.verify_pw(pw):
+                return None
+            para, info = fp.read_sys_para(), fp.read_prod_info_decode()
+            if not isinstance(para, tuple) or isinstance(info, int):
+                return None
+            return {'port': port, 'baud': baud, 'addr': int.from_bytes(fp.addr, 'big'),
+                    'pkg_len': PKG_LENS.get(para[5], 128), 'serial': info['serial number'].strip('\x00 ')}
+        return None
+    finally:
+        fp.ser_close()
+
+
+def discover(ports=None, bauds=BAUDS, pw=0, addr=0xFFFFFFFF, timeout=.3, cache_file=None):
+    """
+    Probe all ports in parallel, see probe(). The baud rates of one port are tried one after the other.
+    parameters: ports (list) - device names, default candidate_ports()
+                cache_file (str) - JSON file the results are added to
+    returns: (dict) serial number => 'port', 'baud', 'addr', 'pkg_len' of every module found
+    """
+    ports = candidate_ports() if ports is None else ports
+    if not ports:
+        return {}
+    def probe_port(port):
+        try:
+            return probe(port, bauds, pw, addr, timeout)
+        except Exception:  # a device misbehaving on one port must not stop the scan of the others
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        results = list(executor.map(probe_port, ports))
+    found = {r.pop('serial'): r for r in results if r is not None}
+    if cache_file and found:
+        save_cache(cache_file, found)
+    return found
+
+
+def open_cached(settings, pw=0, timeout=1):
+    """
+    Open a module with cached settings.
+    returns: (R503) the instance, (str) the serial number it reports, or None, None if it does not answer
+    """
+    try:
+        fp = R503(settings['port'], baud=settings['baud'], pw=pw, addr=settings['addr'], timeout=timeout,
+                  recv_size=settings['pkg_len'])
+    except (serial.SerialException, OSError):
+        return None, None
+    info = fp.read_prod_info_decode()
+    if isinstance(info, int):
+        fp.ser_close()
+        return None, None
+    return fp, info['serial number'].strip('\x00 ')
+
+
+def connect(serial_number=None, cache_file='r503_ports.json', pw=0, timeout=1, ports=None, bauds=BAUDS):
+    """
+    Open a module from the cache, discovering it again if the cached settings do not work any more.
+    parameters: serial_number (str) - the module to open, default the first one in the cache / found
+    returns: (R503) the connected instance, None if the module cannot be found
+    """
+    cache = load_cache(cache_file)
+    keys = [serial_number] if serial_number is not None else list(cache)
+    for key in keys:
+        if key in cache:
+            fp, found_serial = open_cached(cache[key], pw, timeout)
+            if fp is not None and found_serial == key:
+                return fp
+            if fp is not None:
+                fp.ser_close()
+    found = discover(ports, bauds, pw, cache_file=cache_file)
+    key = serial_number if serial_number is not None else next(iter(found), None)
+    if key not in found:
+        return None
+    fp, _ = open_cached(found[key], pw, timeout)
+    return fp
+
+
+def keep_connected(fp, serial_number, cache_file='r503_ports.json', pw=0, ports=None, bauds=BAUDS):
+    """
+    Reconnect 'fp' automatically when its serial port disappears or stops answering, e.g. after the USB adapter
+    re-enumerated under another name. A command or upload failing that way is retried once on the new
+    connection, an upload only if it failed before any data was received.
+    returns: fp
+    """
+    exchange, up_raw, receive_stream, write_data = fp._exchange, fp._up_raw, fp._receive_stream, fp._write_data
+
+    def reconnect():
+        new = connect(serial_number, cache_file, pw, fp.ser.timeout, ports, bauds)
+        if new is None:
+            return False
+        try:
+            fp.ser_close()
+        except (serial.SerialException, OSError):
+            pass
+        fp.ser, fp.addr, fp.recv_size = new.ser, new.addr, new.recv_size
+        return True
+
+    def vanished():
+        port = str(getattr(fp.ser, 'port', ''))
+        return port.startswith('/dev/') and not os.path.exists(port)
+
+    def readdress(frames):
+        """
+        returns: (bytes) the packets in 'frames' rebuilt with the current address, 'frames' itself if they carry it
+        """
+        if frames[2:6] == fp.addr:
+            return frames
+        packets, pos = [], 0
+        while pos + 9 <= len(frames):
+            end = pos + 9 + unpack_from('>H', frames, pos + 7)[0]
+            packets.append(fp.make_packet(frames[pos + 6], frames[pos + 9:end - 2]))
+            pos = end
+        return b''.join(packets)
+
+    def reconnecting_exchange(send_values, instr_code, timeout):
+        send_values = readdress(send_values)
+        try:
+            response = exchange(send_values, instr_code, timeout)
+        except (serial.SerialException, OSError):
+            if not reconnect():
+                raise
+        else:
+            if response.conf_code != 99 or not vanished() or not reconnect():
+                return response
+        return exchange(readdress(send_values), instr_code, timeout)
+
+    def reconnecting_up_raw(send_values, timeout):
+        try:
+            result = up_raw(send_values, timeout)
+        except (serial.SerialException, OSError):
+            if not reconnect():
+                raise
+        else:
+            if result != -1 or not vanished() or not reconnect():
+                return result
+        return up_raw(send_values, timeout)
+
+    def reconnecting_stream(send_values, buffer, timeout, received=None):
+        stream = receive_stream(send_values, buffer, timeout, received)
+        try:
+            first = next(stream)
+        except StopIteration as stop:  # failed before the first data packet
+            if stop.value != 99 or not vanished() or not reconnect():
+                return stop.value
+        except (serial.SerialException, OSError):
+            if not reconnect():
+                raise
+        else:
+            yield first
+            return (yield from stream)
+        return (yield from receive_stream(send_values, buffer, timeout, received))
+
+    def readdressed_write(frames):
+        write_data(readdress(frames))
+
+    fp._exchange = reconnecting_exchange
+    fp._up_raw = reconnecting_up_raw
+    fp._receive_stream = reconnecting_stream
+    fp._write_data = readdressed_write
+    return fp
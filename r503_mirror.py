@@ -0,0 +1,135 @@
+# Host-side mirror of the template library of GROW R503 fingerprint modules.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# LibraryMirror keeps one file per template in '<root>/<serial number>/<page id>.bin', the serial number is
+# hex encoded as it may contain any character (see TemplateStore for the same scheme). A sync compares the
+# index table bitmaps of the module with the files on disk and only uploads templates of newly occupied
+# pages and removes the files of deleted pages.
+#
+# Note: the index table only tells which pages are occupied. A page that was deleted and stored again
+# between two syncs is not noticed, use refresh() for pages that are known to have changed.
+
+import os
+
+
+class LibraryMirror:
+    """
+    Incremental on-disk copy of the template library of one or more modules.
+    """
+    index_pages = 4  # each index table page covers 256 template pages
+
+    def __init__(self, root):
+        """
+        Parameters:
+          root (str): Directory holding one sub directory per module serial number
+        """
+        self.root = root
+
+    @staticmethod
+    def serial(fp):
+        """
+        returns: (str) serial number of the module, None if it cannot be read
+        """
+        info = fp.read_prod_info_decode()
+        return None if isinstance(info, int) else info['serial number'].strip('\x00 ') or None
+
+    def path(self, serial, page_id=None):
+        """
+        returns: (str) directory of the module, or file of one template if 'page_id' is given
+        """
+        folder = os.path.join(self.root, serial.encode().hex())
+        return folder if page_id is None else os.path.join(folder, f'{page_id}.bin')
+
+    def mirrored(self, serial):
+        """
+        returns: (set) page ids of all templates mirrored for the module
+        """
+        folder = self.path(serial)
+        if not os.path.isdir(folder):
+            return set()
+        return {int(name[:-4]) for name in os.listdir(folder) if name.endswith('.bin') and name[:-4].isdigit()}
+
+    def read(self, serial, page_id):
+        """
+        returns: (bytes) mirrored template, None if not present
+        """
+        try:
+            with open(self.path(serial, page_id), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def templates(self, serial):
+        """
+        returns: (dict) page id => mirrored template (bytes) of all templates of the module
+        """
+        return {page_id: self.read(serial, page_id) for page_id in sorted(self.mirrored(serial))}
+
+    @classmethod
+    def occupied(cls, fp):
+        """
+        Read all index table pages of the module.
+        returns: (set) occupied page ids, None if a page could not be read (never an empty set in that case)
+        """
+        pages = set()
+        for index_page in range(cls.index_pages):
+            table = fp.read_index_table(index_page)
+            if not isinstance(table, list):
+                return None
+            pages.update(256 * index_page + pos for pos in table)
+        return pages
+
+    def _write(self, serial, page_id, data):
+        os.makedirs(self.path(serial), exist_ok=True)
+        path = self.path(serial, page_id)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def fetch(self, fp, page_id, buffer_id=1):
+        """
+        Upload one template from the module's flash library.
+        returns: (bytes) template data, or the confirmation code (int) of the failing step
+        """
+        conf_code = fp.load_char(page_id, buffer_id)
+        if conf_code:
+            return conf_code
+        char_data = fp.up_char(buffer_id=buffer_id)
+        return char_data if isinstance(char_data, int) else b''.join(char_data)
+
+    def refresh(self, fp, page_ids, serial=None):
+        """
+        Upload the given pages again, regardless of the mirror state.
+        returns: (dict) page id => confirmation code, or 99 if the serial number could not be read
+        """
+        serial = serial or self.serial(fp)
+        if serial is None:
+            return 99
+        results = {}
+        for page_id in page_ids:
+            data = self.fetch(fp, page_id)
+            if not isinstance(data, int):
+                self._write(serial, page_id, data)
+            results[page_id] = data if isinstance(data, int) else 0
+        return results
+
+    def sync(self, fp, serial=None):
+        """
+        Bring the mirror of a module up to date.
+        Only templates of pages that became occupied since the last sync are uploaded,
+        files of pages that are no longer occupied are removed.
+        parameters: fp (R503) - the module
+                    serial (str) - serial number of the module, read from the module if not given
+        returns: (dict) 'added': page id => confirmation code, 'deleted': list of page ids,
+                 or 99 if the serial number or the index table could not be read
+        """
+        serial = serial or self.serial(fp)
+        occupied = None if serial is None else self.occupied(fp)
+        if occupied is None:
+            return 99
+        mirrored = self.mirrored(serial)
+        deleted = sorted(mirrored - occupied)
+        for page_id in deleted:
+            os.remove(self.path(serial, page_id))
+        return {'added': self.refresh(fp, sorted(occupied - mirrored), serial), 'deleted': deleted}
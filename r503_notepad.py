@@ -0,0 +1,214 @@
+# Key/value store in the notepad of GROW R503 fingerprint modules.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# The notepad is 16 flash pages of 32 bytes, read and written one page per command. NotepadStore reads the
+# pages once into a host-side cache, keeps typed values packed back to back across page boundaries and on
+# flush() writes only the pages whose bytes changed.
+#
+#   store = NotepadStore(fp)          # reads all pages once
+#   store['site'] = 'gate 3'
+#   store['relay_ms'] = 1500
+#   store.flush()                     # writes the changed pages only
+#
+# Layout of the used pages, taken as one byte string: b'NP', format version, data length (2 bytes), then per
+# entry: key length, key (UTF-8), type, value length, value. Types: None, bool, int (signed, as few bytes as
+# needed), float (8 bytes), str (UTF-8), bytes. Keys keep their order, a new key is appended at the end, so
+# adding or changing a value at the end of the store only rewrites the pages it occupies (and the first page,
+# which holds the data length).
+
+from struct import error as StructError, pack, unpack_from
+
+MAGIC = b'NP\x01'
+TYPES = (type(None), bool, int, float, str, bytes)
+
+
+def _encode_value(value):
+    if value is None:
+        return 0, b''
+    if isinstance(value, bool):
+        return 1, bytes((value,))
+    if isinstance(value, int):
+        return 2, value.to_bytes((value + (value < 0)).bit_length() // 8 + 1, 'big', signed=True)
+    if isinstance(value, float):
+        return 3, pack('>d', value)
+    if isinstance(value, str):
+        return 4, value.encode()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return 5, bytes(value)
+    raise TypeError(f'unsupported notepad value type {type(value).__name__}')
+
+
+def _decode_value(kind, data):
+    if kind == 0:
+        return None
+    if kind == 1:
+        return bool(data[0])
+    if kind == 2:
+        return int.from_bytes(data, 'big', signed=True)
+    if kind == 3:
+        return unpack_from('>d', data)[0]
+    if kind == 4:
+        return data.decode()
+    if kind == 5:
+        return bytes(data)
+    raise ValueError(f'unknown notepad value type {kind}')
+
+
+def encode(entries):
+    """
+    returns: (bytes) the packed representation of a dict (keys: str, values: see TYPES)
+    """
+    body = bytearray()
+    for key, value in entries.items():
+        key_data = key.encode()
+        kind, data = _encode_value(value)
+        if len(key_data) > 255 or len(data) > 255:
+            raise ValueError(f'notepad key or value too long: {key!r}')
+        body += bytes((len(key_data),)) + key_data + bytes((kind, len(data))) + data
+    return MAGIC + pack('>H', len(body)) + body
+
+
+def decode(blob):
+    """
+    returns: (dict) the entries of a packed notepad, empty if it does not hold a store
+    raises: ValueError if it holds a damaged store (truncated entries, unknown types, invalid UTF-8)
+    """
+    if not blob.startswith(MAGIC) or len(blob) < len(MAGIC) + 2:
+        return {}
+    end = len(MAGIC) + 2 + unpack_from('>H', blob, len(MAGIC))[0]
+    if end > len(blob):
+        raise ValueError('damaged notepad store: data length exceeds the pages')
+    entries, pos = {}, len(MAGIC) + 2
+    try:
+        while pos < end:
+            key_len = blob[pos]
+            key = bytes(blob[pos + 1:pos + 1 + key_len]).decode()
+            pos += 1 + key_len
+            kind, size = blob[pos], blob[pos + 1]
+            if pos + 2 + size > end:
+                raise IndexError(pos)
+            entries[key] = _decode_value(kind, blob[pos + 2:pos + 2 + size])
+            pos += 2 + size
+    except (IndexError, UnicodeDecodeError, StructError) as e:
+        raise ValueError(f'damaged notepad store at byte {pos}') from e
+    return entries
+
+
+class NotepadStore:
+    """
+    Host-cached key/value store over the notepad pages of one module.
+    """
+    page_size = 32
+
+    def __init__(self, fp, pages=range(16), load=True):
+        """
+        Parameters:
+          fp (R503): The module
+          pages (iterable): Notepad pages used by the store, in order (keep others free for other data)
+          load (bool): Read the pages right away, see load(); check 'loaded' afterwards
+        """
+        self.fp = fp
+        self.pages = list(pages)
+        self.capacity = len(self.pages) * self.page_size
+        self.cache = bytearray(self.capacity)  # page contents as last read or written
+        self.entries = {}
+        self.loaded = False  # flush() is refused until the pages have been read completely
+        if load:
+            self.load()
+
+    def load(self):
+        """
+        Read all pages of the store into the cache, one command per page.
+        Pages without a store (e.g. never written) give an empty store. If a page cannot be read, the store
+        stays unloaded and flush() is refused, so a failed read can never overwrite the stored entries.
+        returns: (int) confirmation code, 0 if all pages were read
+        raises: ValueError if the pages hold a damaged store, see reset()
+        """
+        self.loaded = False
+        for i, page in enumerate(self.pages):
+            result = self.fp.read_notepad(page)
+            if result == -1 or result[0] or result[1] is None:
+                return 101 if result == -1 else result[0] or 1
+            self.cache[self._slice(i)] = result[1][:self.page_size].ljust(self.page_size, b'\x00')
+        self.entries = decode(self.cache)
+        self.loaded = True
+        return 0
+
+    def reset(self):
+        """
+        Start over with an empty store, e.g. after load() reported a damaged one.
+        The next flush() writes all pages of the store.
+        """
+        self.entries = {}
+        self.cache[:] = b'\xff' * self.capacity  # unknown content: every page differs from the new image
+        self.loaded = True
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def __setitem__(self, key, value):
+        if not isinstance(value, TYPES) and not isinstance(value, (bytearray, memoryview)):
+            raise TypeError(f'unsupported notepad value type {type(value).__name__}')
+        old = self.entries.get(key, self)
+        self.entries[key] = value
+        if len(encode(self.entries)) > self.capacity:
+            if old is self:
+                del self.entries[key]
+            else:
+                self.entries[key] = old
+            raise ValueError(f'notepad full, {key!r} does not fit')
+
+    def __delitem__(self, key):
+        del self.entries[key]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def items(self):
+        return self.entries.items()
+
+    def update(self, values):
+        for key, value in dict(values).items():
+            self[key] = value
+
+    def _slice(self, i):
+        return slice(i * self.page_size, (i + 1) * self.page_size)
+
+    def _image(self):
+        return encode(self.entries).ljust(self.capacity, b'\x00')
+
+    def dirty_pages(self):
+        """
+        returns: (list) notepad pages whose content differs from the cache
+        """
+        image = self._image()
+        return [page for i, page in enumerate(self.pages) if image[self._slice(i)] != self.cache[self._slice(i)]]
+
+    def flush(self):
+        """
+        Write the changed pages back to the module, one command per page.
+        returns: (dict) page => confirmation code of every page written (empty if nothing changed)
+        raises: RuntimeError if the store has not been loaded successfully
+        """
+        if not self.loaded:
+            raise RuntimeError('notepad store not loaded, flush() would overwrite the stored entries')
+        image = self._image()
+        results = {}
+        for i, page in enumerate(self.pages):
+            data = image[self._slice(i)]
+            if data == self.cache[self._slice(i)]:
+                continue
+            results[page] = self.fp.write_notepad(page, data)
+            if results[page] == 0:
+                self.cache[self._slice(i)] = data
+        return results
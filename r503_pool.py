@@ -0,0 +1,165 @@
+# Sharded pool of GROW R503 fingerprint modules.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# R503Pool spreads one template library over several modules. Every module (shard) keeps its own flash
+# library, the pool maps global template IDs to (shard, page) pairs. A finger is captured on one module,
+# its character file is uploaded and then searched on all shards in parallel, one thread per shard.
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from r503 import R503
+
+
+class R503Pool:
+    """
+    Pool of R503 modules sharing one global template ID space.
+    Shard i holds the global IDs offsets[i] .. offsets[i] + capacities[i] - 1.
+    """
+
+    def __init__(self, sensors, capacity=None, **kwargs):
+        """
+        Parameters:
+          sensors (list): R503 instances or ports (int or str) to open with R503(port, **kwargs)
+          capacity (int): Library size of each module, default is the 'fp database size' reported
+                          by read_prod_info_decode() (200 if it cannot be read)
+        """
+        self.sensors = [s if isinstance(s, R503) else R503(s, **kwargs) for s in sensors]
+        self.locks = [Lock() for _ in self.sensors]
+        self.capacities = []
+        for fp in self.sensors:
+            info = fp.read_prod_info_decode() if capacity is None else None
+            self.capacities.append(capacity or (200 if info is None or isinstance(info, int) else info['fp database size']))
+        self.offsets = [sum(self.capacities[:i]) for i in range(len(self.sensors))]
+        self.executor = ThreadPoolExecutor(max_workers=len(self.sensors))
+
+    def close(self):
+        """
+        Stop the worker threads and close all serial ports
+        """
+        self.executor.shutdown()
+        for fp in self.sensors:
+            fp.ser_close()
+
+    def size(self):
+        """
+        returns: (int) total library capacity of the pool
+        """
+        return sum(self.capacities)
+
+    def to_global(self, shard, page_id):
+        """
+        returns: (int) global template ID of 'page_id' on 'shard'
+        """
+        return self.offsets[shard] + page_id
+
+    def to_local(self, gid):
+        """
+        returns: (tuple) shard index, page id of the global template ID, None if out of range
+        """
+        for shard, (offset, capacity) in enumerate(zip(self.offsets, self.capacities)):
+            if offset <= gid < offset + capacity:
+                return shard, gid - offset
+        return None
+
+    def _run(self, shard, func, *args, **kwargs):
+        with self.locks[shard]:
+            return func(self.sensors[shard], *args, **kwargs)
+
+    def fan_out(self, func, *args, shards=None, **kwargs):
+        """
+        Run func(sensor, *args, **kwargs) on the given shards (default: all) in parallel.
+        Calls on the same module are serialized.
+        returns: (list) results in the order of 'shards'
+        """
+        shards = range(len(self.sensors)) if shards is None else shards
+        futures = [self.executor.submit(self._run, shard, func, *args, **kwargs) for shard in shards]
+        return [f.result() for f in futures]
+
+    def capture(self, reader=0, buffer_id=1):
+        """
+        Capture a finger on module 'reader' and upload its character file.
+        returns: (list) template packets (see R503.up_char), or the confirmation code of the failing step
+        """
+        def capture_on(fp):
+            conf_code = fp.get_image_ex() or fp.img2tz(buffer_id)
+            return conf_code or fp.up_char(buffer_id=buffer_id)
+        return self._run(reader, capture_on)
+
+    def search(self, template):
+        """
+        Search a character file on all shards in parallel.
+        parameters: template (list) - template packets as returned by capture() / R503.up_char()
+        returns: (tuple) global template ID, match score of the best match, or None if no shard matches
+        """
+        def search_on(fp, capacity):
+            conf_code = fp.down_char(template, buffer_id=1)
+            return conf_code if conf_code else fp.search_char(1, 0, capacity)
+
+        futures = [self.executor.submit(self._run, shard, search_on, capacity)
+                   for shard, capacity in enumerate(self.capacities)]
+        best = None
+        for shard, f in enumerate(futures):
+            result = f.result()
+            if isinstance(result, tuple) and result[0] == 0 and (best is None or result[2] > best[1]):
+                best = self.to_global(shard, result[1]), result[2]
+        return best
+
+    def identify(self, reader=0):
+        """
+        Capture a finger on module 'reader' and search it on all shards.
+        returns: (tuple) global template ID, match score; None if there is no match,
+                 or the confirmation code if the capture failed
+        """
+        template = self.capture(reader)
+        return template if isinstance(template, int) else self.search(template)
+
+    def free_location(self):
+        """
+        returns: (int) lowest free global template ID, None if the pool is full
+        """
+        for shard, page_id in enumerate(self.fan_out(R503.get_available_location)):
+            if page_id is not None and page_id < self.capacities[shard]:
+                return self.to_global(shard, page_id)
+        return None
+
+    def enroll(self, template, gid=None):
+        """
+        Store a template in the pool.
+        parameters: template (list) - template packets, e.g. from R503.up_char() after reg_model()
+                    gid (int) - global template ID, default is the lowest free one
+        returns: (tuple) confirmation code, global template ID
+                 confirmation code 31 (library full) if no ID is free, 11 if 'gid' is out of range
+        """
+        gid = self.free_location() if gid is None else gid
+        if gid is None:
+            return 31, None
+        loc = self.to_local(gid)
+        if loc is None:
+            return 11, gid
+
+        def store_on(fp, page_id):
+            return fp.down_char(template, buffer_id=1) or fp.store(buffer_id=1, page_id=page_id)
+
+        return self._run(loc[0], store_on, loc[1]), gid
+
+    def delete(self, gids):
+        """
+        Delete templates by global ID, the shards are processed in parallel.
+        returns: (dict) global template ID => confirmation code
+        """
+        by_shard = {}
+        for gid in gids:
+            loc = self.to_local(gid)
+            if loc is not None:
+                by_shard.setdefault(loc[0], []).append((gid, loc[1]))
+
+        def delete_on(fp, items):
+            return {gid: fp.delete_char(page_id) for gid, page_id in items}
+
+        results = {gid: 11 for gid in gids}  # 0Bh: beyond the finger library
+        futures = [self.executor.submit(self._run, shard, delete_on, items) for shard, items in by_shard.items()]
+        for f in futures:
+            results.update(f.result())
+        return results
@@ -0,0 +1,155 @@
+# Recording and replay of the serial traffic of GROW R503 fingerprint modules.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# RecordingSerial wraps the serial object of an R503 instance and logs every write and every (non-empty) read
+# with its time. ReplaySerial plays a recording back to an R503 instance: each write is matched with the next
+# recorded write, and the bytes received after it are delivered with the recorded delays, scaled by 'speed'
+# (1: original timing, 0: as fast as possible) and capped at 'max_gap' seconds; a read that runs into its timeout
+# waits the timeout scaled the same way. A field incident can be reproduced offline and driver changes can be
+# measured against real traffic.
+#
+#   fp = R503('/dev/ttyUSB0')
+#   fp.ser = RecordingSerial(fp.ser, 'incident.r503rec')
+#   ...
+#   fp = R503(port=ReplaySerial('incident.r503rec', speed=.1))
+#
+# File format: 'R503REC1', then one record per event: '<BIH' kind (0: TX, 1: RX, 2: baud rate change),
+# microseconds since the previous record, data length, followed by the data.
+
+from struct import pack, unpack, calcsize
+from time import monotonic, perf_counter
+
+from r503 import SerialWrapper, ScheduledSerial
+
+MAGIC = b'R503REC1'
+RECORD = '<BIH'
+RECORD_SIZE = calcsize(RECORD)
+TX, RX, BAUD = 0, 1, 2
+
+
+def read_recording(path):
+    """
+    yields: (tuple) seconds since the start of the recording, kind (TX, RX or BAUD), data (bytes)
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not an R503 recording')
+        t = 0.0
+        while True:
+            head = f.read(RECORD_SIZE)
+            if len(head) < RECORD_SIZE:
+                return
+            kind, delta, size = unpack(RECORD, head)
+            t += delta / 1e6
+            yield t, kind, f.read(size)
+
+
+class RecordingSerial(SerialWrapper):
+    """
+    Wrapper of a serial object that logs all traffic to a file, see the format above.
+    """
+
+    def __init__(self, ser, path):
+        """
+        Parameters:
+          ser: The serial object, e.g. R503.ser
+          path (str): File name of the recording, an existing file is overwritten
+        """
+        super().__init__(ser)
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.t_last = perf_counter()
+        self._log(BAUD, pack('<I', getattr(ser, 'baudrate', 0) or 0))
+
+    def _changed(self, name, value):
+        if name == 'baudrate':
+            self._log(BAUD, pack('<I', value))
+
+    def _log(self, kind, data):
+        now = perf_counter()
+        delta = min(int((now - self.t_last) * 1e6), 0xFFFFFFFF)
+        self.t_last = now
+        for pos in range(0, max(len(data), 1), 0xFFFF):  # the length field has 16 bits
+            self.file.write(pack(RECORD, kind, delta, len(data[pos:pos + 0xFFFF])) + data[pos:pos + 0xFFFF])
+            delta = 0
+
+    def write(self, data):
+        self._log(TX, bytes(data))
+        return self.ser.write(data)
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        if data:
+            self._log(RX, data)
+        return data
+
+    def flush(self):
+        self.file.flush()
+        self.ser.flush()
+
+    def close(self):
+        """
+        Close the recording and the serial port
+        """
+        self.file.close()
+        self.ser.close()
+
+
+class ReplaySerial(ScheduledSerial):
+    """
+    Serial object that answers the writes of an R503 instance with the bytes of a recording.
+    """
+
+    def __init__(self, path, speed=1.0, max_gap=None, timeout=1, strict=False):
+        """
+        Parameters:
+          path (str): File written by RecordingSerial
+          speed (float): Factor of the recorded delays, 1 for the original timing, 0 for no delays
+          max_gap (float): Longest delay in seconds (after scaling), None for no limit
+          timeout (float): Read timeout, like serial.Serial; a read running into it waits the scaled timeout
+          strict (bool): Raise ValueError if a write differs from the recorded one (else only counted)
+        """
+        super().__init__(timeout)
+        self.speed, self.max_gap, self.strict = speed, max_gap, strict
+        self.port = path
+        self.baudrate = None
+        self.exchanges = []  # (recorded TX data, [(delay after the TX, RX data), ...])
+        t_tx = 0.0
+        for t, kind, data in read_recording(path):
+            if kind == TX:
+                self.exchanges.append((data, []))
+                t_tx = t
+            elif kind == RX and self.exchanges:
+                self.exchanges[-1][1].append((t - t_tx, data))
+            elif kind == BAUD and self.baudrate is None:
+                self.baudrate = unpack('<I', data)[0]
+        self.position = 0    # next exchange
+        self.pending = []    # [due time, data] of the current exchange
+        self.mismatches = 0
+
+    def _scale(self, delay):
+        delay *= self.speed
+        return delay if self.max_gap is None else min(delay, self.max_gap)
+
+    def write(self, data):
+        data = bytes(data)
+        if self.position >= len(self.exchanges):
+            raise EOFError('end of the recording')
+        recorded, replies = self.exchanges[self.position]
+        self.position += 1
+        if data != recorded:
+            self.mismatches += 1
+            if self.strict:
+                raise ValueError(f'write {self.position - 1} differs from the recording')
+        now = monotonic()
+        self.pending = [[now + self._scale(delay), rx] for delay, rx in replies]
+        return len(data)
+
+    def _fetch(self, now):
+        while self.pending and self.pending[0][0] <= now:
+            self.rx += self.pending.pop(0)[1]
+        return self.pending[0][0] if self.pending else None
+
+    def _timeout_wait(self, timeout):
+        return self._scale(timeout)
@@ -0,0 +1,278 @@
+# Session mode for sharing one GROW R503 fingerprint module between threads.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# Normally every R503 method writes its command and then reads the reply inline, changing the serial timeout
+# for each call, so two threads using the same instance corrupt each other's frames. R503Session moves all
+# reads to one background thread that parses frames continuously and resolves a concurrent.futures.Future per
+# command. Commands are written under a lock and answered in order. The regular R503 methods keep working
+# unchanged and can be called from any thread while the session is open:
+#
+#   session = R503Session(fp)
+#   threading.Thread(target=fp.auto_identify).start()
+#   fp.led_control(ctrl=1, color=2)   # answered while auto_identify still waits for a finger
+#   fp.cancel()                       # ends the auto_identify, which then returns 99
+#   session.close()
+#
+# The module answers its commands one by one and is busy while it runs auto_enroll or auto_identify. Other
+# commands wait for the auto command to finish, except priority commands (cancel, led_control, ...): these
+# preempt it. A cancel ends the auto command, which then returns 99. Any other priority command is sent after
+# a cancel of the auto command, and the auto command is sent again right behind it, so the thread waiting for
+# it does not notice apart from the restarted module timeout.
+#
+# Downloads (down_char, down_image, restore_library, match_stream) are transactions: the data packets follow
+# the acknowledge of the download command. The thread running one owns the module until it is complete,
+# commands of other threads wait for it.
+
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from queue import Queue, Empty
+from struct import pack, unpack
+from threading import Condition, Thread, get_ident
+from time import perf_counter, sleep
+
+from r503 import Response, NO_RESPONSE, CHECKSUM_ERROR, step_reply
+
+
+class R503Session:
+    """
+    Background reader thread and futures based command dispatch for one R503 instance.
+    """
+    long_codes = (0x31, 0x32)        # auto_enroll, auto_identify: wait for a finger on the module
+    priority_codes = (0x30, 0x35, 0x3c, 0x0f, 0x36)  # cancel, led_control, read_prod_info, read_sys_para, check_sensor
+    transport = ('_exchange', '_receive_stream', '_up_raw', '_write_data', '_transaction')  # replaced in the R503
+
+    def __init__(self, fp, poll=.05):
+        """
+        Parameters:
+          fp (R503): The driver instance, its commands are routed through the session until close()
+          poll (float): Serial read timeout of the reader thread in seconds
+        """
+        self.fp = fp
+        self.ser = fp.ser
+        self.poll = poll
+        self.write_lock = Condition()
+        self.pending = deque()  # [instr_code, future, deadline, timeout, packet queue or None, frames], reply order
+        self.cancel_frame = fp.make_packet(0x01, b'\x30')
+        self.rx = bytearray()
+        self.running = True
+        self.owner = None       # thread running a transaction
+        self.depth = 0          # nesting level of the owner's transactions
+        self.ser.timeout = poll
+        self.saved = {name: fp.__dict__[name] for name in self.transport if name in fp.__dict__}
+        for name in self.transport:
+            setattr(fp, name, getattr(self, name))
+        self.thread = Thread(target=self._reader, name='r503-reader', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Stop the reader thread, fail the outstanding commands and give the R503 instance back its inline reads
+        (and any transport wrapper installed before the session, e.g. by r503_discover.keep_connected())
+        """
+        self.running = False
+        self.thread.join()
+        with self.write_lock:
+            while self.pending:
+                self._finish(self.pending.popleft(), NO_RESPONSE)
+        for name in self.transport:
+            if name in self.saved:
+                setattr(self.fp, name, self.saved[name])
+            else:
+                self.fp.__dict__.pop(name, None)
+
+    def submit(self, frames, instr_code, timeout=1, stream=False):
+        """
+        Write complete packets and register the command for the next reply.
+        parameters: frames (bytes) - command packet, optionally followed by data packets
+                    instr_code (int) - instruction code of the command
+                    timeout (float) - seconds to wait for the reply
+                    stream (bool) - the reply is followed by data packets (upload commands)
+        returns: (Future) resolves to the Response, NO_RESPONSE on timeout, CHECKSUM_ERROR on a bad checksum;
+                 stream commands return (Future, Queue), the queue receives the acknowledge and the data packets
+                 (None for a bad checksum, NO_RESPONSE on timeout), 'timeout' then applies to each packet
+        """
+        entry = [instr_code, Future(), perf_counter() + timeout, timeout, Queue() if stream else None, frames]
+        me = get_ident()
+        with self.write_lock:
+            self.write_lock.wait_for(lambda: self.owner in (None, me)
+                                     and (instr_code in self.priority_codes or not self._running_auto()))
+            entry[2] = perf_counter() + timeout
+            auto = self._running_auto()
+            if auto is None:
+                self.pending.append(entry)
+            elif instr_code == 0x30:
+                self.pending.insert(self.pending.index(auto), entry)
+            else:  # cancel the auto command, run this one, then start the auto command again
+                pos = self.pending.index(auto)
+                self.pending.insert(pos, entry)
+                self.pending.insert(pos, [0x30, Future(), perf_counter() + 1, 1, None, self.cancel_frame])
+                auto[2] = perf_counter() + auto[3]
+                frames = self.cancel_frame + frames + auto[5]
+            self.ser.write(frames)
+        return (entry[1], entry[4]) if stream else entry[1]
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Own the module for a sequence of commands and data packets, see R503._transaction()
+        """
+        me = get_ident()
+        with self.write_lock:
+            self.write_lock.wait_for(lambda: self.owner == me or self.owner is None and not self._running_auto())
+            self.owner = me
+            self.depth += 1
+        try:
+            yield
+        finally:
+            with self.write_lock:
+                self.depth -= 1
+                if not self.depth:
+                    self.owner = None
+                    self.write_lock.notify_all()
+
+    def _running_auto(self):
+        return next((e for e in self.pending if e[0] in self.long_codes), None)
+
+    def _finish(self, entry, response):
+        if entry[4] is not None:
+            entry[4].put(response)
+        if not entry[1].done():
+            entry[1].set_result(response)
+        self.write_lock.notify_all()
+
+    def _reader(self):
+        while self.running:
+            t = perf_counter()
+            data = self.ser.read(max(1, self.ser.in_waiting))
+            if not data and perf_counter() - t < self.poll / 2:
+                sleep(self.poll / 10)  # a port that returns at once, e.g. a simulated one
+            self.rx += data
+            for frame in self._frames():
+                self._dispatch(frame)
+            now = perf_counter()
+            with self.write_lock:
+                if self.pending and self.pending[0][2] < now:
+                    self._finish(self.pending.popleft(), NO_RESPONSE)
+                    self.rx.clear()  # drop a partial or late reply of the timed out command
+
+    def _frames(self):
+        """
+        Cut complete packets out of the receive buffer, leading garbage is skipped.
+        yields: (bytes) packet, or None for a packet with a wrong checksum
+        """
+        header = self.fp.header
+        while True:
+            start = self.rx.find(header)
+            if start < 0:
+                del self.rx[:-1]
+                return
+            del self.rx[:start]
+            if len(self.rx) < 9:
+                return
+            pkg_len = unpack('>H', self.rx[7:9])[0]
+            if len(self.rx) < 9 + pkg_len:
+                return
+            frame = bytes(self.rx[:9 + pkg_len])
+            del self.rx[:9 + pkg_len]
+            ok = pkg_len >= 2 and (sum(frame[6:-2]) & 0xFFFF) == unpack('>H', frame[-2:])[0]
+            yield frame if ok else None
+
+    def _dispatch(self, frame):
+        with self.write_lock:
+            if not self.pending:
+                return  # unsolicited packet
+            entry = self.pending[0]
+            if entry[4] is not None:  # upload: acknowledge and data packets go to the queue
+                entry[4].put(frame)
+                if not entry[1].done():
+                    entry[1].set_result(CHECKSUM_ERROR if frame is None else Response(frame))
+                if frame is not None and frame[6] != 0x08 and not (frame[6] == 0x07 and frame[9]):
+                    entry[2] = perf_counter() + entry[3]  # more packets follow
+                    return
+                self.pending.popleft()
+                self.write_lock.notify_all()
+                return
+            if frame is not None and step_reply(entry[5], frame):
+                self.fp.step_time = perf_counter()  # auto command reporting a step, the final reply follows
+                entry[2] = self.fp.step_time + entry[3]
+                return
+            self.pending.popleft()
+            self._finish(entry, CHECKSUM_ERROR if frame is None else Response(frame))
+            if entry[0] == 0x30 and entry[5] is not self.cancel_frame:
+                # cancel: the running auto command does not answer any more
+                while self.pending and self.pending[0][0] in self.long_codes:
+                    self._finish(self.pending.popleft(), NO_RESPONSE)
+
+    # ---------- replacements of the inline R503 transport ----------
+
+    def _exchange(self, send_values, instr_code, timeout):
+        fp = self.fp
+        t0 = perf_counter() if fp.hooks else 0
+        response = self.submit(send_values, instr_code, timeout).result()
+        if fp.hooks:
+            fp._emit(instr_code, t0, len(send_values), len(response.frame), response.conf_code)
+        return response
+
+    def _write_data(self, frames):
+        fp = self.fp
+        t0 = perf_counter() if fp.hooks else 0
+        me = get_ident()
+        with self.write_lock:
+            self.write_lock.wait_for(lambda: self.owner in (None, me))
+            self.ser.write(frames)
+        if fp.hooks:
+            fp._emit(None, t0, len(frames), 0, None)
+
+    def _packets(self, send_values, timeout):
+        """
+        Send an upload command and yield the acknowledge and the data packets as they arrive
+        (None for a bad checksum, b'' on timeout)
+        """
+        send_values = self.fp.header + self.fp.addr + send_values + pack('>H', sum(send_values) & 0xFFFF)
+        _, packets = self.submit(send_values, send_values[9], timeout, stream=True)
+        while True:
+            try:
+                packet = packets.get(timeout=timeout + self.poll)
+            except Empty:
+                packet = b''
+            if isinstance(packet, Response):  # timeout or close()
+                packet = b''
+            yield packet
+            if not packet or packet[6] == 0x08 or (packet[6] == 0x07 and packet[9]):
+                return
+
+    def _receive_stream(self, send_values, buffer, timeout, received=None):
+        view = None if buffer is None else memoryview(buffer).cast('B')
+        pos = 0
+        for packet in self._packets(send_values, timeout):
+            if not packet:
+                return 99 if packet == b'' else 100
+            if received is not None:
+                received[0] += len(packet)
+            if packet[6] == 0x07:
+                if packet[9]:
+                    return packet[9]
+                continue
+            data = packet[9:-2]
+            if view is not None:
+                if pos + len(data) > len(view):
+                    return 102
+                view[pos:pos + len(data)] = data
+                data = view[pos:pos + len(data)]
+            pos += len(data)
+            yield data
+        return 0
+
+    def _up_raw(self, send_values, timeout):
+        packets = list(self._packets(send_values, timeout))
+        if not packets[0]:
+            return -1
+        return packets[0][9] or b''.join(p for p in packets if p)
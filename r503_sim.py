@@ -0,0 +1,591 @@
+# Virtual GROW R503 fingerprint module for offline testing and benchmarking.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# VirtualR503 implements the packet protocol of the module: template library, index table, notepad,
+# system parameters, image and character buffers, data packet up- and downloads. Replies are scheduled
+# with a realistic timing: the wire time of every packet at the configured baud rate plus a processing
+# delay per instruction. Noise, dropped bytes and checksum errors can be injected.
+#
+# Two ways to connect a driver:
+#
+#   sim = VirtualR503()
+#   fp = R503(port=SimSerial(sim))            # in-process, no threads
+#
+#   port = sim.serve_pty()                    # pseudo terminal pair (Linux / macOS)
+#   fp = R503(port=port)                      # e.g. '/dev/pts/5', the driver is used unchanged
+#
+# Fingers are simulated by tokens: sim.place_finger('alice') ... sim.lift_finger(). The same token always
+# yields the same image and character file, so enroll, search and match behave like with real fingers.
+
+import math
+import os
+import random
+import threading
+from hashlib import sha256
+from struct import pack, unpack
+from time import monotonic
+
+from r503 import ScheduledSerial
+
+# Processing time of the module per instruction code in seconds (wire time not included)
+PROC_DELAY = {
+    0x01: .25, 0x28: .25,   # get_img, get_image_ex
+    0x02: .35,              # img2tz
+    0x03: .05, 0x04: .08,   # match, search
+    0x05: .15, 0x06: .06,   # reg_model, store
+    0x07: .02, 0x0C: .03, 0x0D: .3,
+    0x0E: .02, 0x12: .03, 0x15: .03, 0x18: .03,
+    0x31: 3.0, 0x32: 1.2,   # auto_enroll, auto_identify (finger present)
+    0x3D: .2,
+}
+DEFAULT_DELAY = .002
+ENROLL_STEPS = (b'\x01\x01', b'\x02\x01', b'\x03\x01', b'\x04\xf0', b'\x05\xf1')  # auto_enroll step reports
+FINGER_WAIT = 5.0  # auto_enroll / auto_identify give up after this time without a finger (code 0x26)
+
+
+def wire_time(n_bytes, baud):
+    """
+    returns: (float) time in seconds to transfer n_bytes with 8N1 framing
+    """
+    return n_bytes * 10 / baud
+
+
+class VirtualR503:
+    """
+    Protocol model of one R503 module.
+    """
+
+    def __init__(self, capacity=200, addr=0xFFFFFFFF, pw=0, baud=57600, pkg_len=128, serial_number='SIM00001',
+                 width=192, height=192, template_size=1536, time_scale=1.0, noise=0.0, drop=0.0,
+                 checksum_errors=0.0, strict_address=False, seed=None):
+        """
+        Parameters:
+          capacity (int): Size of the template library
+          addr, pw, baud, pkg_len: Initial system parameters
+          serial_number (str): Serial number reported in the product information (8 characters)
+          width, height (int): Image geometry
+          template_size (int): Size of a character file / template in bytes
+          time_scale (float): Factor for all modelled delays, 0 replies instantly
+          noise (float): Probability of flipping one byte in a reply packet
+          drop (float): Probability of dropping one byte of a reply packet
+          checksum_errors (float): Probability of a wrong checksum in a reply packet
+          strict_address (bool): Ignore packets that are not sent to the module address
+          seed: Random seed for finger data and fault injection
+        """
+        self.capacity = capacity
+        self.addr = addr
+        self.pw = pw
+        self.pw_verified = pw == 0
+        self.baud = baud
+        self.pkg_len = pkg_len
+        self.security = 3
+        self.serial_number = serial_number
+        self.width, self.height = width, height
+        self.template_size = template_size
+        self.time_scale = time_scale
+        self.noise, self.drop, self.checksum_errors = noise, drop, checksum_errors
+        self.strict_address = strict_address
+        self.rng = random.Random(seed)
+        self.library = {}
+        self.notepad = [bytes(32) for _ in range(16)]
+        self.info_page = bytes(512)
+        self.image = None
+        self.image_finger = None  # finger token the image in the image buffer was taken from
+        self.char_buffers = {}
+        self.finger = None
+        self.images = {}        # cache of the synthetic finger images
+        self.led = (4, 0, 0, 0)
+        self.matched = False
+        self.pending = []       # scheduled output: [due time, bytes, instruction code]
+        self.busy_until = 0.0
+        self.rx = bytearray()   # received but not yet parsed bytes
+        self.download = None    # (target, bytearray) while data packets are expected
+        self.lock = threading.RLock()
+        self.stats = {'commands': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    # ---------- fingers ----------
+
+    def place_finger(self, finger):
+        """
+        Put a finger (any hashable token) on the sensor
+        """
+        self.finger = finger
+
+    def lift_finger(self):
+        """
+        Remove the finger from the sensor
+        """
+        self.finger = None
+
+    def finger_template(self, finger):
+        """
+        returns: (bytes) the character file generated for a finger token
+        """
+        seed = sha256(repr(finger).encode()).digest()
+        out = bytearray()
+        while len(out) < self.template_size:
+            seed = sha256(seed).digest()
+            out += seed
+        return bytes(out[:self.template_size])
+
+    def finger_image(self, finger):
+        """
+        returns: (bytes) nibble-packed synthetic ridge image for a finger token
+        """
+        if finger in self.images:
+            return self.images[finger]
+        rnd = random.Random(repr(finger))
+        angle, freq, phase = rnd.uniform(0, math.pi), rnd.uniform(.45, .7), rnd.uniform(0, 6.3)
+        cx, cy = self.width / 2, self.height / 2
+        rx, ry = self.width * .38, self.height * .45
+        ca, sa = math.cos(angle), math.sin(angle)
+        nibbles = []
+        for y in range(self.height):
+            for x in range(self.width):
+                dx, dy = x - cx, y - cy
+                if (dx / rx) ** 2 + (dy / ry) ** 2 > 1:
+                    nibbles.append(15)
+                    continue
+                r = math.hypot(dx, dy)
+                v = math.sin(freq * (dx * ca + dy * sa) + .02 * r * r / (r + 20) + phase)
+                nibbles.append(int(7.5 + 7.49 * v))
+        self.images[finger] = bytes((nibbles[i] << 4) | nibbles[i + 1] for i in range(0, len(nibbles), 2))
+        return self.images[finger]
+
+    # ---------- timing and output ----------
+
+    def _delay(self, seconds):
+        return seconds * self.time_scale
+
+    def _packet(self, pid, content):
+        body = pack('>BH', pid, len(content) + 2) + content
+        chksum = sum(body) & 0xFFFF
+        if self.checksum_errors and self.rng.random() < self.checksum_errors:
+            chksum ^= 0x5A5A
+        data = bytearray(pack('>HI', 0xEF01, self.addr) + body + pack('>H', chksum))
+        if self.noise and self.rng.random() < self.noise:
+            data[self.rng.randrange(len(data))] ^= 1 << self.rng.randrange(8)
+        if self.drop and self.rng.random() < self.drop:
+            del data[self.rng.randrange(len(data))]
+        return bytes(data)
+
+    def _reply(self, now, instr_code, conf_code, payload=b'', delay=None):
+        """
+        Schedule an acknowledge packet after the processing delay of the instruction
+        returns: (float) the time the reply has been sent completely
+        """
+        packet = self._packet(0x07, bytes([conf_code]) + payload)
+        start = max(now, self.busy_until) + self._delay(PROC_DELAY.get(instr_code, DEFAULT_DELAY)
+                                                         if delay is None else delay)
+        due = start + self._delay(wire_time(len(packet), self.baud))
+        self.pending.append([due, packet, instr_code])
+        self.busy_until = due
+        return due
+
+    def _send_data(self, now, instr_code, data):
+        """
+        Schedule the data packets of an upload, each one as soon as its wire time has passed
+        """
+        due = max(now, self.busy_until)
+        for pos in range(0, len(data), self.pkg_len):
+            chunk = data[pos:pos + self.pkg_len]
+            packet = self._packet(0x08 if pos + self.pkg_len >= len(data) else 0x02, chunk)
+            due += self._delay(wire_time(len(packet), self.baud))
+            self.pending.append([due, packet, instr_code])
+        self.busy_until = due
+
+    def receive(self, data, now=None, baud=None):
+        """
+        Feed bytes sent by the host into the module.
+        parameters: data (bytes) - received bytes
+                    now (float) - time the bytes have been received completely, default monotonic()
+                    baud (int) - baud rate of the sender, bytes sent at a wrong baud rate are lost
+        """
+        now = monotonic() if now is None else now
+        with self.lock:
+            self.stats['bytes_in'] += len(data)
+            if baud is not None and baud != self.baud:
+                return
+            self.rx += data
+            while True:
+                start = self.rx.find(b'\xef\x01')
+                if start < 0:
+                    del self.rx[:-1]
+                    return
+                del self.rx[:start]
+                if len(self.rx) < 9:
+                    return
+                pkg_len = unpack('>H', self.rx[7:9])[0]
+                if len(self.rx) < 9 + pkg_len:
+                    return
+                packet = bytes(self.rx[:9 + pkg_len])
+                del self.rx[:9 + pkg_len]
+                self._handle(packet, now)
+
+    def take_output(self, now=None):
+        """
+        Remove and return the output whose wire time has passed.
+        returns: (bytes) output bytes, (float) due time of the next pending output or None
+        """
+        now = monotonic() if now is None else now
+        with self.lock:
+            self.pending.sort(key=lambda p: p[0])
+            out = bytearray()
+            while self.pending and self.pending[0][0] <= now:
+                out += self.pending.pop(0)[1]
+            self.stats['bytes_out'] += len(out)
+            return bytes(out), (self.pending[0][0] if self.pending else None)
+
+    # ---------- protocol ----------
+
+    def _handle(self, packet, now):
+        addr, pid, pkg_len = unpack('>IBH', packet[2:9])
+        content, chksum = packet[9:-2], unpack('>H', packet[-2:])[0]
+        if self.strict_address and addr != self.addr:
+            return
+        if (sum(packet[6:-2]) & 0xFFFF) != chksum:
+            if pid == 0x01:
+                self._reply(now, 0, 0x01)
+            return
+        if pid in (0x02, 0x08):
+            if self.download is not None:
+                self.download[1].extend(content)
+                if pid == 0x08:
+                    target, data = self.download
+                    self.download = None
+                    if target == 'image':
+                        self.image = bytes(data)
+                    else:
+                        self.char_buffers[target] = bytes(data)
+            return
+        if pid != 0x01 or not content:
+            return
+        self.stats['commands'] += 1
+        instr_code, params = content[0], content[1:]
+        if not self.pw_verified and instr_code not in (0x13, 0x40, 0x30):
+            self._reply(now, instr_code, 0x21)
+            return
+        handler = getattr(self, f'_cmd_{instr_code:02x}', None)
+        if handler is None:
+            self._reply(now, instr_code, 0xFC)
+        else:
+            handler(now, instr_code, params)
+
+    def _capture(self):
+        if self.finger is None:
+            return 0x02
+        self.image = self.finger_image(self.finger)
+        self.image_finger = self.finger
+        return 0
+
+    def _cmd_01(self, now, code, params):  # get_img
+        self._reply(now, code, self._capture())
+
+    _cmd_28 = _cmd_01  # get_image_ex
+
+    def _cmd_02(self, now, code, params):  # img2tz
+        if self.image is None:
+            self._reply(now, code, 0x15)
+            return
+        finger = self.image if self.image_finger is None else self.image_finger
+        self.char_buffers[params[0]] = self.finger_template(finger)
+        self._reply(now, code, 0)
+
+    def _cmd_03(self, now, code, params):  # match
+        c1, c2 = self.char_buffers.get(1), self.char_buffers.get(2)
+        ok = c1 is not None and c1 == c2
+        self._reply(now, code, 0 if ok else 0x08, pack('>H', 200 if ok else 0))
+
+    def _search(self, char, start, count):
+        """
+        returns: (int) lowest occupied page in the range holding 'char', None if there is none or 'char' is None
+        """
+        if char is None:  # empty buffer: nothing matches, not even the empty pages
+            return None
+        end = min(start + count, self.capacity)
+        return min((page_id for page_id, stored in self.library.items() if start <= page_id < end and stored == char),
+                   default=None)
+
+    def _cmd_04(self, now, code, params):  # search
+        buffer_id, start, count = unpack('>BHH', params[:5])
+        page_id = self._search(self.char_buffers.get(buffer_id), start, count)
+        self.matched = page_id is not None
+        delay = PROC_DELAY[code] + .0004 * min(count, self.capacity)
+        if page_id is None:
+            self._reply(now, code, 0x09, pack('>HH', 0, 0), delay)
+        else:
+            self._reply(now, code, 0, pack('>HH', page_id, 200), delay)
+
+    def _cmd_05(self, now, code, params):  # reg_model
+        chars = [self.char_buffers[b] for b in sorted(self.char_buffers)]
+        ok = len(chars) >= 2 and all(c == chars[0] for c in chars)
+        for b in [b for b in self.char_buffers if b > 2]:
+            del self.char_buffers[b]
+        if ok:
+            self.char_buffers[1] = self.char_buffers[2] = chars[0]
+        self._reply(now, code, 0 if ok else 0x0A)
+
+    def _cmd_06(self, now, code, params):  # store
+        buffer_id, page_id = unpack('>BH', params[:3])
+        if page_id >= self.capacity:
+            self._reply(now, code, 0x0B)
+        elif self.char_buffers.get(buffer_id) is None:
+            self._reply(now, code, 0x22)
+        else:
+            self.library[page_id] = self.char_buffers[buffer_id]
+            self._reply(now, code, 0)
+
+    def _cmd_07(self, now, code, params):  # load_char
+        buffer_id, page_id = unpack('>BH', params[:3])
+        if page_id >= self.capacity:
+            self._reply(now, code, 0x0B)
+        elif page_id not in self.library:
+            self._reply(now, code, 0x0C)
+        else:
+            self.char_buffers[buffer_id] = self.library[page_id]
+            self._reply(now, code, 0)
+
+    def _cmd_08(self, now, code, params):  # up_char
+        char = self.char_buffers.get(params[0] if params else 1)
+        if char is None:
+            self._reply(now, code, 0x0D)
+            return
+        self._reply(now, code, 0)
+        self._send_data(now, code, char)
+
+    def _cmd_09(self, now, code, params):  # down_char
+        self.download = (params[0] if params else 1, bytearray())
+        self._reply(now, code, 0)
+
+    def _cmd_0a(self, now, code, params):  # up_image
+        if self.image is None:
+            self._reply(now, code, 0x0F)
+            return
+        self._reply(now, code, 0)
+        self._send_data(now, code, self.image)
+
+    def _cmd_0b(self, now, code, params):  # down_image
+        self.download = ('image', bytearray())
+        self.image_finger = None
+        self._reply(now, code, 0)
+
+    def _cmd_0c(self, now, code, params):  # delete_char
+        page_id, count = unpack('>HH', params[:4])
+        if page_id + count > self.capacity:
+            self._reply(now, code, 0x10)
+            return
+        for p in range(page_id, page_id + count):
+            self.library.pop(p, None)
+        self._reply(now, code, 0)
+
+    def _cmd_0d(self, now, code, params):  # empty_finger_lib
+        self.library.clear()
+        self._reply(now, code, 0)
+
+    def _cmd_0e(self, now, code, params):  # set_sys_para
+        reg, value = params[0], params[1]
+        if reg == 4 and value in (1, 2, 4, 6, 12):
+            self._reply(now, code, 0)
+            self.baud = value * 9600  # the reply still goes out at the old rate
+        elif reg == 5 and 1 <= value <= 5:
+            self.security = value
+            self._reply(now, code, 0)
+        elif reg == 6 and value <= 3:
+            self.pkg_len = 32 << value
+            self._reply(now, code, 0)
+        else:
+            self._reply(now, code, 0x1A)
+
+    def _cmd_0f(self, now, code, params):  # read_sys_para
+        status = (self.busy_until > now) | (self.matched << 1) | (self.pw_verified << 2) | \
+                 ((self.image is not None) << 3)
+        self._reply(now, code, 0, pack('>HHHHIHH', status, 0, self.capacity, self.security, self.addr,
+                                       {32: 0, 64: 1, 128: 2, 256: 3}[self.pkg_len], self.baud // 9600))
+
+    def _cmd_12(self, now, code, params):  # set_pw
+        self.pw = unpack('>I', params[:4])[0]
+        self._reply(now, code, 0)
+
+    def _cmd_13(self, now, code, params):  # verify_pw
+        self.pw_verified = unpack('>I', params[:4])[0] == self.pw
+        self._reply(now, code, 0 if self.pw_verified else 0x13)
+
+    def _cmd_14(self, now, code, params):  # get_random_code
+        self._reply(now, code, 0, pack('>I', self.rng.getrandbits(32)))
+
+    def _cmd_15(self, now, code, params):  # set_address
+        self._reply(now, code, 0)
+        self.addr = unpack('>I', params[:4])[0]
+
+    def _cmd_16(self, now, code, params):  # read_info_page
+        self._reply(now, code, 0)
+        self._send_data(now, code, self.info_page)
+
+    def _cmd_18(self, now, code, params):  # write_notepad
+        if params[0] > 15:
+            self._reply(now, code, 0x1C)
+            return
+        self.notepad[params[0]] = bytes(params[1:33]).ljust(32, b'\x00')
+        self._reply(now, code, 0)
+
+    def _cmd_19(self, now, code, params):  # read_notepad
+        if params[0] > 15:
+            self._reply(now, code, 0x1C)
+        else:
+            self._reply(now, code, 0, self.notepad[params[0]])
+
+    def _cmd_1d(self, now, code, params):  # read_valid_template_num
+        self._reply(now, code, 0, pack('>H', len(self.library)))
+
+    def _cmd_1f(self, now, code, params):  # read_index_table
+        table = bytearray(32)
+        for page_id in self.library:
+            if page_id >> 8 == params[0]:
+                table[(page_id & 0xFF) >> 3] |= 1 << (page_id & 7)
+        self._reply(now, code, 0, bytes(table))
+
+    def _cmd_30(self, now, code, params):  # cancel
+        with self.lock:
+            self.pending = [p for p in self.pending if p[2] not in (0x31, 0x32) or p[0] <= now]
+            self.busy_until = min(self.busy_until, now)
+        self._reply(now, code, 0)
+
+    def _cmd_31(self, now, code, params):  # auto_enroll
+        location = params[0]
+        if self.finger is None:
+            self._reply(now, code, 0x26, b'\x00\x00', FINGER_WAIT)
+        elif location >= self.capacity:
+            self._reply(now, code, 0x0B, b'\x00\x00')
+        elif params[1] and self._search(self.finger_template(self.finger), 0, self.capacity) is not None:
+            self._steps(now, code, params[3], ENROLL_STEPS[:4], 6)
+            self._reply(now, code, 0x27, b'\x05\x00', PROC_DELAY[code] / 6 if params[3] else None)
+        else:
+            self._capture()
+            self.library[location] = self.char_buffers[1] = self.char_buffers[2] = \
+                self.finger_template(self.finger)
+            self._steps(now, code, params[3], ENROLL_STEPS, 6)
+            self._reply(now, code, 0, b'\x06\xf2', PROC_DELAY[code] / 6 if params[3] else None)
+
+    def _steps(self, now, code, report, steps, parts):
+        """
+        Schedule the step reports of auto_enroll / auto_identify if 'report' (ret_status / ret_key_step) is set,
+        each one after 1/parts of the processing delay
+        """
+        if report:
+            for step in steps:
+                self._reply(now, code, 0, step, PROC_DELAY[code] / parts)
+
+    def _cmd_32(self, now, code, params):  # auto_identify
+        start, end = params[1], params[2]
+        if self.finger is None:
+            self._reply(now, code, 0x26, pack('>BHH', 0, 0, 0), FINGER_WAIT)
+            return
+        self._capture()
+        page_id = self._search(self.finger_template(self.finger), start, end - start + 1)
+        self._steps(now, code, params[3], (pack('>BHH', 1, 0, 0),), 2)
+        delay = PROC_DELAY[code] / 2 if params[3] else None
+        if page_id is None:
+            self._reply(now, code, 0x09, pack('>BHH', 5, 0, 0), delay)
+        else:
+            self._reply(now, code, 0, pack('>BHH', 5, page_id, 200), delay)
+
+    def _cmd_35(self, now, code, params):  # led_control
+        self.led = tuple(params[:4])
+        self._reply(now, code, 0)
+
+    def _cmd_36(self, now, code, params):  # check_sensor
+        self._reply(now, code, 0)
+
+    def _cmd_39(self, now, code, params):  # get_alg_ver
+        self._reply(now, code, 0, b'SIM_ALG_1.0'.ljust(32, b'\x00'))
+
+    def _cmd_3a(self, now, code, params):  # get_fw_ver
+        self._reply(now, code, 0, b'SIM_FW_1.0'.ljust(32, b'\x00'))
+
+    def _cmd_3c(self, now, code, params):  # read_prod_info
+        self._reply(now, code, 0, b'R503-SIM'.ljust(16, b'\x00') + b'0001' +
+                    self.serial_number.encode().ljust(8, b'\x00')[:8] + b'\x01\x00' + b'SIMSENSR' +
+                    pack('>HHHH', self.width, self.height, self.template_size, self.capacity))
+
+    def _cmd_3d(self, now, code, params):  # soft_reset
+        self.image = None
+        self.char_buffers.clear()
+        self.pw_verified = self.pw == 0
+        self._reply(now, code, 0)
+
+    def _cmd_40(self, now, code, params):  # handshake
+        self._reply(now, code, 0)
+
+    # ---------- pseudo terminal ----------
+
+    def serve_pty(self):
+        """
+        Serve the module on a pseudo terminal pair from a background thread.
+        returns: (str) device name of the slave side, to be passed to R503(port=...)
+        """
+        import termios
+        import select
+        master, slave = os.openpty()
+        tty = termios.tcgetattr(slave)
+        tty[3] &= ~(termios.ECHO | termios.ICANON | termios.ISIG | termios.IEXTEN)
+        tty[0] &= ~(termios.ICRNL | termios.IXON)
+        tty[1] &= ~termios.OPOST
+        termios.tcsetattr(slave, termios.TCSANOW, tty)
+        name = os.ttyname(slave)
+        self._pty = (master, slave)
+
+        def run():
+            next_due = None
+            while self._pty is not None:
+                wait = .05 if next_due is None else max(0.0, min(.05, next_due - monotonic()))
+                try:
+                    ready, _, _ = select.select([master], [], [], wait)
+                    if ready:
+                        data = os.read(master, 4096)
+                        self.receive(data, monotonic() + self._delay(wire_time(len(data), self.baud)))
+                    out, next_due = self.take_output()
+                    if out:
+                        os.write(master, out)
+                except OSError:
+                    return
+
+        threading.Thread(target=run, daemon=True, name='VirtualR503').start()
+        return name
+
+    def stop_pty(self):
+        """
+        Stop serving the pseudo terminal
+        """
+        if getattr(self, '_pty', None) is not None:
+            master, slave = self._pty
+            self._pty = None
+            os.close(master)
+            os.close(slave)
+
+
+class SimSerial(ScheduledSerial):
+    """
+    In-process replacement for serial.Serial connected to a VirtualR503.
+    Reads block (or time out) according to the modelled timing, unless the module's time_scale is 0.
+    """
+
+    def __init__(self, module, baudrate=None, timeout=1):
+        super().__init__(timeout)
+        self.module = module
+        self.baudrate = module.baud if baudrate is None else baudrate
+        self.port = 'sim'
+
+    def write(self, data):
+        data = bytes(data)
+        now = monotonic() + self.module._delay(wire_time(len(data), self.baudrate))
+        self.module.receive(data, now, self.baudrate)
+        return len(data)
+
+    def _fetch(self, now):
+        out, next_due = self.module.take_output(float('inf') if self.module.time_scale == 0 else now)
+        self.rx += out
+        return next_due
+
+    def _timeout_wait(self, timeout):
+        return timeout if self.module.time_scale else 0.0
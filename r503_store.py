@@ -0,0 +1,172 @@
+# Host-side template library for GROW R503 fingerprint modules.
+#
+# Part of https://github.com/rshcs/Grow-R503-Finger-Print/, MIT License (see r503.py)
+#
+# The flash library of the module holds about 200 templates. TemplateStore keeps any number of templates on
+# the host and identifies a finger by capturing it once and then streaming candidate templates into
+# CharBuffer 2 of the module, comparing each with match() (see R503.match_stream). Candidates of the
+# requested site are tried first, then the most recently matched ones, so frequent users are found early.
+#
+# On disk the store is a directory with one '<hex of the UTF-8 key>.bin' file per template (so any key is a
+# safe file name) and 'index.json' holding the site and last match time of every key. Match times are written
+# at most every 'save_interval' seconds, call flush() (or use the store as a context manager) to save them
+# before exiting.
+
+import json
+import os
+from time import time, perf_counter
+
+
+class TemplateStore:
+    """
+    Host-resident template library, keys are strings (e.g. user names or badge numbers).
+    """
+
+    def __init__(self, root=None, save_interval=60):
+        """
+        Parameters:
+          root (str): Directory of the store, None for a store in memory only
+          save_interval (float): Shortest time in seconds between two writes of the index for match times only
+        """
+        self.root = root
+        self.save_interval = save_interval
+        self.templates = {}  # key => template (bytes)
+        self.meta = {}       # key => {'site': str or None, 'last_seen': float}
+        self._frames = {}    # (key, address, packet length) => prebuilt data packets
+        self._saved = 0.0    # time of the last index write
+        self._dirty = False  # match times changed since then
+        if root is not None and os.path.exists(os.path.join(root, 'index.json')):
+            with open(os.path.join(root, 'index.json')) as f:
+                self.meta = json.load(f)
+            for key in self.meta:
+                with open(self._path(key), 'rb') as f:
+                    self.templates[key] = f.read()
+
+    def __len__(self):
+        return len(self.templates)
+
+    def __contains__(self, key):
+        return key in self.templates
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def _path(self, key):
+        return os.path.join(self.root, key.encode().hex() + '.bin')
+
+    def _save_index(self, force=True):
+        if self.root is None:
+            return
+        if not force and time() - self._saved < self.save_interval:
+            self._dirty = True
+            return
+        path = os.path.join(self.root, 'index.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(path + '.tmp', path)
+        self._saved, self._dirty = time(), False
+
+    def flush(self):
+        """
+        Write match times that have not been saved yet
+        """
+        if self._dirty:
+            self._save_index()
+
+    def add(self, key, template, site=None):
+        """
+        Add or replace a template.
+        parameters: key (str) - name of the template
+                    template - bytes, or list of packet data as returned by R503.up_char()
+                    site (str) - site the user is enrolled at, used to order the candidates
+        """
+        key = str(key)
+        template = bytes(template) if not isinstance(template, list) else b''.join(template)
+        self.templates[key] = template
+        self.meta[key] = {'site': site, 'last_seen': self.meta.get(key, {}).get('last_seen', 0.0)}
+        self._frames = {k: v for k, v in self._frames.items() if k[0] != key}
+        if self.root is not None:
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(key)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(template)
+            os.replace(path + '.tmp', path)
+            self._save_index()
+
+    def remove(self, key):
+        """
+        Remove a template, unknown keys are ignored
+        """
+        key = str(key)
+        if self.templates.pop(key, None) is None:
+            return
+        del self.meta[key]
+        self._frames = {k: v for k, v in self._frames.items() if k[0] != key}
+        if self.root is not None:
+            os.remove(self._path(key))
+            self._save_index()
+
+    def enroll(self, fp, key, site=None, buffer_id=1):
+        """
+        Upload the template in a character buffer of the module (e.g. after reg_model()) into the store.
+        returns: (int) confirmation code
+        """
+        char_data = fp.up_char(buffer_id=buffer_id)
+        if isinstance(char_data, int):
+            return char_data
+        self.add(key, char_data, site)
+        return 0
+
+    def candidates(self, site=None):
+        """
+        returns: (list) keys in matching order: templates of 'site' first, then by last match time, newest first
+        """
+        return sorted(self.templates, key=lambda k: (self.meta[k]['site'] != site if site is not None else False,
+                                                    -self.meta[k]['last_seen']))
+
+    def frames(self, fp, key):
+        """
+        returns: (bytes) data packets of a template for the address and packet length of 'fp', built once
+        """
+        cache_key = (key, fp.addr, fp.recv_size)
+        frames = self._frames.get(cache_key)
+        if frames is None:
+            frames = self._frames[cache_key] = fp.data_frames(self.templates[key])
+        return frames
+
+    def identify(self, fp, site=None, keys=None, min_score=0, capture=True):
+        """
+        Capture a finger and match it against the stored templates until the first match.
+        parameters: fp (R503) - the module
+                    site (str) - templates of this site are tried first
+                    keys (iterable) - keys to try, in this order, default candidates(site)
+                    min_score (int) - a match with a lower score is treated as no match
+                    capture (bool) - False to use the character file already present in CharBuffer 1
+        returns: (dict) 'conf_code': 0 on a match, 9 if nothing matched, otherwise the failing confirmation code,
+                 'key' and 'score' of the match, 'tried': number of templates compared, 'seconds': matching time
+        """
+        result = {'conf_code': 9, 'key': None, 'score': 0, 'tried': 0, 'seconds': 0.0}
+        if capture:
+            conf_code = fp.get_image_ex() or fp.img2tz(1)
+            if conf_code:
+                result['conf_code'] = conf_code
+                return result
+        keys = self.candidates(site) if keys is None else [str(k) for k in keys]
+        t = perf_counter()
+        stream = fp.match_stream((key, self.frames(fp, key)) for key in keys)
+        for key, conf_code, score in stream:
+            result['tried'] += 1
+            if conf_code == 0 and score >= min_score:
+                result.update(conf_code=0, key=key, score=score)
+                self.meta[key]['last_seen'] = time()
+                self._save_index(force=False)
+                break
+            if conf_code not in (0, 8):
+                result['conf_code'] = conf_code
+                break
+        stream.close()
+        result['seconds'] = perf_counter() - t
+        return result
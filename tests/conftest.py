@@ -0,0 +1,93 @@
+# Fixtures connecting the driver to the virtual module of r503_sim, no hardware needed.
+
+import asyncio
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from r503 import R503  # noqa: E402
+from r503_sim import VirtualR503, SimSerial  # noqa: E402
+
+
+@pytest.fixture
+def sim():
+    """
+    Virtual module replying instantly
+    """
+    return VirtualR503(time_scale=0, seed=1)
+
+
+@pytest.fixture
+def fp(sim):
+    """
+    Driver connected in-process to 'sim'
+    """
+    fp = R503(port=SimSerial(sim, timeout=.2))
+    yield fp
+    fp.ser_close()
+
+
+def enroll(sim, fp, finger, page_id):
+    """
+    Store the template of a finger token at a library page
+    """
+    sim.place_finger(finger)
+    assert fp.get_img() == 0
+    assert fp.img2tz(1) == 0
+    assert fp.store(1, page_id) == 0
+    sim.lift_finger()
+
+
+class SimWriter:
+    """
+    asyncio StreamWriter stand-in feeding an instant VirtualR503, its replies go straight to the reader
+    """
+
+    def __init__(self, module, reader):
+        self.module, self.reader = module, reader
+
+    def write(self, data):
+        self.module.receive(bytes(data))
+        self.reader.feed_data(self.module.take_output(float('inf'))[0])
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.reader.feed_eof()
+
+    async def wait_closed(self):
+        pass
+
+
+def async_fp(sim):
+    """
+    AsyncR503 connected to 'sim', call from a running event loop
+    """
+    from r503_async import AsyncR503
+    reader = asyncio.StreamReader()
+    return AsyncR503(reader, SimWriter(sim, reader))
+
+
+class Wire(io.BytesIO):
+    """
+    Serial stand-in reading prepared bytes, writes are dropped
+    """
+    timeout = 1
+
+    def write(self, data):
+        return len(data)
+
+    def reset_input_buffer(self):
+        pass
+
+
+def wire_fp(data=b''):
+    """
+    Driver reading its replies from 'data'
+    """
+    return R503(port=Wire(data))
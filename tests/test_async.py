@@ -0,0 +1,59 @@
+import asyncio
+
+from conftest import async_fp, enroll
+
+
+def run(sim, steps):
+    async def main():
+        fp = async_fp(sim)
+        try:
+            return await steps(fp)
+        finally:
+            await fp.ser_close()
+
+    return asyncio.run(main())
+
+
+def test_get_available_location_matches_sync(sim, fp):
+    for page_id in (0, 1, 3):
+        enroll(sim, fp, page_id, page_id)
+
+    async def locations(afp):
+        return [await afp.get_available_location(), await afp.get_available_location(start=3),
+                await afp.get_available_location(0, 4), await afp.get_available_location(index_page=1)]
+
+    expected = [fp.get_available_location(), fp.get_available_location(start=3),
+                fp.get_available_location(0, 4), fp.get_available_location(index_page=1)]
+    assert run(sim, locations) == expected == [2, 4, 4, None]
+
+
+def test_auto_enroll_tracks_the_final_reply(sim):
+    sim.place_finger('a')
+
+    async def steps(afp):
+        return [await afp.get_available_location(), await afp.auto_enroll(0), await afp.get_available_location(),
+                await afp.auto_enroll(1), afp.occupancy_bits, await afp.read_index_table(0)]
+
+    assert run(sim, steps) == [0, 0, 1, 0x27, None, [0]]
+
+
+def test_search_stops_without_a_finger(sim, fp):
+    enroll(sim, fp, 'alice', 0)
+    assert fp.search() == (2, 0, 0)
+
+    async def search(afp):
+        no_finger = await afp.search()
+        sim.place_finger('alice')
+        return no_finger, await afp.search()
+
+    assert run(sim, search) == ((2, 0, 0), (0, 0, 200))
+
+
+def test_notepad_matches_sync(sim, fp):
+    async def notepad(afp):
+        return [await afp.write_notepad(1, b'\x00\xffraw'), await afp.read_notepad(1),
+                await afp.write_notepad(2, 1234), await afp.read_notepad(2),
+                await afp.write_notepad(3, b'x' * 33), await afp.read_notepad(16)]
+
+    assert run(sim, notepad) == [0, (0, b'\x00\xffraw'.ljust(32, b'\x00')), 0, (0, b'1234'.ljust(32, b'\x00')), 101, -1]
+    assert fp.read_notepad(1) == (0, b'\x00\xffraw'.ljust(32, b'\x00'))
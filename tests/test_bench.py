@@ -0,0 +1,19 @@
+from r503_bench import Bench, compare, percentile
+
+
+def test_percentile_nearest_rank():
+    assert percentile(list(range(1, 11)), 50) == 5
+    assert percentile(list(range(1, 21)), 95) == 19
+    assert percentile(list(range(1, 101)), 99) == 99
+    assert percentile([3, 1, 2], 100) == 3
+    assert percentile([3, 1, 2], 0) == 1
+    assert percentile([7], 50) == 7
+    assert percentile([], 50) is None
+
+
+def test_bench_on_simulator(sim, fp):
+    result = Bench(fp, sim).run(bauds=(57600, 115200), operations=('handshake', 'up_char'), n=3)
+    assert [c['baud'] for c in result['configs']] == [57600, 115200]
+    assert result['configs'][0]['operations']['handshake']['count'] == 3
+    assert (fp.ser.baudrate, sim.baud) == (57600, 57600)
+    assert compare(result, result) == []
@@ -0,0 +1,33 @@
+import pytest
+
+from r503 import pack_image, pack_images, unpack_image, unpack_images
+
+np = pytest.importorskip('numpy')
+
+
+def test_pack_unpack_round_trip():
+    rng = np.random.default_rng(1)
+    pixels = rng.integers(0, 256, (192, 192), dtype=np.uint8)
+    packets = pack_image(pixels)
+    assert [len(p) for p in packets] == [128] * 144
+    assert (unpack_image(packets) == pixels & 0xF0).all()  # only the upper nibble is transferred
+    assert (unpack_image(b''.join(packets)) == unpack_image(packets)).all()
+
+
+def test_batch_codec_matches_single_images():
+    rng = np.random.default_rng(2)
+    pixels = rng.integers(0, 256, (3, 8, 6), dtype=np.uint8)
+    batch = pack_images(pixels, pkg_len=8)
+    assert batch == [pack_image(p, pkg_len=8) for p in pixels]
+    packed = np.frombuffer(b''.join(b''.join(img) for img in batch), np.uint8).reshape(3, -1)
+    assert (unpack_images(packed, 6, 8) == pixels & 0xF0).all()
+    assert (unpack_images(batch, 6, 8) == unpack_images(packed, 6, 8)).all()
+
+
+def test_image_array_through_the_module(sim, fp):
+    pixels = np.arange(192 * 192, dtype=np.uint32).reshape(192, 192).astype(np.uint8)
+    assert fp.down_image_array(pixels) == 0
+    assert (fp.up_image_array() == pixels & 0xF0).all()
+    sim.place_finger('alice')
+    assert fp.get_img() == 0
+    assert (fp.up_image_array() == unpack_image(sim.image)).all()
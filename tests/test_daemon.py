@@ -0,0 +1,78 @@
+import socket
+import threading
+
+import pytest
+
+from r503_daemon import R503Daemon, R503Client, _Client, recv_msg
+
+
+@pytest.fixture
+def daemon(fp, tmp_path):
+    daemon = R503Daemon(fp, str(tmp_path / 'r503.sock'))
+    yield daemon
+    daemon.shutdown()
+
+
+def serve(daemon):
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+
+def connect(daemon):
+    client = R503Client(daemon.path, deadline=5)
+    client.sock.settimeout(5)  # fail instead of hanging if the daemon stops answering
+    return client
+
+
+def test_request_and_reply(sim, daemon):
+    thread = serve(daemon)
+    client = connect(daemon)
+    try:
+        assert client.handshake() == 0
+        assert client.read_sys_para_decode()['finger_library_size'] == 200
+        sim.place_finger('alice')
+        assert client.get_img() == 0
+        conf_code, data = client.up_image()
+        assert conf_code == 0 and len(data) == 192 * 192 // 2
+    finally:
+        client.close()
+        daemon.shutdown()
+        thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_errors_are_sent_back(daemon):
+    thread = serve(daemon)
+    client = connect(daemon)
+    try:
+        with pytest.raises(RuntimeError, match='unknown command'):
+            client.call('ser_close')
+        with pytest.raises(RuntimeError, match='TypeError'):
+            client.call('up_image', bogus=1)
+        with pytest.raises(RuntimeError, match='TypeError'):
+            client.call('handshake', 1, 2)
+        assert client.handshake() == 0  # the device thread is still running
+    finally:
+        client.close()
+
+
+def test_identical_reads_are_run_once(sim, daemon):
+    pairs = [socket.socketpair() for _ in range(3)]
+    try:
+        for n, (a, _) in enumerate(pairs):
+            daemon.submit(_Client(a), {'id': n, 'method': 'read_sys_para'})
+        daemon.submit(_Client(pairs[0][0]), {'id': 9, 'method': 'read_valid_template_num'})
+        commands = sim.stats['commands']
+        for _ in range(2):
+            job, waiters = daemon._next_job()
+            daemon._run(job, waiters)
+        assert sim.stats['commands'] - commands == 2
+        replies = [recv_msg(b) for _, b in pairs]
+        assert [r['id'] for r in replies] == [0, 1, 2]
+        assert replies[0]['result'] == replies[1]['result'] == replies[2]['result']
+        assert recv_msg(pairs[0][1]) == {'id': 9, 'result': 0}
+    finally:
+        for a, b in pairs:
+            a.close()
+            b.close()
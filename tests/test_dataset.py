@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from r503_dataset import ImageDataset
+
+SIZE = 192 * 192 // 2
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'captures.r503img')
+
+
+def test_capture_and_read_back(sim, fp, path):
+    with ImageDataset(path, capacity=4) as ds:
+        sim.place_finger('alice')
+        assert ds.capture(fp) == (0, 0)
+        assert bytes(ds.image(0)) == sim.image
+        timestamp, serial, conf_code = ds.record(0)
+        assert (serial, conf_code) == ('SIM00001', 0) and timestamp > 0
+        with pytest.raises(IndexError):
+            ds.record(1)
+
+
+def test_failed_capture_uses_no_slot(sim, fp, path):
+    with ImageDataset(path, capacity=1) as ds:
+        size = os.path.getsize(path)
+        assert ds.capture(fp) == (2, None)  # no finger
+        assert len(ds) == 0
+        sim.place_finger('alice')
+        assert ds.capture(fp) == (0, 0)
+        sim.lift_finger()
+        assert ds.capture(fp) == (2, None)  # the file is full: it must not grow for a failure
+        assert (ds.capacity, os.path.getsize(path)) == (1, size)
+        sim.place_finger('bob')
+        assert ds.capture(fp) == (0, 1)  # grown for a complete image
+        assert ds.capacity == 2 and bytes(ds.image(1)) == sim.image
+        assert bytes(ds.image(0)) == sim.finger_image('alice')
+
+
+def test_keep_failed_stores_an_empty_entry(sim, fp, path):
+    with ImageDataset(path, capacity=2) as ds:
+        assert ds.capture(fp, keep_failed=True) == (2, 0)
+        assert ds.record(0)[2] == 2
+        assert bytes(ds.image(0)) == bytes(SIZE)
+
+
+def test_resume_and_append(path):
+    with ImageDataset(path, capacity=1) as ds:
+        assert ds.append(b'\x11' * SIZE, serial='A') == 0
+        assert ds.append([b'\x22' * (SIZE // 2)] * 2, serial='B', conf_code=3) == 1
+        with pytest.raises(ValueError):
+            ds.append(b'short')
+    with ImageDataset(path) as ds:
+        assert (len(ds), ds.capacity) == (2, 2)
+        assert [ds.record(i)[1:] for i in range(2)] == [('A', 0), ('B', 3)]
+        assert ds.append(b'\x33' * SIZE) == 2
+        assert bytes(ds.image(1)) == b'\x22' * SIZE
+
+
+def test_numpy_views(path):
+    np = pytest.importorskip('numpy')
+    with ImageDataset(path, capacity=3) as ds:
+        for n in range(3):
+            ds.append(bytes([n]) * SIZE, conf_code=n)
+        images, index = ds.images(), ds.index()
+        assert images.shape == (3, SIZE)
+        assert (images[:, 0] == np.arange(3)).all()
+        assert list(index['conf_code']) == [0, 1, 2]
+        del images, index
+
+
+def test_not_a_dataset(path):
+    with open(path, 'wb') as f:
+        f.write(b'x' * 100)
+    with pytest.raises(ValueError):
+        ImageDataset(path)
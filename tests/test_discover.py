@@ -0,0 +1,91 @@
+import os
+import struct
+
+import pytest
+import serial
+
+import r503_discover
+from r503 import R503
+from r503_discover import connect, discover, keep_connected
+from r503_sim import VirtualR503, SimSerial
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'openpty'), reason='needs pseudo terminals')
+
+
+@pytest.fixture
+def modules():
+    sims = [VirtualR503(time_scale=0, serial_number=f'SIM0000{n}') for n in (1, 2)]
+    yield sims
+    for sim in sims:
+        sim.stop_pty()
+
+
+def test_discover_finds_all_modules(modules, tmp_path):
+    ports = [sim.serve_pty() for sim in modules]
+    cache = str(tmp_path / 'ports.json')
+    found = discover(ports, bauds=(57600,), cache_file=cache)  # a pty has no baud rate
+    assert {k: v['port'] for k, v in found.items()} == {'SIM00001': ports[0], 'SIM00002': ports[1]}
+    fp = connect('SIM00002', cache_file=cache, ports=[])
+    assert fp is not None and fp.handshake() == 0
+    fp.ser_close()
+
+
+def test_discover_skips_failing_port(modules, monkeypatch):
+    ports = [sim.serve_pty() for sim in modules]
+    probe = r503_discover.probe
+
+    def failing_probe(port, *args):
+        if port == ports[0]:
+            raise struct.error('unpack requires a buffer of 14 bytes')
+        return probe(port, *args)
+
+    monkeypatch.setattr(r503_discover, 'probe', failing_probe)
+    assert list(discover(ports, bauds=(57600,))) == ['SIM00002']
+
+
+def test_keep_connected_reconnects_uploads(modules, tmp_path):
+    sim = modules[0]
+    ports = [sim.serve_pty()]
+    cache = str(tmp_path / 'ports.json')
+    discover(ports, bauds=(57600,), cache_file=cache)
+    fp = keep_connected(connect('SIM00001', cache_file=cache, ports=ports), 'SIM00001', cache_file=cache,
+                        ports=ports, bauds=(57600,))
+    sim.place_finger('alice')
+    assert fp.get_img() == 0 and fp.img2tz(1) == 0
+    template = sim.finger_template('alice')
+    sim.stop_pty()  # unplugged, the adapter comes back under another name
+    ports[:] = [sim.serve_pty()]
+    assert b''.join(fp.up_char()) == template  # streamed upload
+    sim.stop_pty()
+    ports[:] = [sim.serve_pty()]
+    raw = fp.up_char(raw=True)  # all packets in one byte string
+    assert not isinstance(raw, int) and template[:64] in raw
+    fp.ser_close()
+
+
+class UnpluggedSerial:
+    timeout = .2
+
+    def read(self, size=1):
+        raise serial.SerialException('device disconnected')
+
+    write = read
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_keep_connected_readdresses_all_packets(monkeypatch):
+    sim = VirtualR503(time_scale=0, seed=1, addr=0x12345678, strict_address=True)
+    templates = {page_id: sim.finger_template(finger) for page_id, finger in enumerate('abc')}
+    fp = R503(port=UnpluggedSerial())  # still talking to the default address of the lost connection
+    monkeypatch.setattr(r503_discover, 'connect',
+                        lambda *args: R503(port=SimSerial(sim, timeout=.2), addr=0x12345678))
+    keep_connected(fp, 'SIM00001')
+    # the data packets and store commands are built up front with the old address
+    assert fp.restore_library(templates) == {0: 0, 1: 0, 2: 0}
+    assert sim.library == {page_id: bytes(template) for page_id, template in templates.items()}
+    assert fp.load_char(2) == 0 and b''.join(fp.up_char()) == templates[2]
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from r503 import Enrollment
+
+pytest.importorskip('numpy')
+
+
+def reject(pixels):
+    return False, 'coverage', {}
+
+
+def accept(pixels):
+    return True, None, {}
+
+
+def test_enrollment_stores_template(sim, fp):
+    sim.place_finger('alice')
+    enrollment = Enrollment(fp, 5, num_of_fps=2, prescreen=accept)
+    assert enrollment.run() == 0
+    assert fp.read_index_table(0) == [5]
+
+
+def test_prescreen_rejections_time_out(sim, fp):
+    sim.place_finger('alice')
+    events = []
+    enrollment = Enrollment(fp, 5, timeout=.2, poll_min=.01, prescreen=reject,
+                            on_event=lambda e, event: events.append(event))
+    t = time.monotonic()
+    assert enrollment.run() == 0x26
+    assert time.monotonic() - t < 2
+    assert enrollment.reason == 'timeout'
+    assert 'prescreen_failed' in events and 'capture' not in events
+
+
+def test_manual_enroll_with_rejecting_prescreen_ends(sim, fp):
+    sim.place_finger('alice')
+    assert fp.manual_enroll(5, timeout=.2, loop_delay=.01, prescreen=reject) == 0x26
+
+
+def test_identify_prescreen_forces_manual(sim, fp):
+    sim.place_finger('alice')
+    fp.identify_latency['sensor'] = 0.0  # 'auto' would pick auto_identify
+    result = fp.identify(prescreen=reject)
+    assert result.mode == 'manual'
+    assert (result.stage, result.conf_code) == ('prescreen', 0x07)
+    with pytest.raises(ValueError):
+        fp.identify(mode='sensor', prescreen=reject)
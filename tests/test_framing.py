@@ -0,0 +1,35 @@
+from r503 import Response
+
+from conftest import wire_fp, Wire
+
+
+def test_make_packet_round_trip():
+    fp = wire_fp()
+    packet = fp.make_packet(0x07, b'\x00\x12\x34')
+    assert packet[:2] == fp.header and packet[6] == 0x07
+    fp.ser = Wire(b'\x55\xaa' + packet)  # leading garbage is skipped
+    assert fp.read_packet() == packet
+    response = Response(packet)
+    assert (response.conf_code, response.payload, response.unpack('>H')) == (0, b'\x12\x34', (0x1234,))
+
+
+def test_read_packet_checksum_error_and_short_read():
+    fp = wire_fp()
+    packet = fp.make_packet(0x07, b'\x00\x01')
+    fp.ser = Wire(packet[:-1] + bytes([packet[-1] ^ 1]))
+    assert fp.read_packet() is None
+    fp.ser = Wire(packet[:-3])
+    assert fp.read_packet() == b''
+    fp.ser = Wire(packet[:5])
+    assert fp.read_packet() == b''
+
+
+def test_data_frames_split_and_end_packet():
+    fp = wire_fp()
+    data = bytes(range(256)) + b'xyz'
+    frames = fp.data_frames(data)
+    fp.ser = Wire(frames)
+    packets = [fp.read_packet() for _ in range(3)]
+    assert [p[6] for p in packets] == [0x02, 0x02, 0x08]
+    assert b''.join(p[9:-2] for p in packets) == data
+    assert fp.read_packet() == b''
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from r503 import ArgumentError, ChecksumError, ModuleError, NoResponseError, R503Error, conf_code_table, error_for
+from conftest import async_fp
+
+HELPERS = ('read_sys_para', 'read_sys_para_decode', 'auto_identify', 'read_prod_info', 'read_prod_info_decode')
+RAISING = ('read_valid_template_num', 'get_random_code')  # the result is a number: errors are raised
+ERRORS = {100: ChecksumError, 0x21: ModuleError}
+
+
+def fault(sim, kind):
+    if kind == 'checksum':
+        sim.checksum_errors = 1.0
+        return 100
+    sim.pw_verified = False  # every command is answered with 21h
+    return 0x21
+
+
+@pytest.mark.parametrize('kind', ('checksum', 'module'))
+@pytest.mark.parametrize('name', HELPERS)
+def test_helpers_return_error_code(sim, fp, name, kind):
+    code = fault(sim, kind)
+    assert getattr(fp, name)() == code
+
+
+@pytest.mark.parametrize('kind', ('checksum', 'module'))
+@pytest.mark.parametrize('name', RAISING)
+def test_numeric_helpers_raise_typed_errors(sim, fp, name, kind):
+    code = fault(sim, kind)
+    with pytest.raises(ERRORS[code]) as info:
+        getattr(fp, name)()
+    assert info.value.code == code
+
+
+def test_no_response_error(sim, fp):
+    sim.strict_address = True
+    sim.addr = 0x12345678
+    with pytest.raises(NoResponseError):
+        fp.read_valid_template_num()
+
+
+def test_error_for():
+    assert [type(error_for(code)) for code in (99, 100, 101, 1)] == [NoResponseError, ChecksumError,
+                                                                     ArgumentError, ModuleError]
+    assert str(error_for(1)) == conf_code_table()[1]
+
+
+def test_helpers_decode_valid_replies(sim, fp):
+    assert fp.read_sys_para_decode()['finger_library_size'] == 200
+    assert fp.read_prod_info_decode()['serial number'].strip('\x00 ') == 'SIM00001'
+    assert fp.read_valid_template_num() == 0
+    assert isinstance(fp.get_random_code(), int)
+    assert fp.image_size() == (192, 192)
+
+
+def test_image_size_and_capacity_defaults_on_error(sim, fp):
+    sim.checksum_errors = 1.0
+    assert fp.image_size() == (192, 192)
+    assert fp.capacity() == 200
+
+
+@pytest.mark.parametrize('kind', ('checksum', 'module'))
+def test_async_helpers_return_error_code(sim, kind):
+    async def run():
+        fp = async_fp(sim)
+        code = fault(sim, kind)
+        try:
+            return code, [await getattr(fp, name)() for name in HELPERS]
+        finally:
+            await fp.ser_close()
+
+    code, results = asyncio.run(run())
+    assert results == [code] * len(HELPERS)
+
+
+@pytest.mark.parametrize('kind', ('checksum', 'module'))
+def test_async_numeric_helpers_raise_typed_errors(sim, kind):
+    async def run():
+        fp = async_fp(sim)
+        fault(sim, kind)
+        errors = []
+        try:
+            for name in RAISING:
+                try:
+                    await getattr(fp, name)()
+                except R503Error as e:
+                    errors.append(e)
+            return errors
+        finally:
+            await fp.ser_close()
+
+    code = 100 if kind == 'checksum' else 0x21
+    assert [(type(e), e.code) for e in asyncio.run(run())] == [(ERRORS[code], code)] * len(RAISING)
@@ -0,0 +1,22 @@
+from r503 import R503
+from r503_sim import VirtualR503, SimSerial
+
+from conftest import enroll
+
+
+def test_sensor_mode_beyond_page_255_uses_manual(sim, fp):
+    enroll(sim, fp, 'alice', 4)
+    sim.place_finger('alice')
+    result = fp.identify(mode='sensor', start_id=0, para=300)
+    assert result.mode == 'manual'
+    assert (result.conf_code, result.page_id) == (0, 4)
+
+
+def test_sensor_latency_excludes_the_finger_wait():
+    sim = VirtualR503(time_scale=.05, seed=1)
+    fp = R503(port=SimSerial(sim, timeout=1))
+    enroll(sim, fp, 'alice', 4)
+    sim.place_finger('alice')
+    result = fp.identify(mode='sensor')
+    assert (result.mode, result.conf_code, result.page_id) == ('sensor', 0, 4)
+    assert fp.identify_latency['sensor'] < .8 * result.total  # measured from the capture step report
@@ -0,0 +1,61 @@
+from r503 import R503
+from r503_sim import SimSerial
+
+from conftest import enroll
+
+
+def test_delete_many_merges_free_gaps(sim, fp):
+    for page_id in (1, 3, 4, 8):
+        enroll(sim, fp, page_id, page_id)
+    commands = sim.stats['commands']
+    assert fp.delete_many([1, 3, 4]) == {1: 0, 3: 0, 4: 0}
+    assert sim.stats['commands'] - commands == 4 + 1  # index table pages, one delete_char for pages 1-4
+    assert fp.read_index_table(0) == [8]
+
+
+def test_delete_many_with_stale_cache(sim, fp):
+    enroll(sim, fp, 'a', 4)
+    enroll(sim, fp, 'b', 6)
+    assert fp.used_count() == 2  # occupancy cached
+    other = R503(port=SimSerial(sim, timeout=.2))
+    enroll(sim, other, 'c', 5)  # not seen by fp's cache
+    assert fp.delete_many([4, 6]) == {4: 0, 6: 0}
+    assert fp.read_index_table(0) == [5]
+
+
+def test_compact(sim, fp):
+    for page_id in (2, 5, 9):
+        enroll(sim, fp, page_id, page_id)
+    assert fp.compact() == (0, {9: 0, 5: 1})
+    assert fp.read_index_table(0) == [0, 1, 2]
+    assert sim.library[0] == sim.finger_template(9)
+
+
+def test_compact_keeps_templates_of_other_handles(sim, fp):
+    enroll(sim, fp, 'a', 9)
+    assert fp.used_count() == 1  # occupancy cached
+    other = R503(port=SimSerial(sim, timeout=.2))
+    enroll(sim, other, 'b', 0)  # not seen by fp's cache
+    assert fp.compact() == (0, {9: 1})
+    assert sim.library == {0: sim.finger_template('b'), 1: sim.finger_template('a')}
+
+
+def test_compact_stops_without_duplicates(sim, fp):
+    for page_id in (3, 7, 9):
+        enroll(sim, fp, page_id, page_id)
+    store = fp.store
+    fp.store = lambda buffer_id, page_id: 0x18 if page_id == 1 else store(buffer_id, page_id)  # flash write error
+    assert fp.compact() == (0x18, {9: 0})
+    assert sorted(sim.library) == [0, 3, 7]
+    assert sim.library[0] == sim.finger_template(9)
+
+
+def test_auto_enroll_returns_the_final_reply(sim, fp):
+    assert fp.get_available_location() == 0
+    sim.place_finger('a')
+    assert fp.auto_enroll(0) == 0  # the module reports every step before the final reply
+    assert fp.get_available_location() == 1
+    assert fp.auto_enroll(1) == 0x27  # duplicate finger, reported after the first steps
+    assert fp.occupancy_bits is None
+    assert fp.get_available_location() == 1
+    assert fp.auto_identify(ret_key_step=1) == (0, 200)
@@ -0,0 +1,49 @@
+import pytest
+
+
+def corrupt_replies(sim, instr_code, calls):
+    """
+    Send the reply of the given calls (0 = first) of an instruction with a wrong checksum
+    """
+    name = f'_cmd_{instr_code:02x}'
+    handler = getattr(sim, name)
+    count = [0]
+
+    def corrupted(now, code, params):
+        sim.checksum_errors = 1.0 if count[0] in calls else 0.0
+        count[0] += 1
+        try:
+            handler(now, code, params)
+        finally:
+            sim.checksum_errors = 0.0
+
+    setattr(sim, name, corrupted)
+
+
+def test_verify_link_fails_on_corrupted_reply(sim, fp):
+    corrupt_replies(sim, 0x0F, {0})
+    assert fp.verify_link() is False
+    assert fp.verify_link() is True
+
+
+def test_tune_link_survives_corrupted_probe(sim, fp):
+    corrupt_replies(sim, 0x0F, {2, 3})
+    result = fp.tune_link(bauds=(57600, 115200), pkg_lens=(64, 128), rounds=1)
+    assert isinstance(result, dict)
+    assert (fp.ser.baudrate, fp.recv_size) == (result['baud'], result['pkg_len'])
+    assert (sim.baud, sim.pkg_len) == (result['baud'], result['pkg_len'])
+    assert fp.verify_link()
+
+
+def test_tune_link_restores_settings_on_exception(sim, fp):
+    def broken(rounds):
+        if fp.ser.baudrate != 57600:
+            raise RuntimeError('transfer failed')
+        return 1000.0
+
+    fp._link_throughput = broken
+    with pytest.raises(RuntimeError):
+        fp.tune_link(bauds=(57600, 115200), pkg_lens=(64, 128), rounds=1)
+    assert (fp.ser.baudrate, fp.recv_size) == (57600, 128)
+    assert (sim.baud, sim.pkg_len) == (57600, 128)
+    assert fp.verify_link()
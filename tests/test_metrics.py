@@ -0,0 +1,45 @@
+from r503 import Metrics
+
+
+def test_metrics_count_commands_bytes_and_errors(sim, fp):
+    metrics = fp.enable_metrics()
+    assert fp.handshake() == 0 and fp.handshake() == 0
+    sim.checksum_errors = 1.0
+    assert fp.handshake() == 100
+    sim.checksum_errors = 0.0
+    sim.strict_address = True
+    sim.addr = 1
+    assert fp.handshake() == 99
+    c = metrics.snapshot()['0x40']
+    assert c['count'] == 4
+    assert (c['bytes_out'], c['bytes_in']) == (4 * 12, 2 * 12)
+    assert (c['timeouts'], c['checksum_errors']) == (1, 1)
+    assert c['conf_codes'] == {'0': 2, '100': 1, '99': 1}
+    assert sum(c['buckets'].values()) == 4
+
+
+def test_metrics_of_uploads_and_downloads(sim, fp):
+    metrics = fp.enable_metrics()
+    sim.place_finger('alice')
+    assert fp.get_img() == 0
+    image = fp.up_image()
+    assert fp.down_image(image) == 0
+    snapshot = metrics.snapshot()
+    assert snapshot['0x0a']['bytes_in'] == 12 + 144 * (128 + 11)  # acknowledge and data packets
+    assert snapshot['data']['bytes_out'] == 144 * (128 + 11)
+    assert snapshot['data']['conf_codes'] == {}
+
+
+def test_custom_hook_and_prometheus_export(fp):
+    calls = []
+    fp.hooks.append(lambda *args: calls.append(args))
+    metrics = fp.enable_metrics(Metrics())
+    assert fp.handshake() == 0
+    instr_code, seconds, bytes_out, bytes_in, conf_code = calls[0]
+    assert (instr_code, bytes_out, bytes_in, conf_code) == (0x40, 12, 12, 0) and seconds >= 0
+    metrics(0x40, 3.0, 1, 2, 9)  # lands in the 5 s bucket
+    text = metrics.to_prometheus()
+    assert 'r503_command_seconds_bucket{instr="0x40",le="2.5"} 1\n' in text
+    assert 'r503_command_seconds_bucket{instr="0x40",le="5"} 2\n' in text
+    assert 'r503_command_seconds_count{instr="0x40"} 2\n' in text
+    assert 'r503_conf_codes_total{instr="0x40",code="9"} 1\n' in text
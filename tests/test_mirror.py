@@ -0,0 +1,67 @@
+import os
+
+from r503 import R503
+from r503_mirror import LibraryMirror
+from r503_sim import VirtualR503, SimSerial
+
+from conftest import enroll
+
+
+def test_read_index_table_error_codes(sim, fp):
+    enroll(sim, fp, 'alice', 1)
+    sim.checksum_errors = 1.0
+    assert fp.read_index_table(0) == 100
+    sim.checksum_errors = 0.0
+    sim.pw_verified = False  # the module answers every command with 21h
+    assert fp.read_index_table(0) == 0x21
+
+
+def test_sync_and_delete(sim, fp, tmp_path):
+    mirror = LibraryMirror(str(tmp_path))
+    for page_id, finger in enumerate(('a', 'b', 'c')):
+        enroll(sim, fp, finger, page_id)
+    assert mirror.sync(fp)['added'] == {0: 0, 1: 0, 2: 0}
+    assert fp.delete_char(1) == 0
+    result = mirror.sync(fp)
+    assert result == {'added': {}, 'deleted': [1]}
+    assert mirror.mirrored('SIM00001') == {0, 2}
+
+
+def test_sync_keeps_files_on_bad_index_table(sim, fp, tmp_path):
+    mirror = LibraryMirror(str(tmp_path))
+    for page_id, finger in enumerate(('a', 'b', 'c')):
+        enroll(sim, fp, finger, page_id)
+    mirror.sync(fp)
+    sim.checksum_errors = 1.0
+    assert mirror.sync(fp, serial='SIM00001') == 99
+    sim.checksum_errors = 0.0
+    sim.pw_verified = False
+    assert mirror.sync(fp, serial='SIM00001') == 99
+    assert mirror.mirrored('SIM00001') == {0, 1, 2}
+    assert len(os.listdir(mirror.path('SIM00001'))) == 3
+
+
+def test_clone_to_aborts_on_bad_index_table(sim, fp):
+    enroll(sim, fp, 'a', 0)
+    other = R503(port=SimSerial(VirtualR503(time_scale=0), timeout=.2))
+    sim.checksum_errors = 1.0
+    assert fp.clone_to(other) == 100
+
+
+def test_serial_number_is_hex_encoded(tmp_path):
+    sim = VirtualR503(time_scale=0, seed=1, serial_number='A/B C')
+    fp = R503(port=SimSerial(sim, timeout=.2))
+    enroll(sim, fp, 'a', 0)
+    mirror = LibraryMirror(str(tmp_path))
+    assert mirror.sync(fp)['added'] == {0: 0}
+    assert os.listdir(tmp_path) == ['A/B C'.encode().hex()]
+    assert mirror.mirrored('A/B C') == {0}
+
+
+def test_refresh_without_serial_number(sim, fp, tmp_path):
+    enroll(sim, fp, 'a', 0)
+    mirror = LibraryMirror(str(tmp_path))
+    sim.checksum_errors = 1.0
+    assert mirror.refresh(fp, [0]) == 99
+    sim.checksum_errors = 0.0
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,60 @@
+import pytest
+
+from r503_notepad import NotepadStore, decode, encode
+
+
+def test_roundtrip_and_partial_flush(sim, fp):
+    store = NotepadStore(fp)
+    assert store.loaded and len(store) == 0
+    store.update({'site': 'gate 3', 'relay_ms': 1500, 'ratio': .5, 'on': True, 'none': None, 'raw': b'\x01\x02'})
+    assert store.flush() == {0: 0, 1: 0, 2: 0}  # 68 bytes, the remaining pages stay empty
+    assert store.flush() == {}
+    assert dict(NotepadStore(fp).items()) == dict(store.items())
+
+
+def test_failed_load_does_not_overwrite(sim, fp):
+    store = NotepadStore(fp)
+    for n in range(8):
+        store[f'key{n}'] = n
+    store.flush()
+    sim.checksum_errors = 1.0
+    broken = NotepadStore(fp)
+    assert not broken.loaded
+    sim.checksum_errors = 0.0
+    broken['new'] = 1
+    with pytest.raises(RuntimeError):
+        broken.flush()
+    assert dict(NotepadStore(fp).items()) == {f'key{n}': n for n in range(8)}
+
+
+def test_reload_after_failure(sim, fp):
+    NotepadStore(fp).update({})
+    sim.pw_verified = False
+    store = NotepadStore(fp)
+    assert store.load() == 0x21 and not store.loaded
+    sim.pw_verified = True
+    assert store.load() == 0 and store.loaded
+
+
+def test_decode_rejects_damaged_store():
+    blob = bytearray(encode({'a': 1}))
+    assert decode(bytes(blob)) == {'a': 1}
+    assert decode(bytes(16)) == {}  # no store yet
+    blob[7] = 9  # type tag of 'a'
+    with pytest.raises(ValueError):
+        decode(bytes(blob))
+    with pytest.raises(ValueError):
+        decode(encode({'a': 'abc'})[:-1])
+
+
+def test_damaged_store_needs_reset(sim, fp):
+    blob = bytearray(encode({'a': 1}).ljust(32, b'\x00'))
+    blob[7] = 9
+    assert fp.write_notepad(0, bytes(blob)) == 0
+    with pytest.raises(ValueError):
+        NotepadStore(fp)
+    store = NotepadStore(fp, load=False)
+    store.reset()
+    store['b'] = 2
+    assert sorted(store.flush()) == list(range(16))
+    assert dict(NotepadStore(fp).items()) == {'b': 2}
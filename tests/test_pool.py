@@ -0,0 +1,54 @@
+import pytest
+
+from r503 import R503
+from r503_pool import R503Pool
+from r503_sim import VirtualR503, SimSerial
+
+
+@pytest.fixture
+def pool():
+    sims = [VirtualR503(time_scale=0, seed=n) for n in range(3)]
+    pool = R503Pool([R503(port=SimSerial(sim, timeout=.2)) for sim in sims], capacity=2)
+    pool.sims = sims
+    yield pool
+    pool.close()
+
+
+def enroll_finger(pool, finger, gid=None):
+    pool.sims[0].place_finger(finger)
+    template = pool.capture(0)
+    pool.sims[0].lift_finger()
+    return pool.enroll(template, gid)
+
+
+def test_enroll_fills_the_shards_in_order(pool):
+    assert pool.size() == 6
+    assert [enroll_finger(pool, f) for f in 'abc'] == [(0, 0), (0, 1), (0, 2)]
+    assert pool.to_local(2) == (1, 0)
+    assert pool.sims[1].library == {0: pool.sims[0].finger_template('c')}
+    assert enroll_finger(pool, 'z', gid=6) == (11, 6)
+
+
+def test_identify_searches_all_shards(pool):
+    for finger, gid in (('a', 1), ('b', 3), ('c', 5)):
+        assert enroll_finger(pool, finger, gid) == (0, gid)
+    for finger, gid in (('a', 1), ('b', 3), ('c', 5)):
+        pool.sims[0].place_finger(finger)
+        assert pool.identify(0) == (gid, 200)
+    pool.sims[0].place_finger('unknown')
+    assert pool.identify(0) is None
+    pool.sims[0].lift_finger()
+    assert pool.identify(0) == 2  # no finger: the capture fails
+
+
+def test_failed_shard_is_skipped(pool):
+    assert enroll_finger(pool, 'a', 0) == (0, 0)
+    assert enroll_finger(pool, 'c', 5) == (0, 5)
+    pool.sims[1].strict_address = True  # shard 1 stops answering
+    pool.sims[1].addr = 1
+    pool.sims[0].place_finger('c')
+    assert pool.identify(0) == (5, 200)
+    assert pool.free_location() == 1
+    assert enroll_finger(pool, 'b') == (0, 1)
+    assert pool.free_location() == 4  # shard 1 unknown, shard 2 has page 1 free
+    assert pool.delete([0, 2, 7]) == {0: 0, 2: 99, 7: 11}
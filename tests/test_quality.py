@@ -0,0 +1,55 @@
+import pytest
+
+from r503 import Prescreen, image_quality, unpack_image
+
+from conftest import enroll
+
+np = pytest.importorskip('numpy')
+
+
+def blur(pixels, rounds=6):
+    img = pixels.astype(float)
+    for _ in range(rounds):
+        img = (img + np.roll(img, 1, 0) + np.roll(img, -1, 0) + np.roll(img, 1, 1) + np.roll(img, -1, 1)) / 5
+    return img.astype(np.uint8)
+
+
+@pytest.fixture
+def finger(sim):
+    return unpack_image(sim.finger_image('alice'))
+
+
+def test_quality_metrics(finger):
+    good = image_quality(finger)
+    assert good['coverage'] > .5 and good['contrast'] > 50 and good['ridge_energy'] > .5
+    assert image_quality(np.full((192, 192), 240, np.uint8)) == {
+        'coverage': 0.0, 'contrast': 0.0, 'ridge_energy': 0.0, 'sharpness': 0.0}
+    assert image_quality(blur(finger))['sharpness'] < good['sharpness'] / 4
+
+
+def test_batch_metrics_match_single_images(finger):
+    images = np.stack([finger, blur(finger), np.full((192, 192), 240, np.uint8)])
+    batch = image_quality(images)
+    for i, img in enumerate(images):
+        single = image_quality(img)
+        assert all(np.isclose(batch[name][i], single[name]) for name in single)
+
+
+def test_prescreen_names_the_failing_metric(finger):
+    prescreen = Prescreen()
+    half = finger.copy()
+    half[:, :120] = 240  # finger only partly on the sensor
+    assert prescreen(finger)[:2] == (True, None)
+    assert prescreen(half)[:2] == (False, 'coverage')
+    assert prescreen(blur(finger))[:2] == (False, 'sharpness')
+    assert Prescreen(min_contrast=100)(finger)[:2] == (False, 'contrast')
+
+
+def test_identify_with_prescreen(sim, fp):
+    enroll(sim, fp, 'alice', 3)
+    sim.place_finger('alice')
+    result = fp.identify(prescreen=Prescreen())
+    assert (result.mode, result.conf_code, result.page_id) == ('manual', 0, 3)
+    assert 'prescreen' in result.timings
+    result = fp.identify(prescreen=Prescreen(min_coverage=.9))
+    assert (result.stage, result.conf_code) == ('prescreen', 0x07)
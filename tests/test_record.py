@@ -0,0 +1,34 @@
+from time import monotonic
+
+from r503 import R503
+from r503_record import RecordingSerial, ReplaySerial, read_recording, BAUD
+from r503_sim import VirtualR503, SimSerial
+
+
+def record(path):
+    sim = VirtualR503(time_scale=0, seed=1, strict_address=True)
+    fp = R503(port=SimSerial(sim, timeout=.2))
+    fp.ser = RecordingSerial(fp.ser, path)
+    assert fp.handshake() == 0
+    fp.ser.baudrate = 115200
+    fp.addr = b'\x00\x00\x00\x01'  # not the module's address: no reply, the read times out
+    assert fp.handshake() == 99
+    fp.ser_close()
+
+
+def test_recording_passes_settings_through(tmp_path):
+    path = str(tmp_path / 'rec.r503rec')
+    record(path)
+    bauds = [data for _, kind, data in read_recording(path) if kind == BAUD]
+    assert len(bauds) == 2 and bauds[1] == (115200).to_bytes(4, 'little')
+
+
+def test_replay_scales_the_timeout(tmp_path):
+    path = str(tmp_path / 'rec.r503rec')
+    record(path)
+    fp = R503(port=ReplaySerial(path, speed=.1, strict=True))
+    assert fp.handshake() == 0
+    fp.addr = b'\x00\x00\x00\x01'
+    t = monotonic()
+    assert fp.handshake() == 99
+    assert monotonic() - t < .5  # a tenth of the 1 s command timeout
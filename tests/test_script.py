@@ -0,0 +1,44 @@
+import io
+import json
+
+from r503 import parse_command, run_script
+
+
+def run(fp, script, **kwargs):
+    out = io.StringIO()
+    errors = run_script(fp, io.StringIO(script), out, **kwargs)
+    return errors, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_parse_command():
+    assert parse_command('delete_char 5 2') == ('delete_char', [5, 2], {})
+    assert parse_command('led_control ctrl=3 color=0x01') == ('led_control', [], {'ctrl': 3, 'color': 1})
+    assert parse_command('write_notepad 1 "a + b = c" page=2') == ('write_notepad', [1, 'a + b = c'], {'page': 2})
+    assert parse_command('write_notepad 1 =x 1=2') == ('write_notepad', [1, '=x', '1=2'], {})
+    assert parse_command('{"cmd": "read_notepad", "args": [3]}') == ('read_notepad', [3], {})
+    assert parse_command('  # comment') is None
+
+
+def test_run_script_non_json_results(fp):
+    errors, records = run(fp, 'handshake\nup_image_stream\nenable_metrics\nread_index_table 0\n')
+    assert errors == 0
+    assert [r['cmd'] for r in records] == ['handshake', 'up_image_stream', 'enable_metrics', 'read_index_table']
+    assert records[0]['result'] == 0
+    assert records[1]['result'].startswith('<generator')
+    assert isinstance(records[2]['result'], str)
+    assert records[3]['result'] == []
+
+
+def test_run_script_errors(fp):
+    errors, records = run(fp, 'no_such_command\nwrite_notepad 1 "x + 1 = 2"\nread_notepad 1\n_exchange 1\n')
+    assert errors == 2
+    assert 'error' in records[0] and 'error' in records[3]
+    assert records[1]['result'] == 0
+    assert records[2]['result'][1] == {'$bytes': b'x + 1 = 2'.ljust(32, b'\x00').hex()}
+    errors, records = run(fp, 'no_such_command\nhandshake\n', stop_on_error=True)
+    assert errors == 1 and len(records) == 1
+
+
+def test_default_output_is_stdout_at_call_time(fp, capsys):
+    assert run_script(fp, ['handshake']) == 0
+    assert json.loads(capsys.readouterr().out)['result'] == 0
@@ -0,0 +1,105 @@
+import threading
+
+from r503 import R503
+from r503_session import R503Session
+from r503_sim import VirtualR503, SimSerial
+
+
+class StrictR503(VirtualR503):
+    """
+    Virtual module counting commands that arrive while it waits for the data packets of a download
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.interleaved = 0
+
+    def _handle(self, packet, now):
+        if self.download is not None and packet[6] == 0x01:
+            self.interleaved += 1
+        super()._handle(packet, now)
+
+
+def run_threads(*targets):
+    errors = []
+
+    def wrap(target):
+        try:
+            target()
+        except Exception as e:  # reported by the test
+            errors.append(e)
+
+    threads = [threading.Thread(target=wrap, args=(t,)) for t in targets]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+    assert not errors, errors
+
+
+def test_downloads_are_not_interleaved():
+    sim = StrictR503(time_scale=0, seed=1)
+    fp = R503(port=SimSerial(sim, timeout=.2))
+    templates = [sim.finger_template(f) for f in ('a', 'b', 'c')]
+    results = []
+
+    def downloads():
+        for n in range(30):
+            data = templates[n % 3]
+            assert fp.down_char(data, buffer_id=2) == 0
+            results.append(b''.join(fp.up_char(buffer_id=2)) == data)
+
+    def queries():
+        for _ in range(100):
+            assert isinstance(fp.read_sys_para(), tuple)
+            assert fp.led_control(ctrl=3, color=1) == 0
+
+    with R503Session(fp):
+        run_threads(downloads, queries, queries)
+    assert sim.interleaved == 0
+    assert results == [True] * 30
+
+
+def test_restore_and_match_stream_in_threads():
+    sim = StrictR503(time_scale=0, seed=1)
+    fp = R503(port=SimSerial(sim, timeout=.2))
+    fingers = ['f%d' % n for n in range(10)]
+    frames = [(f, fp.data_frames(sim.finger_template(f))) for f in fingers]
+    matches = []
+
+    def restore():
+        assert fp.restore_library({n: sim.finger_template(f) for n, f in enumerate(fingers)}) == dict.fromkeys(
+            range(10), 0)
+
+    def match():
+        sim.place_finger('f3')
+        assert fp.get_img() == 0 and fp.img2tz(1) == 0
+        matches.extend(key for key, conf_code, _ in fp.match_stream(frames) if conf_code == 0)
+
+    with R503Session(fp):
+        run_threads(restore, match, lambda: [fp.check_sensor() for _ in range(50)])
+    assert sim.interleaved == 0
+    assert matches == ['f3']
+    assert fp.read_index_table(0) == list(range(10))
+
+
+def test_close_restores_previous_transport(fp):
+    def wrapper(send_values, instr_code, timeout):
+        return R503._exchange(fp, send_values, instr_code, timeout)
+
+    fp._exchange = wrapper
+    with R503Session(fp):
+        assert fp._exchange is not wrapper
+        assert fp.handshake() == 0
+    assert fp._exchange is wrapper
+    for name in ('_receive_stream', '_up_raw', '_write_data', '_transaction'):
+        assert name not in fp.__dict__
+    assert fp.handshake() == 0
+
+
+def test_auto_enroll_steps_in_session(sim, fp):
+    sim.place_finger('a')
+    with R503Session(fp):
+        assert fp.auto_enroll(5) == 0
+        assert fp.auto_enroll(6) == 0x27
+        assert fp.read_index_table(0) == [5]
@@ -0,0 +1,35 @@
+from conftest import enroll
+
+
+def test_handshake_and_sys_para(fp):
+    assert fp.handshake() == 0
+    para = fp.read_sys_para()
+    assert isinstance(para, tuple)
+    assert para[2] == 200
+
+
+def test_enroll_and_search(sim, fp):
+    enroll(sim, fp, 'alice', 3)
+    enroll(sim, fp, 'bob', 7)
+    sim.place_finger('bob')
+    assert fp.get_img() == 0
+    assert fp.img2tz(1) == 0
+    assert fp.search()[:2] == (0, 7)
+    assert fp.read_index_table(0) == [3, 7]
+
+
+def test_checksum_error_reply(sim, fp):
+    sim.checksum_errors = 1.0
+    assert fp.handshake() == 100
+
+
+def test_no_response(sim, fp):
+    sim.strict_address = True
+    sim.addr = 0x12345678
+    assert fp.handshake() == 99
+
+
+def test_search_with_empty_buffer(sim, fp):
+    assert fp.search_char(2)[0] == 0x09
+    enroll(sim, fp, 'alice', 0)
+    assert fp.search_char(2)[0] == 0x09
@@ -0,0 +1,37 @@
+import json
+import os
+
+from r503_store import TemplateStore
+
+KEYS = ('alice', '../x', 'a/b', 'Ünïcode key', '')
+
+
+def test_keys_stay_inside_the_store(sim, tmp_path):
+    root = tmp_path / 'store'
+    store = TemplateStore(str(root))
+    for n, key in enumerate(KEYS):
+        store.add(key, sim.finger_template(n), site='gate1')
+    assert sorted(os.listdir(tmp_path)) == ['store']
+    assert len(os.listdir(root)) == len(KEYS) + 1
+    loaded = TemplateStore(str(root))
+    assert loaded.templates == store.templates
+    store.remove('../x')
+    assert '../x' not in TemplateStore(str(root))
+    assert len(os.listdir(root)) == len(KEYS)
+
+
+def test_identify_defers_index_writes(sim, fp, tmp_path):
+    root = str(tmp_path)
+    with TemplateStore(root) as store:
+        for finger in ('a', 'b', 'c'):
+            store.add(finger, sim.finger_template(finger))
+        index = os.path.join(root, 'index.json')
+        os.utime(index, (0, 0))
+        sim.place_finger('b')
+        for _ in range(3):
+            result = store.identify(fp)
+            assert (result['conf_code'], result['key']) == (0, 'b')
+        assert store.candidates()[0] == 'b'
+        assert os.stat(index).st_mtime == 0  # written at most every save_interval seconds
+    with open(index) as f:
+        assert json.load(f)['b']['last_seen'] > 0
@@ -0,0 +1,33 @@
+from conftest import wire_fp, Wire
+
+
+def stream_reply(fp, data):
+    return fp.make_packet(0x07, b'\x00') + fp.data_frames(data)
+
+
+def test_up_image_into_buffer(sim, fp):
+    sim.place_finger('alice')
+    assert fp.get_img() == 0
+    buffer = bytearray(192 * 192 // 2)
+    assert fp.up_image_into(buffer) == (0, len(buffer))
+    assert bytes(buffer) == sim.image
+    assert b''.join(fp.up_image()) == sim.image
+
+
+def test_up_image_into_errors():
+    fp = wire_fp()
+    data = bytes(range(200)) * 2
+    fp.ser = Wire(stream_reply(fp, data))
+    buffer = bytearray(len(data))
+    assert fp.up_image_into(buffer) == (0, len(data))
+    assert buffer == data
+    fp.ser = Wire(stream_reply(fp, data))
+    assert fp.up_image_into(bytearray(100))[0] == 102  # buffer too small
+    fp.ser = Wire(stream_reply(fp, data)[:-5])
+    assert fp.up_image_into(bytearray(len(data)))[0] == 99  # end packet cut short
+    broken = bytearray(stream_reply(fp, data))
+    broken[20] ^= 1  # a data byte of the first data packet
+    fp.ser = Wire(bytes(broken))
+    assert fp.up_image_into(bytearray(len(data)))[0] == 100
+    fp.ser = Wire(fp.make_packet(0x07, b'\x0f'))
+    assert fp.up_image_into(bytearray(len(data))) == (0x0f, 0)